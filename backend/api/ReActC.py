@@ -6,7 +6,7 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough
 
-from api.config_llm import groq_llm, create_retrieval_chain
+from api.config_llm import get_llm, create_retrieval_chain
 from api.memory import with_memory
 from api.rag_loader import load_rag_for_topic
 from api.prompt_templates import legal_chat_prompt, render_chat_history
@@ -89,7 +89,7 @@ def build_legal_agent(topic_name: str):
             )
 
             # Llamada al modelo
-            llm_resp = groq_llm.invoke(rendered_prompt)
+            llm_resp = get_llm().invoke(rendered_prompt)
             return llm_resp.content if hasattr(llm_resp, "content") else str(llm_resp)
 
  
@@ -0,0 +1,205 @@
+# backend/api/answer_cache.py
+
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from api.rag_loader import get_embeddings, topic_version
+from api.topics import key_includes
+
+
+# CACHÉ SEMÁNTICA DE RESPUESTAS
+# Preguntas casi idénticas sobre el mismo tema ("obligaciones del empleador"
+# vs "¿cuáles son las obligaciones del empleador?") reutilizan la respuesta
+# anterior sin recuperar documentos ni llamar al LLM.
+
+ENABLED = os.getenv("ASSISTLEG_ANSWER_CACHE", "1") != "0"
+SIMILARITY_THRESHOLD = float(os.getenv("ASSISTLEG_ANSWER_CACHE_THRESHOLD", "0.92"))
+TTL_S = int(os.getenv("ASSISTLEG_ANSWER_CACHE_TTL", "86400"))
+MAX_ENTRIES_PER_TOPIC = int(os.getenv("ASSISTLEG_ANSWER_CACHE_SIZE", "500"))
+
+# Preguntas que dependen de la conversación no se pueden reutilizar entre usuarios
+_FOLLOW_UP = re.compile(
+    r"\b(anterior|anteriormente|acabas|mencionaste|dijiste|explicaste|"
+    r"resume|resumir|resumen|eso|nuevamente|de nuevo)\b"
+)
+# Números de norma, artículo, año... y títulos/capítulos en romanos: dos
+# preguntas casi idénticas sobre la Ley 100 y la Ley 50 no son la misma
+_IDENTIFIERS = re.compile(r"\d+(?:[.-]\d+)*|(?<=t[ií]tulo )[ivxlc]+\b|(?<=cap[ií]tulo )[ivxlc]+\b")
+
+
+def normalize_question(question: str) -> str:
+    """Minúsculas, sin signos de puntuación y con espacios colapsados."""
+    text = unicodedata.normalize("NFC", question or "").lower()
+    text = re.sub(r"[¿?¡!.,;:\"'()]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def identifiers(normalized: str) -> List[str]:
+    """Identificadores de una pregunta normalizada, en orden."""
+    return _IDENTIFIERS.findall(normalized)
+
+
+def is_cacheable(question: str) -> bool:
+    """Solo se cachean preguntas autocontenidas (no seguimientos de la charla)."""
+    normalized = normalize_question(question)
+    return bool(normalized) and not _FOLLOW_UP.search(normalized)
+
+
+class _TopicCache:
+    def __init__(self, version=None):
+        self.version = version         # versión del índice con la que se respondió
+        self.entries = OrderedDict()   # pregunta normalizada -> (vector, answer, created)
+        self.matrix = None             # vectores apilados (se recalcula si cambia)
+        self.keys: List[str] = []
+
+
+class SemanticAnswerCache:
+    """
+    Caché por tema de (pregunta → respuesta). Una consulta acierta si existe
+    la misma pregunta normalizada o una con similitud coseno >= threshold.
+    Expulsión LRU por tema y caducidad por TTL. Las respuestas de un tema
+    valen para una versión de su índice: si se publica otra (en este proceso
+    o en cualquier otro), la siguiente consulta descarta las anteriores.
+    """
+
+    def __init__(self, threshold: float = SIMILARITY_THRESHOLD, ttl_s: int = TTL_S,
+                 max_entries: int = MAX_ENTRIES_PER_TOPIC, embed=None, version_of=None):
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._embed = embed
+        self._version_of = version_of or topic_version
+        self._topics: Dict[str, _TopicCache] = {}
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._exact_hits = 0
+        self._misses = 0
+        self._stores = 0
+        self._invalidations = 0
+        self._stale_versions = 0
+
+    def _embed_question(self, normalized: str) -> np.ndarray:
+        embed = self._embed or get_embeddings().embed_query
+        vector = np.asarray(embed(normalized), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _current(self, topic: str, version) -> Optional[_TopicCache]:
+        """Caché del tema si es de la versión vigente; si no, se descarta. Con el lock."""
+        cache = self._topics.get(topic)
+        if cache is not None and cache.version != version:
+            del self._topics[topic]
+            self._stale_versions += 1
+            return None
+        return cache
+
+    def _expire(self, cache: _TopicCache, now: float):
+        expired = [k for k, (_, _, created) in cache.entries.items() if now - created > self.ttl_s]
+        for key in expired:
+            del cache.entries[key]
+        if expired:
+            cache.matrix = None
+
+    def lookup(self, topic: str, question: str) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        Devuelve (respuesta, vector). En un fallo la respuesta es None y el
+        vector se puede pasar a store() para no volver a calcular el embedding.
+        """
+        normalized = normalize_question(question)
+        now = time.monotonic()
+        version = self._version_of(topic)
+
+        # 1) Misma pregunta normalizada: sin embedding
+        with self._lock:
+            cache = self._current(topic, version)
+            if cache is not None:
+                self._expire(cache, now)
+                entry = cache.entries.get(normalized)
+                if entry is not None:
+                    cache.entries.move_to_end(normalized)
+                    self._hits += 1
+                    self._exact_hits += 1
+                    return entry[1], entry[0]
+
+        # 2) Pregunta parecida: similitud coseno contra las anteriores
+        vector = self._embed_question(normalized)
+
+        with self._lock:
+            cache = self._current(topic, version)
+            if cache is None or not cache.entries:
+                self._misses += 1
+                return None, vector
+
+            if cache.matrix is None:
+                cache.keys = list(cache.entries)
+                cache.matrix = np.stack([cache.entries[k][0] for k in cache.keys])
+
+            # La más parecida que además cite los mismos identificadores
+            scores = cache.matrix @ vector
+            wanted = identifiers(normalized)
+            for best in np.argsort(-scores):
+                if scores[best] < self.threshold:
+                    break
+                key = cache.keys[best]
+                if key in cache.entries and identifiers(key) == wanted:
+                    cache.entries.move_to_end(key)
+                    self._hits += 1
+                    return cache.entries[key][1], vector
+
+            self._misses += 1
+            return None, vector
+
+    def store(self, topic: str, question: str, answer: str, vector: Optional[np.ndarray] = None):
+        normalized = normalize_question(question)
+        if vector is None:
+            vector = self._embed_question(normalized)
+        version = self._version_of(topic)
+
+        with self._lock:
+            cache = self._current(topic, version)
+            if cache is None:
+                cache = self._topics[topic] = _TopicCache(version)
+            cache.entries.pop(normalized, None)
+            cache.entries[normalized] = (vector, answer, time.monotonic())
+            while len(cache.entries) > self.max_entries:
+                cache.entries.popitem(last=False)
+            cache.matrix = None
+            self._stores += 1
+
+    def invalidate(self, topic: Optional[str] = None):
+        """Vacía la caché de un tema (o de todos) tras reconstruir su vectorstore."""
+        with self._lock:
+            if topic:
+                # También las preguntas multi-tema que incluían ese tema
+                for key in [k for k in self._topics if key_includes(k, topic)]:
+                    del self._topics[key]
+            else:
+                self._topics.clear()
+            self._invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "enabled": ENABLED,
+                "threshold": self.threshold,
+                "entries": {t: len(c.entries) for t, c in self._topics.items()},
+                "hits": self._hits,
+                "exact_hits": self._exact_hits,
+                "misses": self._misses,
+                "hit_rate": (self._hits / total) if total else 0.0,
+                "stores": self._stores,
+                "invalidations": self._invalidations,
+                "stale_versions": self._stale_versions,
+            }
+
+
+answer_cache = SemanticAnswerCache()
@@ -0,0 +1,252 @@
+# backend/api/batch.py
+
+import contextvars
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Tuple
+
+from api.answer_cache import ENABLED as ANSWER_CACHE_ENABLED, is_cacheable, normalize_question
+from api.executors import EMBEDDING_MAX_WORKERS, embedding_executor
+from api.rag_loader import get_embeddings, load_rag_for_topic, request_topic_key, unknown_topic_message
+from api.react_agent import generate_standalone, retrieve_standalone
+from api.tracing import metrics
+
+logger = logging.getLogger(__name__)
+
+
+# LOTES DE PREGUNTAS
+# Cientos de (tema, pregunta) en una sola petición o desde la consola:
+#   1. se validan y se quitan los repetidos (mismo tema y misma pregunta
+#      normalizada: una sola recuperación y una sola llamada al LLM);
+#   2. todas las preguntas se embeben en una llamada al modelo (quedan en
+#      la caché de embeddings que usan la caché semántica y la búsqueda);
+#   3. las recuperaciones corren en paralelo en el pool de embeddings, sin
+#      ocupar más de la mitad de sus hilos (las preguntas de los usuarios
+#      no esperan detrás del lote);
+#   4. cada pregunta recuperada pasa al LLM, con a lo sumo
+#      ASSISTLEG_BATCH_LLM_CONCURRENCY llamadas en vuelo (la pasarela del LLM
+#      aplica además la cuota de Groq);
+#   5. los resultados salen en cuanto están, uno por línea (JSONL), con su
+#      estado; al final, una línea {"summary": ...}.
+# Sin memoria: cada pregunta es independiente y no toca el historial de
+# ninguna sesión.
+
+BATCH_MAX_ITEMS = int(os.getenv("ASSISTLEG_BATCH_MAX_ITEMS", "500"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("ASSISTLEG_BATCH_LLM_CONCURRENCY", "4"))
+BATCH_RETRIEVAL_PARALLELISM = max(1, EMBEDDING_MAX_WORKERS // 2)
+
+
+class BatchError(ValueError):
+    """El lote en sí no es válido (no una pregunta concreta)."""
+
+
+class BatchItem(NamedTuple):
+    index: int
+    id: Any
+    topic: str
+    question: str
+
+
+def parse_items(raw_items: Any, max_items: int = BATCH_MAX_ITEMS) -> Tuple[List[BatchItem], List[Dict[str, Any]]]:
+    """
+    Valida los elementos {"id"?, "topic" | "topics", "question"}. Devuelve
+    (válidos, resultados de error de los inválidos).
+    """
+    if not isinstance(raw_items, list) or not raw_items:
+        raise BatchError("Se esperaba una lista no vacía de preguntas")
+    if len(raw_items) > max_items:
+        raise BatchError(f"Demasiadas preguntas en el lote ({len(raw_items)} > {max_items})")
+
+    items, invalid = [], []
+    for index, raw in enumerate(raw_items):
+        if not isinstance(raw, dict):
+            invalid.append(_error_result(index, index, None, None, "Elemento inválido: se esperaba un objeto"))
+            continue
+        item_id = raw.get("id", index)
+        question = raw.get("question")
+        if not isinstance(question, str) or not question.strip():
+            invalid.append(_error_result(index, item_id, raw.get("topic"), question, "Falta la pregunta"))
+            continue
+        topic = request_topic_key(raw)
+        if topic is None:
+            invalid.append(_error_result(index, item_id, raw.get("topic"), question, unknown_topic_message(raw)))
+            continue
+        items.append(BatchItem(index, item_id, topic, question.strip()))
+    return items, invalid
+
+
+def _error_result(index, item_id, topic, question, error: str) -> Dict[str, Any]:
+    return {"index": index, "id": item_id, "topic": topic, "question": question, "status": "error", "error": error}
+
+
+class _Group:
+    """Preguntas repetidas del lote: se responden una vez."""
+
+    __slots__ = ("topic", "question", "items", "start")
+
+    def __init__(self, topic: str, question: str):
+        self.topic = topic
+        self.question = question
+        self.items: List[BatchItem] = []
+        self.start = 0.0
+
+
+def group_items(items: Iterable[BatchItem]) -> List[_Group]:
+    groups: "OrderedDict[Tuple[str, str], _Group]" = OrderedDict()
+    for item in items:
+        key = (item.topic, normalize_question(item.question))
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = _Group(item.topic, item.question)
+        group.items.append(item)
+    return list(groups.values())
+
+
+class BatchRunner:
+    """Ejecuta un lote y entrega los resultados a medida que terminan."""
+
+    def __init__(self, llm_concurrency: int = BATCH_LLM_CONCURRENCY):
+        self.llm_concurrency = max(1, llm_concurrency)
+
+    # Pasos
+
+    @staticmethod
+    def _prime_embeddings(groups: List[_Group]):
+        """Un solo lote al modelo para todas las preguntas (búsqueda y caché semántica)."""
+        texts = []
+        for group in groups:
+            texts.append(group.question)
+            if ANSWER_CACHE_ENABLED and is_cacheable(group.question):
+                # La caché semántica embebe la pregunta normalizada
+                texts.append(normalize_question(group.question))
+        embeddings = get_embeddings()
+        if texts and hasattr(embeddings, "embed_queries"):
+            try:
+                embeddings.embed_queries(texts)
+            except Exception:
+                # Cada búsqueda embeberá su pregunta por separado
+                logger.exception("Error embebiendo el lote de preguntas")
+
+    def _results(self, group: _Group, **fields) -> List[Dict[str, Any]]:
+        elapsed_ms = round((time.perf_counter() - group.start) * 1000, 1)
+        results = []
+        for position, item in enumerate(group.items):
+            results.append({
+                "index": item.index,
+                "id": item.id,
+                "topic": item.topic,
+                "question": item.question,
+                **fields,
+                "deduplicated": position > 0,
+                "elapsed_ms": elapsed_ms,
+            })
+        return results
+
+    # Ejecución
+
+    def run(self, items: List[BatchItem], invalid: List[Dict[str, Any]] = ()) -> Iterator[Dict[str, Any]]:
+        """
+        Genera un resultado por pregunta (primero los inválidos, luego en
+        orden de finalización) y al final {"summary": ...}.
+        """
+        start = time.perf_counter()
+        counts = {"items": len(items) + len(invalid), "ok": 0, "error": 0, "cached": 0}
+
+        for result in invalid:
+            counts["error"] += 1
+            yield result
+
+        groups = group_items(items)
+        results: "queue.Queue[List[Dict[str, Any]]]" = queue.Queue()
+        cancelled = threading.Event()
+        retrieval_slots = threading.BoundedSemaphore(BATCH_RETRIEVAL_PARALLELISM)
+        llm_pool = ThreadPoolExecutor(max_workers=self.llm_concurrency, thread_name_prefix="assistleg-batch-llm")
+        # Un retriever por tema, no uno por pregunta
+        retrievers: Dict[str, Any] = {}
+
+        def fail(group: _Group, exc: BaseException):
+            logger.warning("Pregunta del lote fallida (%s): %r", group.topic, exc)
+            results.put(self._results(group, status="error", error=f"{type(exc).__name__}: {exc}"))
+
+        def generate(group: _Group, docs: List[Any], vector: Any):
+            if cancelled.is_set():
+                return
+            try:
+                answer, usage = generate_standalone(group.topic, group.question, docs, vector)
+            except Exception as exc:
+                fail(group, exc)
+                return
+            results.put(self._results(group, status="ok", answer=answer, cached=False,
+                                      documents=len(docs), usage=usage))
+
+        def retrieve(group: _Group):
+            try:
+                if cancelled.is_set():
+                    return
+                group.start = time.perf_counter()
+                cached, vector, docs = retrieve_standalone(group.topic, group.question, retrievers[group.topic])
+            except Exception as exc:
+                fail(group, exc)
+                return
+            finally:
+                retrieval_slots.release()
+            if cached is not None:
+                results.put(self._results(group, status="ok", answer=cached, cached=True, documents=0))
+                return
+            llm_pool.submit(contextvars.copy_context().run, generate, group, docs, vector)
+
+        try:
+            for group in groups:
+                if group.topic not in retrievers:
+                    try:
+                        retrievers[group.topic] = load_rag_for_topic(group.topic)
+                    except Exception as exc:
+                        retrievers[group.topic] = None
+                        logger.warning("No se pudo cargar el tema %s: %r", group.topic, exc)
+
+            self._prime_embeddings(groups)
+
+            def feed():
+                for group in groups:
+                    group.start = time.perf_counter()
+                    if retrievers[group.topic] is None:
+                        fail(group, FileNotFoundError(f"Tema no disponible: {group.topic}"))
+                        continue
+                    retrieval_slots.acquire()
+                    if cancelled.is_set():
+                        return
+                    embedding_executor.submit(contextvars.copy_context().run, retrieve, group)
+
+            threading.Thread(target=contextvars.copy_context().run, args=(feed,),
+                             name="assistleg-batch-feeder", daemon=True).start()
+
+            for _ in range(len(groups)):
+                for result in results.get():
+                    counts[result["status"]] += 1
+                    counts["cached"] += int(bool(result.get("cached")))
+                    yield result
+        finally:
+            # Cliente desconectado: lo pendiente no llega al LLM
+            cancelled.set()
+            llm_pool.shutdown(wait=False, cancel_futures=True)
+
+        metrics.inc("assistleg_batch_items_total", {"status": "ok"}, counts["ok"])
+        metrics.inc("assistleg_batch_items_total", {"status": "error"}, counts["error"])
+        yield {"summary": {
+            **counts,
+            "unique": len(groups),
+            "deduplicated": len(items) - len(groups),
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+        }}
+
+
+def run_batch(raw_items: Any, llm_concurrency: int = BATCH_LLM_CONCURRENCY,
+              max_items: int = BATCH_MAX_ITEMS) -> Iterator[Dict[str, Any]]:
+    """Valida el lote (BatchError si no es válido) y devuelve el generador de resultados."""
+    items, invalid = parse_items(raw_items, max_items)
+    return BatchRunner(llm_concurrency).run(items, invalid)
@@ -1,54 +1,245 @@
 # backend/api/config_llm.py
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
 # 1. Cargar variables del .env
 env_path = os.path.join(os.path.dirname(__file__), "../backend/.env")
-print("Buscando .env en:", os.path.abspath(env_path))
 load_dotenv(env_path)
 
 groq_api = os.getenv("GROQ_API_KEY")
-print(f"Groq Key cargada: {'OK' if groq_api else 'NO'}")
 
-# 2. Imports principales
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader, WebBaseLoader
-from langchain_community.vectorstores import Chroma
-
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
+# 2. Imports perezosos
+# Este módulo está en el camino de cada worker (api.views → react_agent):
+# los loaders, el splitter y Chroma son de la ingestión (create_vectorstores.py)
+# y el SDK de Groq se importa al crear el modelo, no al arrancar.
+# benchmarks/import_time.py falla si vuelven a cargarse al importar api.views.
 
 # 3. Modelo Groq
-from langchain_groq import ChatGroq
+GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
+# Modelo de respaldo (cuota propia en Groq) si el principal falla o se
+# limita; sin respaldo salvo que se configure (p. ej. llama-3.3-70b-versatile)
+GROQ_FALLBACK_MODEL = os.getenv("GROQ_FALLBACK_MODEL", "")
+GROQ_TEMPERATURE = 0.2
+
+HEALTH_CHECK_PROMPT = "Hola Groq, ¿me escuchas?"
+
+
+# Proveedor activo:
+#   "groq"   (por defecto)
+#   "fake"   LLM local para pruebas de carga (latencia, fallos: ver api/fake_llm.py)
+#   "record" Groq, grabando cada respuesta; "replay" responde desde las
+#            grabaciones, sin red (ver api/llm_replay.py)
+LLM_PROVIDER = os.getenv("ASSISTLEG_LLM_PROVIDER", "groq")
+FAKE_LLM_LATENCY_S = float(os.getenv("ASSISTLEG_FAKE_LLM_LATENCY", "0.5"))
+FAKE_LLM_LATENCY_DIST = os.getenv("ASSISTLEG_FAKE_LLM_LATENCY_DIST", "fixed")
+FAKE_LLM_JITTER = float(os.getenv("ASSISTLEG_FAKE_LLM_JITTER", "0.5"))
+FAKE_LLM_FAILURE_RATE = float(os.getenv("ASSISTLEG_FAKE_LLM_FAILURE_RATE", "0"))
+FAKE_LLM_SEED = int(os.getenv("ASSISTLEG_FAKE_LLM_SEED", "0"))
+# Reintentos, cuota, breaker y respaldo (ver api/llm_gateway.py); 0 = modelo directo
+LLM_GATEWAY = os.getenv("ASSISTLEG_LLM_GATEWAY", "1") != "0"
+
+
+# 4. Proveedor perezoso del LLM
+class LLMProvider:
+    """
+    Crea el modelo la primera vez que se necesita (no al importar el módulo)
+    y lo comparte entre hilos. Importar este módulo no hace ninguna llamada
+    de red; la comprobación de conexión es explícita mediante health_check().
+
+    El modelo se envuelve en la pasarela resiliente (api/llm_gateway.py). Los
+    proveedores con `quota = True` llaman a un servicio con límites y además
+    respetan su cuota de peticiones/tokens por minuto y el tope de llamadas
+    en vuelo.
+    """
+
+    name = "base"
+    quota = False
+
+    def __init__(self, model: str):
+        self.model = model
+        self._llm = None
+        self._lock = threading.Lock()
+
+    def _build(self):
+        raise NotImplementedError
+
+    def _build_fallback(self):
+        """(nombre, modelo) de respaldo, o None."""
+        return None
 
-# 4. Intentar conectar con Groq
-try:
-    groq_llm = ChatGroq(
-        model="llama-3.1-8b-instant",
+    def _wrap(self, llm):
+        if not LLM_GATEWAY:
+            return llm
+        from api import llm_gateway as gw
+
+        fallback_name, fallback = self._build_fallback() or ("", None)
+        return gw.ResilientChatModel(
+            primary=llm,
+            primary_name=self.model,
+            fallback=fallback,
+            fallback_name=fallback_name,
+            rpm=gw.LLM_RPM if self.quota else 0,
+            tpm=gw.LLM_TPM if self.quota else 0,
+            max_concurrency=gw.LLM_MAX_CONCURRENCY if self.quota else 0,
+        )
+
+    def get(self):
+        if self._llm is None:
+            with self._lock:
+                if self._llm is None:
+                    self._llm = self._wrap(self._build())
+        return self._llm
+
+    def stats(self) -> dict:
+        """Contadores de la pasarela (sin crear el modelo si aún no existe)."""
+        info = {"provider": self.name, "model": self.model, "gateway": LLM_GATEWAY, "loaded": self._llm is not None}
+        if hasattr(self._llm, "stats"):
+            info.update(self._llm.stats())
+        return info
+
+    def health_check(self, prompt: str = HEALTH_CHECK_PROMPT) -> dict:
+        """Hace una llamada real al modelo y devuelve el resultado y la latencia."""
+        result = {"provider": self.name, "model": self.model, "api_key_loaded": bool(groq_api)}
+        start = time.perf_counter()
+        try:
+            resp = self.get().invoke(prompt)
+        except Exception as e:
+            result.update(ok=False, error=repr(e))
+        else:
+            result.update(ok=True, response=getattr(resp, "content", str(resp)))
+
+        result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return result
+
+
+def build_groq_chat(model: str, temperature: float = GROQ_TEMPERATURE):
+    """
+    ChatGroq sobre el pool HTTP compartido. Sin reintentos propios: los hace
+    la pasarela, que además sabe cambiar de modelo.
+    """
+    from langchain_groq import ChatGroq
+
+    from api.llm_gateway import LLM_TIMEOUT_S, shared_http_clients
+
+    http_client, http_async_client = shared_http_clients()
+    return ChatGroq(
+        model=model,
         api_key=groq_api,
-        temperature=0.2
+        temperature=temperature,
+        max_retries=0,
+        request_timeout=LLM_TIMEOUT_S,
+        http_client=http_client,
+        http_async_client=http_async_client,
     )
 
-    resp = groq_llm.invoke("Hola Groq, ¿me escuchas?")
-    print("Groq responde:", resp.content)
-    print("Paso 1 completado correctamente: Conexión establecida con Groq.")
 
-except Exception as e:
-    print("Error al conectar con Groq:", e)
+class GroqProvider(LLMProvider):
+
+    name = "groq"
+    quota = True
+
+    def __init__(self, model: str = GROQ_MODEL, temperature: float = GROQ_TEMPERATURE,
+                 fallback_model: str = GROQ_FALLBACK_MODEL):
+        super().__init__(model)
+        self.temperature = temperature
+        self.fallback_model = fallback_model if fallback_model != model else ""
+
+    def _build(self):
+        return build_groq_chat(self.model, self.temperature)
+
+    def _build_fallback(self):
+        if not self.fallback_model:
+            return None
+        return self.fallback_model, build_groq_chat(self.fallback_model, self.temperature)
+
+
+class FakeProvider(LLMProvider):
+    """LLM local sin red (ver api/fake_llm.py), para pruebas de carga."""
+
+    name = "fake"
+
+    def __init__(self, latency_s: float = FAKE_LLM_LATENCY_S, latency_dist: str = FAKE_LLM_LATENCY_DIST,
+                 jitter: float = FAKE_LLM_JITTER, failure_rate: float = FAKE_LLM_FAILURE_RATE,
+                 seed: int = FAKE_LLM_SEED):
+        super().__init__("assistleg-fake")
+        self.latency_s = latency_s
+        self.latency_dist = latency_dist
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.seed = seed
+
+    def _build(self):
+        from api.fake_llm import FakeChatModel
+        return FakeChatModel(latency_s=self.latency_s, latency_dist=self.latency_dist, jitter=self.jitter,
+                             failure_rate=self.failure_rate, seed=self.seed)
+
+
+class RecordProvider(LLMProvider):
+    """Groq, guardando cada respuesta para reproducirla luego con "replay"."""
+
+    name = "record"
+    quota = True
+
+    def __init__(self, model: str = GROQ_MODEL):
+        super().__init__(model)
+
+    def _build(self):
+        from api.llm_replay import REPLAY_DIR, RecordingStore, RecordReplayChatModel
+        return RecordReplayChatModel(mode="record", model_name=self.model,
+                                     store=RecordingStore(REPLAY_DIR), upstream=build_groq_chat(self.model))
+
+
+class ReplayProvider(LLMProvider):
+    """Respuestas grabadas con "record" (mismo modelo), sin red."""
+
+    name = "replay"
+
+    def __init__(self, model: str = GROQ_MODEL):
+        super().__init__(model)
+
+    def _build(self):
+        from api.llm_replay import REPLAY_DIR, REPLAY_MISS, RecordingStore, RecordReplayChatModel
+        fallback = FakeProvider()._build() if REPLAY_MISS == "fake" else None
+        return RecordReplayChatModel(mode="replay", model_name=self.model,
+                                     store=RecordingStore(REPLAY_DIR), upstream=fallback)
+
+
+PROVIDERS = {
+    "groq": GroqProvider,
+    "fake": FakeProvider,
+    "record": RecordProvider,
+    "replay": ReplayProvider,
+}
+
+llm_provider = PROVIDERS[LLM_PROVIDER]()
+
+
+def get_llm():
+    """Devuelve el LLM compartido (se crea en el primer uso)."""
+    return llm_provider.get()
+
+
+def __getattr__(name):
+    # Compatibilidad: `from api.config_llm import groq_llm` sigue funcionando,
+    # pero el cliente se crea solo cuando alguien lo importa de verdad.
+    if name == "groq_llm":
+        return get_llm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # 5. Prompt de RAG
-prompt = ChatPromptTemplate.from_template("""
+RAG_PROMPT_TEMPLATE = """
 Usa SOLO el siguiente contexto para responder:
 
 {context}
 
 Pregunta: {question}
-""")
+"""
 
 
-# 🔧 ***ARREGLADO AQUÍ***  
+# 🔧 ***ARREGLADO AQUÍ***
 def create_retrieval_chain(retriever):
     """
     Ahora acepta un retriever directamente.
@@ -56,13 +247,17 @@ def create_retrieval_chain(retriever):
     porque eso daba error.
     """
 
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain_core.runnables import RunnablePassthrough
+
     chain = (
         {
             "context": retriever,
             "question": RunnablePassthrough(),
         }
-        | prompt
-        | groq_llm
+        | ChatPromptTemplate.from_template(RAG_PROMPT_TEMPLATE)
+        | get_llm()
         | StrOutputParser()
     )
 
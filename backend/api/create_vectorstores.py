@@ -1,95 +1,427 @@
-# backend/api/create_vectorstore.py
+# backend/api/create_vectorstores.py
+#
+# Ingestión de documentos normativos en los vectorstores de cada tema.
+#
+#   python manage.py ingest                      # todas las carpetas de rags/
+#   python manage.py ingest reglamentos --full   # una carpeta, reconstrucción completa
+#
+# Cada carpeta backend/rags/<tema>/ (con todos sus PDF y TXT) se indexa en
+# una versión nueva de backend/vectorstores/<tema>_vs/ que se publica al
+# terminar (api/vectorstore_versions.py). Las páginas se extraen en un pool
+# de procesos, cada documento se divide por artículos y sus embeddings se
+# calculan por lotes y se escriben en Chroma a medida que se completa.
+# Un manifiesto con el hash de cada archivo permite que las siguientes
+# ejecuciones solo re-embeban los documentos que cambiaron.
+# Al final se exporta la instantánea mapeable del índice vectorial
+# (api/vector_snapshot.py) que leen los workers con
+# ASSISTLEG_VECTOR_ENGINE=numpy.
 
+import argparse
+import hashlib
+import json
+import logging
 import os
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Chroma
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
 
 
 # CONFIGURACIÓN GENERAL
 
-RAGS_PATH = "backend/rags"
-VECTORSTORES_PATH = "backend/vectorstores"
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+RAGS_PATH = BACKEND_DIR / "rags"
+VECTORSTORES_PATH = BACKEND_DIR / "vectorstores"
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
 
-FOLDER_TO_PROCESS = "reglamentos"   # NombreCarpeta
+SUPPORTED_EXTENSIONS = (".pdf", ".txt")
+MANIFEST_NAME = "ingest_manifest.json"
+
+# Páginas de PDF por tarea del pool (un PDF grande se reparte entre procesos)
+PAGES_PER_TASK = 25
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+SPLITTERS = ("legal", "recursive")
+DEFAULT_SPLITTER = os.getenv("ASSISTLEG_SPLITTER", "legal")
+
 
-# Crear carpeta donde van todas las bases vectoriales
-os.makedirs(VECTORSTORES_PATH, exist_ok=True)
+# TRABAJO EN LOS PROCESOS DEL POOL
+# (funciones de módulo para que se puedan serializar con pickle)
 
-embedding_model = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
-)
+def _parse_pdf_range(path, start, end):
+    """Extrae el texto de las páginas [start, end) de un PDF: [(página, texto)]."""
+    from pypdf import PdfReader
 
+    reader = PdfReader(path)
+    pages = []
+    for number in range(start, min(end, len(reader.pages))):
+        text = reader.pages[number].extract_text() or ""
+        if text.strip():
+            pages.append((number, text))
+    return pages
 
-# PROCESAR UNA SOLA CARPETA (1 PDF)
 
-def process_folder(folder_name):
-    folder_path = os.path.join(RAGS_PATH, folder_name)
+def _parse_txt(path):
+    with open(path, encoding="utf-8", errors="replace") as f:
+        text = f.read()
+    return [(None, text)] if text.strip() else []
 
-    if not os.path.isdir(folder_path):
-        print(f"La carpeta '{folder_name}' no existe en backend/rags/")
-        return
 
-    print(f"\n Procesando carpeta: {folder_name}")
+# DIVISIÓN EN FRAGMENTOS
+# "legal": un fragmento por artículo con título/capítulo/artículo en los
+# metadatos (api/legal_splitter.py); si el documento no tiene artículos
+# reconocibles, o con "recursive", ventanas de CHUNK_SIZE caracteres.
 
-    # Buscar PDF dentro de la carpeta
-    pdf_files = [
-        f for f in os.listdir(folder_path)
-        if f.lower().endswith(".pdf")
-    ]
+def splitter_id(splitter: str) -> str:
+    """Identificador que se guarda en el manifiesto: si cambia, se re-indexa."""
+    if splitter == "legal":
+        from api.legal_splitter import SPLITTER_VERSION
 
-    if not pdf_files:
-        print(f"No hay PDFs dentro de {folder_path}")
-        return
+        return SPLITTER_VERSION
+    return f"recursive-{CHUNK_SIZE}-{CHUNK_OVERLAP}"
 
-    # Procesamos el PRIMER PDF encontrado
-    pdf_path = os.path.join(folder_path, pdf_files[0])
-    print(f"PDF detectado: {pdf_path}")
 
-    # 1. Cargar PDF
-    loader = PyPDFLoader(pdf_path)
-    documents = loader.load()
-    print(f"   Total páginas: {len(documents)}")
+def _split_recursive(pages, base_metadata):
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
 
-    # 2. Split
     splitter = RecursiveCharacterTextSplitter(
         chunk_size=CHUNK_SIZE,
         chunk_overlap=CHUNK_OVERLAP
     )
+    chunks = []
+    for page, text in pages:
+        metadata = dict(base_metadata) if page is None else {**base_metadata, "page": page}
+        for piece in splitter.split_text(text):
+            chunks.append((piece, dict(metadata)))
+    return chunks
+
+
+def split_document(pages, base_metadata, splitter=DEFAULT_SPLITTER):
+    """[(página, texto)] de un documento → [(texto, metadata)]."""
+    if splitter == "legal":
+        from api.legal_splitter import split_legal_document
+
+        chunks = split_legal_document(pages, base_metadata)
+        if chunks:
+            return chunks
+    return _split_recursive(pages, base_metadata)
+
+
+# UTILIDADES
+
+def file_sha256(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
 
-    splits = splitter.split_documents(documents)
-    print(f"   Chunks generados: {len(splits)}")
 
-    # 3. Crear carpeta única para esta base vectorial
-    persist_path = os.path.join(VECTORSTORES_PATH, f"{folder_name}_vs")
-    os.makedirs(persist_path, exist_ok=True)
+def _pdf_page_count(path) -> int:
+    from pypdf import PdfReader
 
-    print(f"   Creando Vectorstore en: {persist_path}")
+    return len(PdfReader(path).pages)
 
-    # 4. Crear vectorstore
-    texts = [doc.page_content for doc in splits]
-    metadatas = [doc.metadata for doc in splits]
 
-    vectorstore = Chroma.from_texts(
-        texts=texts,
-        embedding=embedding_model,
-        metadatas=metadatas,
-        persist_directory=persist_path
+def _report(progress, **counters):
+    """Avisa del avance a quien lo pida (trabajos de indexación de la API, ver api/indexing_jobs.py)."""
+    if progress is not None:
+        progress(**counters)
+
+
+def list_documents(folder_path: Path):
+    return sorted(
+        p for p in folder_path.iterdir()
+        if p.is_file() and p.suffix.lower() in SUPPORTED_EXTENSIONS
     )
 
-    vectorstore.persist()
 
-    print("\n✔ Vectorstore creado exitosamente.")
-    print(f"✔ Total chunks indexados: {vectorstore._collection.count()}")
-    print(f" Ubicación: {persist_path}\n")
+def document_hashes(documents) -> dict:
+    """{nombre: sha256} de los documentos (cada archivo se lee una sola vez por ejecución)."""
+    return {p.name: file_sha256(p) for p in documents}
+
+
+def _is_up_to_date(hashes: dict, manifest: dict, splitter) -> bool:
+    """True si el manifiesto ya tiene exactamente los documentos actuales de la carpeta."""
+    split_version = splitter_id(splitter)
+    return bool(manifest) and set(manifest) == set(hashes) and all(
+        manifest[name]["sha256"] == sha and manifest[name].get("splitter") == split_version
+        for name, sha in hashes.items()
+    )
+
+
+def load_manifest(persist_path: Path) -> dict:
+    manifest_path = persist_path / MANIFEST_NAME
+    if not manifest_path.exists():
+        return {}
+    with open(manifest_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(persist_path: Path, manifest: dict):
+    # Escritura atómica: nunca queda un manifiesto a medio escribir
+    manifest_path = persist_path / MANIFEST_NAME
+    tmp_path = manifest_path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def _open_vectorstore(persist_path: Path, embedding_model):
+    from langchain_community.vectorstores import Chroma
+
+    return Chroma(
+        persist_directory=str(persist_path),
+        embedding_function=embedding_model
+    )
+
+
+def _get_embedding_model():
+    from api.rag_loader import get_embeddings
+
+    return get_embeddings()
+
+
+# PROCESAR UNA CARPETA (TODOS SUS PDF/TXT, DE FORMA INCREMENTAL)
+
+def process_folder(folder_name, pool=None, batch_size=DEFAULT_BATCH_SIZE, full=False,
+                   splitter=DEFAULT_SPLITTER, snapshot_format=None, progress=None):
+    folder_path = RAGS_PATH / folder_name
+
+    if not folder_path.is_dir():
+        logger.error("La carpeta '%s' no existe en backend/rags/", folder_name)
+        return None
+
+    logger.info("Procesando carpeta: %s", folder_name)
+    start = time.perf_counter()
+
+    # Se escribe en una versión nueva (copia de la vigente, o vacía con
+    # --full); el servidor sigue leyendo la vigente hasta que se publica
+    from api.vectorstore_versions import (
+        LEGACY_VERSION, begin_version, current_version, discard_version, publish_version, topic_lock,
+        version_path,
+    )
+
+    topic_dir = VECTORSTORES_PATH / f"{folder_name}_vs"
+    # Una ingestión del tema a la vez (también entre procesos): la siguiente
+    # copia la versión que publicó la anterior
+    with topic_lock(topic_dir):
+        documents = list_documents(folder_path)
+        hashes = document_hashes(documents)
+        previous = current_version(topic_dir) if topic_dir.is_dir() else None
+        if not full and previous not in (None, LEGACY_VERSION):
+            manifest = load_manifest(version_path(topic_dir, previous))
+            if _is_up_to_date(hashes, manifest, splitter):
+                # Nada cambió: la versión vigente sigue valiendo (no se copia nada)
+                logger.info("%s: sin cambios, sigue vigente la versión %s", folder_name, previous)
+                return {"folder": folder_name, "files": len(manifest), "skipped": len(manifest),
+                        "updated": 0, "removed": 0, "pages": 0, "chunks": 0, "version": previous,
+                        "total_chunks": sum(e["chunks"] for e in manifest.values()),
+                        "elapsed_s": round(time.perf_counter() - start, 2)}
+
+        version, persist_path = begin_version(topic_dir, copy_current=not full)
+        try:
+            stats = _index_folder(folder_name, folder_path, documents, hashes, persist_path, pool,
+                                  batch_size, full, splitter, snapshot_format, progress)
+        except BaseException:
+            discard_version(persist_path)
+            raise
+
+        # Cambio atómico del puntero: las preguntas siguientes usan esta versión
+        publish_version(topic_dir, version, persist_path, folder=folder_name, chunks=stats["total_chunks"],
+                        snapshot=stats.get("snapshot"))
+    stats["version"] = version
+    stats["elapsed_s"] = round(time.perf_counter() - start, 2)
+
+    logger.info("%s: %d chunks nuevos, %d archivos sin cambios, %d eliminados (%ss). "
+                "Total indexado: %d en la versión %s", folder_name, stats["chunks"], stats["skipped"],
+                stats["removed"], stats["elapsed_s"], stats["total_chunks"], stats["version"])
+    return stats
+
+
+def _index_folder(folder_name, folder_path, documents, hashes, persist_path, pool, batch_size, full,
+                  splitter, snapshot_format, progress):
+    """Aplica los cambios de la carpeta al índice de persist_path (una versión en construcción)."""
+    embedding_model = _get_embedding_model()
+    vectorstore = _open_vectorstore(persist_path, embedding_model)
+
+    manifest = {} if full else load_manifest(persist_path)
+    if not manifest and vectorstore._collection.count() > 0:
+        # Índice sin manifiesto (creado por la versión anterior de este
+        # script) o --full: no sabemos qué chunks son de qué archivo
+        logger.info("Reconstrucción completa: se vacía el vectorstore existente.")
+        vectorstore.delete_collection()
+        vectorstore = _open_vectorstore(persist_path, embedding_model)
+
+    if not documents:
+        logger.warning("No hay PDFs ni TXTs dentro de %s", folder_path)
+
+    stats = {"folder": folder_name, "files": len(documents), "skipped": 0,
+             "updated": 0, "removed": 0, "pages": 0, "chunks": 0}
+
+    # 1. Archivos eliminados de la carpeta: borrar sus chunks
+    current = {p.name for p in documents}
+    for name in [n for n in manifest if n not in current]:
+        vectorstore.delete(ids=manifest.pop(name)["ids"])
+        stats["removed"] += 1
+        logger.info("Eliminado del índice: %s", name)
+
+    # 2. Detectar qué archivos cambiaron y encolar su parseo en el pool
+    futures = {}
+    task_pages = {}
+    pending = {}
+    split_version = splitter_id(splitter)
+    for path in documents:
+        sha = hashes[path.name]
+        entry = manifest.get(path.name)
+        if entry and entry["sha256"] == sha and entry.get("splitter") == split_version:
+            stats["skipped"] += 1
+            continue
+
+        if entry:
+            # Archivo modificado (o cambió la división): fuera sus chunks viejos
+            vectorstore.delete(ids=entry["ids"])
+            del manifest[path.name]
+
+        source = f"backend/rags/{folder_name}/{path.name}"
+        logger.info("Documento detectado: %s", source)
+
+        base_metadata = {"source": source, "tema": folder_name}
+        if path.suffix.lower() == ".pdf":
+            total = _pdf_page_count(path)
+            base_metadata["total_pages"] = total
+            ranges = [(s, s + PAGES_PER_TASK) for s in range(0, total, PAGES_PER_TASK)]
+            tasks = [(_parse_pdf_range, (str(path), s, e), min(e, total) - s) for s, e in ranges]
+        else:
+            tasks = [(_parse_txt, (str(path),), 1)]
+
+        stats["updated"] += 1
+        pending[path.name] = {"sha256": sha, "metadata": base_metadata,
+                              "pages": [], "tasks": len(tasks)}
+        _report(progress, files_total=1, pages_total=sum(pages for _, _, pages in tasks))
+        for func, args, pages in tasks:
+            future = pool.submit(func, *args) if pool else _Immediate(func, *args)
+            futures[future] = path.name
+            task_pages[future] = pages
+
+    # 3. Cuando un archivo tiene todas sus páginas: división por artículos,
+    #    embeddings por lotes y escritura (los demás siguen en el pool)
+    for future in as_completed(futures) if pool else futures:
+        name = futures[future]
+        entry = pending[name]
+        entry["pages"].extend(future.result())
+        entry["tasks"] -= 1
+        _report(progress, pages_parsed=task_pages[future])
+        if entry["tasks"]:
+            continue
+
+        pages = sorted(entry["pages"], key=lambda p: -1 if p[0] is None else p[0])
+        stats["pages"] += len(pages)
+        chunks = split_document(pages, entry["metadata"], splitter)
+        _report(progress, chunks_total=len(chunks))
+
+        # Con el nombre: dos copias idénticas en la carpeta no comparten ids
+        sha = entry["sha256"]
+        ids = []
+        for offset in range(0, len(chunks), batch_size):
+            batch = chunks[offset:offset + batch_size]
+            batch_ids = [f"{name}-{sha[:16]}-{offset + i:05d}" for i in range(len(batch))]
+            vectorstore.add_texts(
+                texts=[text for text, _ in batch],
+                metadatas=[metadata for _, metadata in batch],
+                ids=batch_ids,
+            )
+            ids.extend(batch_ids)
+            _report(progress, chunks_embedded=len(batch))
+        stats["chunks"] += len(ids)
+
+        # Archivo completo: se registra en el manifiesto
+        manifest[name] = {"sha256": sha, "splitter": split_version,
+                          "ids": ids, "chunks": len(ids)}
+        save_manifest(persist_path, manifest)
+        _report(progress, files_done=1)
+        logger.info("%s: %d chunks", name, len(ids))
+
+    save_manifest(persist_path, manifest)
+
+    # Índice léxico BM25 (y de artículos) con los fragmentos actuales: se
+    # reconstruye entero, es barato y no calcula embeddings
+    from api.lexical_index import BM25Index
+
+    BM25Index.from_collection(vectorstore._collection).save(persist_path)
+
+    # Instantánea mapeable para los workers (después del manifiesto: queda al día)
+    from api.vector_snapshot import DEFAULT_SNAPSHOT_FORMAT, export_snapshot
+    from api.vector_index import NumPyVectorIndex
+
+    snapshot_format = snapshot_format or DEFAULT_SNAPSHOT_FORMAT
+    if snapshot_format != "none":
+        export_snapshot(NumPyVectorIndex.from_collection(vectorstore._collection), persist_path, snapshot_format)
+        stats["snapshot"] = snapshot_format
+
+    stats["total_chunks"] = vectorstore._collection.count()
+    return stats
+
+
+class _Immediate:
+    """Ejecuta la tarea en el proceso actual (workers=0), con la interfaz de un Future."""
+
+    def __init__(self, func, *args):
+        self._result = func(*args)
+
+    def result(self):
+        return self._result
+
+
+def list_folders():
+    return sorted(p.name for p in RAGS_PATH.iterdir() if p.is_dir())
+
+
+def ingest(folders=None, workers=DEFAULT_WORKERS, batch_size=DEFAULT_BATCH_SIZE, full=False,
+           splitter=DEFAULT_SPLITTER, snapshot_format=None):
+    """Indexa las carpetas indicadas (por defecto todas las de backend/rags/)."""
+    folders = folders or list_folders()
+    VECTORSTORES_PATH.mkdir(parents=True, exist_ok=True)
+
+    results = []
+    if workers > 0:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for folder in folders:
+                results.append(process_folder(folder, pool, batch_size, full, splitter, snapshot_format))
+    else:
+        for folder in folders:
+            results.append(process_folder(folder, None, batch_size, full, splitter, snapshot_format))
+
+    logger.info("Los servidores en marcha cargan la versión nueva de cada tema en su próxima pregunta.")
+    return [r for r in results if r]
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Indexa los documentos de backend/rags/ en vectorstores.")
+    parser.add_argument("folders", nargs="*", help="Carpetas de backend/rags/ (por defecto, todas)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Procesos para parsear páginas (0 = sin pool)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Chunks por lote de embeddings / escritura en Chroma")
+    parser.add_argument("--full", action="store_true",
+                        help="Ignorar el manifiesto y reconstruir desde cero")
+    parser.add_argument("--splitter", choices=SPLITTERS, default=DEFAULT_SPLITTER,
+                        help="legal: un fragmento por artículo; recursive: ventanas de tamaño fijo")
+    parser.add_argument("--snapshot-format",
+                        help="Instantánea para los workers: float32, float16, int8 o none "
+                             "(por defecto ASSISTLEG_VECTOR_SNAPSHOT_FORMAT o float16)")
+    return parser
 
 
 # -------------------------------------
-# EJECUCIÓN AUTOMÁTICA (SIN CONSOLA)
+# EJECUCIÓN DESDE CONSOLA
 # -------------------------------------
 
 if __name__ == "__main__":
-    process_folder(FOLDER_TO_PROCESS)
+    sys.path.insert(0, str(BACKEND_DIR))
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    args = build_arg_parser().parse_args()
+    ingest(args.folders, args.workers, args.batch_size, args.full, args.splitter, args.snapshot_format)
@@ -0,0 +1,148 @@
+# backend/api/embeddings.py
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List
+
+from langchain_core.embeddings import Embeddings
+
+
+# MOTOR DE EMBEDDINGS
+# - Backend configurable del modelo all-MiniLM-L6-v2:
+#     torch      → sentence-transformers por defecto
+#     onnx       → el mismo modelo exportado a ONNX (onnxruntime, CPU)
+#     onnx-int8  → la variante ONNX cuantizada a int8 del repo del modelo
+# - Micro-batching: las consultas que llegan a la vez desde varios hilos se
+#   agrupan en una sola llamada al modelo (espera máxima de unos ms).
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+EMBEDDING_BACKEND = os.getenv("ASSISTLEG_EMBEDDING_BACKEND", "torch")
+# Archivo ONNX cuantizado (el repo del modelo publica varias variantes)
+ONNX_INT8_FILE = os.getenv("ASSISTLEG_EMBEDDING_ONNX_FILE", "onnx/model_quint8_avx2.onnx")
+# Textos por llamada al modelo (ingestión y lotes de consultas)
+EMBEDDING_BATCH_SIZE = int(os.getenv("ASSISTLEG_EMBEDDING_BATCH_SIZE", "32"))
+# Ventana de espera del micro-batching; 0 lo desactiva
+BATCH_WAIT_MS = float(os.getenv("ASSISTLEG_EMBEDDING_BATCH_WAIT_MS", "2"))
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+def build_base_embeddings(backend: str = EMBEDDING_BACKEND,
+                          batch_size: int = EMBEDDING_BATCH_SIZE) -> Embeddings:
+    """Crea el modelo HuggingFaceEmbeddings con el backend indicado."""
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend de embeddings desconocido: {backend} (opciones: {', '.join(BACKENDS)})")
+
+    model_kwargs: Dict[str, Any] = {"device": "cpu"}
+    if backend == "onnx":
+        model_kwargs["backend"] = "onnx"
+    elif backend == "onnx-int8":
+        model_kwargs["backend"] = "onnx"
+        model_kwargs["model_kwargs"] = {"file_name": ONNX_INT8_FILE}
+
+    return HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL_NAME,
+        model_kwargs=model_kwargs,
+        encode_kwargs={"batch_size": batch_size},
+    )
+
+
+class MicroBatchingEmbeddings(Embeddings):
+    """
+    Agrupa las llamadas concurrentes a embed_query() en lotes. Un hilo de
+    fondo toma la primera consulta de la cola, espera como mucho
+    max_wait_ms a que lleguen más (hasta max_batch) y las embebe juntas con
+    embed_documents(). embed_documents() pasa directo al modelo.
+    `backend` es el del modelo envuelto, para sus estadísticas.
+    """
+
+    def __init__(self, base: Embeddings, max_batch: int = EMBEDDING_BATCH_SIZE,
+                 max_wait_ms: float = BATCH_WAIT_MS, backend: str = EMBEDDING_BACKEND):
+        self.base = base
+        self.backend = backend
+        self.max_batch = max_batch
+        self.max_wait_s = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+        self._batches = 0
+        self._queries = 0
+        self._largest_batch = 0
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(
+                        target=self._run, name="assistleg-embed-batcher", daemon=True
+                    )
+                    self._worker.start()
+
+    def embed_query(self, text: str) -> List[float]:
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((text, future))
+        return future.result()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.base.embed_documents(texts)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait_s
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                # Lo que ya está en cola entra sin esperar; después, solo
+                # hasta que se cierre la ventana
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for text, _ in batch]
+            try:
+                vectors = self.base.embed_documents(texts)
+            except Exception as exc:
+                for _, future in batch:
+                    future.set_exception(exc)
+                continue
+
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+            with self._lock:
+                self._batches += 1
+                self._queries += len(batch)
+                self._largest_batch = max(self._largest_batch, len(batch))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait_s * 1000,
+                "batches": self._batches,
+                "queries": self._queries,
+                "avg_batch": (self._queries / self._batches) if self._batches else 0.0,
+                "largest_batch": self._largest_batch,
+            }
+
+
+def build_embeddings(backend: str = EMBEDDING_BACKEND) -> Embeddings:
+    """Modelo de embeddings del proceso: backend elegido + micro-batching."""
+    base = build_base_embeddings(backend)
+    if BATCH_WAIT_MS <= 0:
+        return base
+    return MicroBatchingEmbeddings(base, backend=backend)
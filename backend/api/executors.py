@@ -0,0 +1,38 @@
+# backend/api/executors.py
+
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Pool ACOTADO para el trabajo de CPU (embeddings + búsqueda en Chroma).
+# Muchas preguntas en vuelo comparten estos pocos hilos en lugar de crear
+# uno por petición y competir por la CPU.
+EMBEDDING_MAX_WORKERS = int(os.getenv("ASSISTLEG_EMBEDDING_WORKERS", "4"))
+
+embedding_executor = ThreadPoolExecutor(
+    max_workers=EMBEDDING_MAX_WORKERS,
+    thread_name_prefix="assistleg-embed",
+)
+
+
+async def run_in_embedding_executor(func, *args, **kwargs):
+    """Ejecuta func(*args, **kwargs) en el pool de embeddings sin bloquear el event loop."""
+    loop = asyncio.get_running_loop()
+    # Con el contexto de la petición (la traza en curso, ver tracing)
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        embedding_executor, functools.partial(context.run, func, *args, **kwargs)
+    )
+
+
+# Pool para consultar varios vectorstores a la vez (búsqueda multi-tema).
+# Es aparte del anterior: la búsqueda multi-tema se lanza desde dentro de
+# embedding_executor y compartir pool podría bloquearla.
+FEDERATED_MAX_WORKERS = int(os.getenv("ASSISTLEG_FEDERATED_WORKERS", "4"))
+
+federated_executor = ThreadPoolExecutor(
+    max_workers=FEDERATED_MAX_WORKERS,
+    thread_name_prefix="assistleg-federated",
+)
@@ -0,0 +1,147 @@
+# backend/api/fake_llm.py
+
+import asyncio
+import math
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from api.tokens import count_tokens
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+
+
+class FakeLLMError(RuntimeError):
+    """Fallo simulado del proveedor (como un 503 de Groq)."""
+
+    status_code = 503
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    LLM local y determinista para pruebas de carga sin llamar a Groq.
+    Simula la latencia de red con time.sleep (sync) o asyncio.sleep (async),
+    así el benchmark compara el comportamiento real de WSGI vs ASGI.
+
+    - latency_dist: "fixed" (siempre latency_s), "uniform" (latency_s ± jitter
+      en proporción) o "lognormal" (mediana latency_s, sigma = jitter: cola
+      larga como la de una API real).
+    - failure_rate: probabilidad de que una llamada falle con FakeLLMError
+      (en streaming, a mitad de la respuesta).
+    - seed: con la misma semilla y el mismo orden de llamadas se repiten
+      latencias y fallos.
+    """
+
+    latency_s: float = 0.5
+    latency_dist: str = "fixed"
+    jitter: float = 0.5
+    failure_rate: float = 0.0
+    seed: int = 0
+    answer: str = "Respuesta simulada del asistente jurídico."
+
+    _rng: random.Random = PrivateAttr()
+    _rng_lock: Any = PrivateAttr()
+
+    def __init__(self, **data: Any):
+        super().__init__(**data)
+        if self.latency_dist not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"latency_dist debe ser uno de {LATENCY_DISTRIBUTIONS}")
+        self._rng = random.Random(self.seed)
+        self._rng_lock = threading.Lock()
+
+    @property
+    def _llm_type(self) -> str:
+        return "assistleg-fake"
+
+    def _draw(self):
+        """(latencia en s, ¿falla?) de la próxima llamada."""
+        with self._rng_lock:
+            if self.latency_dist == "uniform":
+                latency = self.latency_s * (1 + self._rng.uniform(-self.jitter, self.jitter))
+            elif self.latency_dist == "lognormal":
+                latency = self.latency_s * math.exp(self._rng.gauss(0.0, self.jitter))
+            else:
+                latency = self.latency_s
+            fails = self._rng.random() < self.failure_rate
+        return max(0.0, latency), fails
+
+    def _usage(self, messages: List[BaseMessage]) -> dict:
+        input_tokens = sum(count_tokens(str(m.content)) for m in messages)
+        output_tokens = count_tokens(self.answer)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens}
+
+    def _make_result(self, messages: List[BaseMessage]) -> ChatResult:
+        message = AIMessage(content=self.answer, usage_metadata=self._usage(messages))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        latency, fails = self._draw()
+        time.sleep(latency)
+        if fails:
+            raise FakeLLMError("Fallo simulado del LLM")
+        return self._make_result(messages)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        latency, fails = self._draw()
+        await asyncio.sleep(latency)
+        if fails:
+            raise FakeLLMError("Fallo simulado del LLM")
+        return self._make_result(messages)
+
+    # Streaming: la respuesta sale palabra a palabra repartiendo la latencia;
+    # el último fragmento lleva el uso de tokens, como en Groq
+
+    def _chunks(self, messages: List[BaseMessage]) -> List[ChatGenerationChunk]:
+        words = self.answer.split(" ")
+        chunks = [AIMessageChunk(content=w if i == 0 else " " + w) for i, w in enumerate(words)]
+        chunks[-1].usage_metadata = self._usage(messages)
+        return [ChatGenerationChunk(message=c) for c in chunks]
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        latency, fails = self._draw()
+        chunks = self._chunks(messages)
+        for i, chunk in enumerate(chunks):
+            time.sleep(latency / len(chunks))
+            if fails and i == len(chunks) // 2:
+                raise FakeLLMError("Fallo simulado del LLM durante el streaming")
+            yield chunk
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        latency, fails = self._draw()
+        chunks = self._chunks(messages)
+        for i, chunk in enumerate(chunks):
+            await asyncio.sleep(latency / len(chunks))
+            if fails and i == len(chunks) // 2:
+                raise FakeLLMError("Fallo simulado del LLM durante el streaming")
+            yield chunk
@@ -0,0 +1,171 @@
+# backend/api/federated.py
+
+import logging
+import math
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+
+from api.executors import federated_executor
+from api.lexical_index import BM25Index, parse_article_reference
+from api.vector_index import NumPyVectorIndex
+
+logger = logging.getLogger(__name__)
+
+
+# BÚSQUEDA EN VARIOS TEMAS A LA VEZ
+# - La pregunta se embebe UNA vez y el vector se usa en todos los vectorstores.
+# - Cada tema se consulta en paralelo (federated_executor): la latencia total
+#   es la del tema más lento, no la suma.
+# - Candidatos de cada tema: vecinos densos + aciertos BM25. Todos se puntúan
+#   con el coseno contra el mismo vector, así los puntajes son comparables
+#   entre temas; se deduplican y ningún tema pasa de su cuota.
+
+FEDERATED_FETCH_K = int(os.getenv("ASSISTLEG_FEDERATED_FETCH_K", "10"))
+FEDERATED_TOPIC_QUOTA = int(os.getenv("ASSISTLEG_FEDERATED_TOPIC_QUOTA", "3"))
+# Puntaje de un fragmento que es exactamente el artículo citado
+ARTICLE_SCORE = 2.0
+
+# (colección Chroma o NumPyVectorIndex, índice BM25 o None)
+TopicStore = Tuple[Any, Optional[BM25Index]]
+
+
+def _cosine(matrix: np.ndarray, vector: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(vector) or 1.0)
+    return (matrix @ vector) / np.where(norms == 0, 1.0, norms)
+
+
+def search_topic(topic: str, store: TopicStore, query: str, vector: np.ndarray,
+                 fetch_k: int = FEDERATED_FETCH_K, lexical_k: int = FEDERATED_FETCH_K) -> List[Tuple[Document, float]]:
+    """[(documento, puntaje)] de un tema, usando el vector ya calculado."""
+    collection, index = store
+
+    def as_document(text, metadata):
+        metadata = dict(metadata or {})
+        metadata.setdefault("tema", topic.removesuffix("_vs"))
+        return Document(page_content=text, metadata=metadata)
+
+    # "artículo N" presente en este tema: sin búsqueda vectorial
+    number = parse_article_reference(query)
+    if index is not None and number is not None:
+        positions = index.article(number)
+        if positions:
+            return [(as_document(index.texts[p], index.metadatas[p]), ARTICLE_SCORE)
+                    for p in positions[:fetch_k]]
+
+    if isinstance(collection, NumPyVectorIndex):
+        return _search_vector_index(collection, index, query, vector, fetch_k, lexical_k, as_document)
+
+    n_results = min(fetch_k, collection.count())
+    if n_results <= 0:
+        return []
+    dense = collection.query(
+        query_embeddings=[vector.tolist()], n_results=n_results,
+        include=["documents", "metadatas", "embeddings"],
+    )
+    ids = list(dense["ids"][0])
+    texts = list(dense["documents"][0])
+    metadatas = list(dense["metadatas"][0])
+    embeddings = list(dense["embeddings"][0])
+
+    # Aciertos léxicos que la búsqueda densa no trajo
+    if index is not None:
+        seen = set(ids)
+        missing = [index.ids[p] for p, _ in index.search(query, lexical_k) if index.ids[p] not in seen]
+        if missing:
+            extra = collection.get(ids=missing, include=["documents", "metadatas", "embeddings"])
+            ids.extend(extra["ids"])
+            texts.extend(extra["documents"])
+            metadatas.extend(extra["metadatas"])
+            embeddings.extend(extra["embeddings"])
+
+    if not ids:
+        return []
+    scores = _cosine(np.asarray(embeddings, dtype=np.float32), vector)
+    return [(as_document(t, m), float(s)) for t, m, s in zip(texts, metadatas, scores)]
+
+
+def _search_vector_index(vector_index: NumPyVectorIndex, index: Optional[BM25Index], query: str,
+                         vector: np.ndarray, fetch_k: int, lexical_k: int, as_document) -> List[Tuple[Document, float]]:
+    """Como la consulta a Chroma de search_topic, sobre el índice en memoria."""
+    positions = [p for p, _ in vector_index.search(vector, fetch_k)]
+    if index is not None:
+        seen = set(positions)
+        for p, _ in index.search(query, lexical_k):
+            position = vector_index.position(index.ids[p])
+            if position is not None and position not in seen:
+                seen.add(position)
+                positions.append(position)
+    if not positions:
+        return []
+    scores = vector_index.cosine(vector, positions)
+    return [(as_document(vector_index.texts[p], vector_index.metadatas[p]), float(s))
+            for p, s in zip(positions, scores)]
+
+
+def merge_results(per_topic: Dict[str, List[Tuple[Document, float]]], k: int,
+                  quota: int = FEDERATED_TOPIC_QUOTA) -> List[Document]:
+    """
+    Une los resultados por puntaje, sin textos repetidos y con como mucho
+    `quota` fragmentos por tema. Si con la cuota no se llega a k, se completa
+    con los mejores restantes.
+    """
+    ranked = sorted(
+        ((score, topic, doc) for topic, results in per_topic.items() for doc, score in results),
+        key=lambda item: item[0], reverse=True,
+    )
+
+    selected: List[Document] = []
+    seen = set()
+    taken: Dict[str, int] = {}
+    leftovers = []
+    for score, topic, doc in ranked:
+        key = " ".join(doc.page_content.split())
+        if key in seen:
+            continue
+        seen.add(key)
+        if taken.get(topic, 0) >= quota:
+            leftovers.append(doc)
+            continue
+        taken[topic] = taken.get(topic, 0) + 1
+        selected.append(doc)
+        if len(selected) == k:
+            return selected
+
+    return selected + leftovers[:k - len(selected)]
+
+
+class FederatedRetriever(BaseRetriever):
+    """Retriever sobre varios temas: un embedding, consultas en paralelo, fusión por puntaje."""
+
+    stores: Dict[str, Any]
+    embeddings: Embeddings
+    k: int = 5
+    fetch_k: int = FEDERATED_FETCH_K
+    quota: int = FEDERATED_TOPIC_QUOTA
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: Optional[CallbackManagerForRetrieverRun] = None
+    ) -> List[Document]:
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+
+        futures = {
+            topic: federated_executor.submit(search_topic, topic, store, query, vector, self.fetch_k)
+            for topic, store in self.stores.items()
+        }
+        per_topic = {}
+        for topic, future in futures.items():
+            try:
+                per_topic[topic] = future.result()
+            except Exception as exc:
+                # Un tema con problemas no deja sin respuesta a los demás
+                logger.warning("Error buscando en el tema '%s': %r", topic, exc)
+                per_topic[topic] = []
+
+        quota = max(self.quota, math.ceil(self.k / max(len(self.stores), 1)))
+        return merge_results(per_topic, self.k, quota)
@@ -0,0 +1,103 @@
+# backend/api/hybrid_retriever.py
+
+import os
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStoreRetriever
+
+from api.legal_splitter import parse_structure_reference
+from api.lexical_index import BM25Index, parse_article_reference
+from api.vector_index import NumPyRetriever
+
+
+# RECUPERACIÓN HÍBRIDA (BM25 + VECTORES)
+# Las listas de ambos retrievers se fusionan con Reciprocal Rank Fusion:
+# score(d) = Σ 1 / (RRF_K + rango de d en cada lista). No hace falta
+# calibrar los puntajes BM25 contra las distancias de Chroma.
+
+RRF_K = int(os.getenv("ASSISTLEG_RRF_K", "60"))
+LEXICAL_K = int(os.getenv("ASSISTLEG_LEXICAL_K", "20"))
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int, rrf_k: int = RRF_K) -> List[Document]:
+    """Fusiona listas ordenadas de documentos (se identifican por su texto)."""
+    scores: Dict[str, float] = {}
+    documents: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            documents.setdefault(key, doc)
+    best = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [documents[key] for key in best]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    1) "artículo N": si el índice conoce ese artículo, se devuelven sus
+       fragmentos directamente (sin embedding ni búsqueda vectorial).
+    2) En otro caso, BM25 y el retriever vectorial, fusionados con RRF.
+    Si la pregunta nombra un título o capítulo ("capítulo III") y los
+    fragmentos tienen esos metadatos, ambas búsquedas se limitan a él.
+    """
+
+    vector_retriever: BaseRetriever
+    lexical_index: BM25Index
+    k: int = 5
+    lexical_k: int = LEXICAL_K
+    rrf_k: int = RRF_K
+
+    def structure_filter(self, query: str) -> Tuple[Optional[Dict], Optional[List[int]]]:
+        """(filtro de metadatos, posiciones que lo cumplen) o (None, None)."""
+        where = parse_structure_reference(query)
+        if not where:
+            return None, None
+        positions = self.lexical_index.positions_where(where)
+        if not positions:
+            # Índice sin esos metadatos (fragmentos de tamaño fijo)
+            return None, None
+        return where, positions
+
+    def article_lookup(self, query: str, allowed: Optional[List[int]] = None) -> Optional[List[Document]]:
+        number = parse_article_reference(query)
+        if number is None:
+            return None
+        positions = self.lexical_index.article(number)
+        if allowed is not None:
+            allowed_set = set(allowed)
+            positions = [p for p in positions if p in allowed_set] or positions
+        if not positions:
+            return None
+        return [self.lexical_index.document(p) for p in positions[:self.k]]
+
+    def _vector_search(self, query: str, where: Optional[Dict]) -> List[Document]:
+        if where is not None and isinstance(self.vector_retriever, NumPyRetriever):
+            return self.vector_retriever.search(query, where)
+        if where is None or not isinstance(self.vector_retriever, VectorStoreRetriever):
+            return self.vector_retriever.invoke(query)
+
+        chroma_where = where if len(where) == 1 else {"$and": [{k: v} for k, v in where.items()]}
+        retriever = self.vector_retriever.vectorstore.as_retriever(
+            search_type=self.vector_retriever.search_type,
+            search_kwargs={**self.vector_retriever.search_kwargs, "filter": chroma_where},
+        )
+        return retriever.invoke(query)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: Optional[CallbackManagerForRetrieverRun] = None
+    ) -> List[Document]:
+        where, allowed = self.structure_filter(query)
+
+        docs = self.article_lookup(query, allowed)
+        if docs is not None:
+            return docs
+
+        lexical = [
+            self.lexical_index.document(p)
+            for p, _ in self.lexical_index.search(query, self.lexical_k, allowed)
+        ]
+        vector = self._vector_search(query, where)
+        return reciprocal_rank_fusion([vector, lexical], self.k, self.rrf_k)
@@ -0,0 +1,225 @@
+# backend/api/indexing_jobs.py
+
+import contextlib
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from api.create_vectorstores import DEFAULT_SPLITTER, RAGS_PATH, SUPPORTED_EXTENSIONS, process_folder
+from api.registry import agent_registry
+from api.tracing import metrics
+
+logger = logging.getLogger(__name__)
+
+
+# CARGA DE DOCUMENTOS DESDE LA API E INDEXACIÓN EN SEGUNDO PLANO
+# POST /api/documents/upload/ guarda los PDF/TXT en backend/rags/<carpeta>/
+# y encola un trabajo; la petición responde enseguida (202) con el id.
+# Los trabajos corren en un pool local de hilos (no en los hilos que
+# atienden peticiones) y el análisis de los PDF, en procesos aparte como en
+# manage.py ingest. Cada trabajo construye una versión nueva del tema y la
+# publica al terminar (api/vectorstore_versions.py): la siguiente pregunta
+# ya usa el índice nuevo.
+
+# Trabajos simultáneos (dos trabajos de la misma carpeta nunca se solapan)
+INDEXING_WORKERS = int(os.getenv("ASSISTLEG_INDEXING_WORKERS", "1"))
+# Procesos para analizar los PDF de cada trabajo (0 = en el mismo hilo)
+INDEXING_PARSE_WORKERS = int(os.getenv("ASSISTLEG_INDEXING_PARSE_WORKERS", "2"))
+UPLOAD_MAX_MB = float(os.getenv("ASSISTLEG_UPLOAD_MAX_MB", "50"))
+# Trabajos terminados que se conservan para consultar su estado
+MAX_FINISHED_JOBS = int(os.getenv("ASSISTLEG_INDEXING_HISTORY", "100"))
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+_FOLDER_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+_UNSAFE_CHARS = re.compile(r"[^\w.() -]+")
+
+
+class UploadError(ValueError):
+    """Carga rechazada; `status` es el código HTTP con el que se responde."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def validate_folder(folder: Optional[str]) -> str:
+    folder = (folder or "").strip()
+    if not _FOLDER_RE.match(folder):
+        raise UploadError("'folder' debe ser un nombre de carpeta simple (letras, números, _ o -).")
+    return folder
+
+
+def _safe_filename(name: str) -> str:
+    name = _UNSAFE_CHARS.sub("_", Path(name or "").name).strip(" .")
+    if not name or Path(name).suffix.lower() not in SUPPORTED_EXTENSIONS:
+        raise UploadError(f"'{name or '?'}': solo se aceptan archivos {', '.join(SUPPORTED_EXTENSIONS)}.")
+    return name
+
+
+def save_upload(folder: str, uploaded) -> Path:
+    """
+    Copia un archivo subido (UploadedFile de Django) a backend/rags/<folder>/
+    por bloques, sin leerlo entero en memoria. Se escribe en un .part y se
+    renombra al final: la ingestión nunca ve un archivo a medias.
+    """
+    name = _safe_filename(uploaded.name)
+    if uploaded.size > UPLOAD_MAX_MB * 1024 * 1024:
+        raise UploadError(f"'{name}' supera el máximo de {UPLOAD_MAX_MB:g} MB.", status=413)
+
+    folder_path = RAGS_PATH / folder
+    folder_path.mkdir(parents=True, exist_ok=True)
+    target = folder_path / name
+    part = target.with_name(f".{name}.{uuid.uuid4().hex[:8]}.part")
+    try:
+        with open(part, "wb") as f:
+            for i, chunk in enumerate(uploaded.chunks()):
+                if i == 0 and target.suffix.lower() == ".pdf" and not chunk.startswith(b"%PDF"):
+                    raise UploadError(f"'{name}' no es un PDF válido.")
+                f.write(chunk)
+        os.replace(part, target)
+    finally:
+        if part.exists():
+            part.unlink()
+    return target
+
+
+class IndexingJob:
+    """Estado y avance de un trabajo; process_folder lo actualiza con advance()."""
+
+    def __init__(self, folder: str, files: List[str], full: bool = False, splitter: str = DEFAULT_SPLITTER):
+        self.id = uuid.uuid4().hex
+        self.folder = folder
+        self.topic = f"{folder}_vs"
+        self.files = files
+        self.full = full
+        self.splitter = splitter
+        self.status = QUEUED
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.counters = dict.fromkeys(
+            ("files_total", "files_done", "pages_total", "pages_parsed", "chunks_total", "chunks_embedded"), 0
+        )
+        self._lock = threading.Lock()
+
+    def advance(self, **counters):
+        with self._lock:
+            for name, n in counters.items():
+                self.counters[name] += n
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+        end = self.finished or time.time()
+        elapsed = end - self.started if self.started else 0.0
+        pages_total = counters["pages_total"]
+        return {
+            "id": self.id,
+            "folder": self.folder,
+            "topic": self.topic,
+            "files": self.files,
+            "full": self.full,
+            "splitter": self.splitter,
+            "status": self.status,
+            "created": _isoformat(self.created),
+            "started": _isoformat(self.started),
+            "finished": _isoformat(self.finished),
+            "elapsed_s": round(elapsed, 2),
+            "progress": {
+                **counters,
+                "pages_percent": round(100 * counters["pages_parsed"] / pages_total, 1) if pages_total
+                else (100.0 if self.status == SUCCEEDED else 0.0),
+            },
+            "throughput": {
+                "pages_per_s": round(counters["pages_parsed"] / elapsed, 2) if elapsed else 0.0,
+                "chunks_per_s": round(counters["chunks_embedded"] / elapsed, 2) if elapsed else 0.0,
+            },
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+def _isoformat(timestamp: Optional[float]) -> Optional[str]:
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(timestamp)) if timestamp else None
+
+
+def _parse_pool():
+    if INDEXING_PARSE_WORKERS <= 0:
+        return contextlib.nullcontext(None)
+    # spawn: hacer fork de un servidor con hilos (y clientes de Chroma abiertos) no es seguro
+    return ProcessPoolExecutor(max_workers=INDEXING_PARSE_WORKERS,
+                               mp_context=multiprocessing.get_context("spawn"))
+
+
+class IndexingJobManager:
+    """Cola de trabajos de indexación, ejecutados por un pool local de hilos."""
+
+    def __init__(self, workers: int = INDEXING_WORKERS, max_finished: int = MAX_FINISHED_JOBS):
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="assistleg-indexing")
+        self._jobs: "OrderedDict[str, IndexingJob]" = OrderedDict()
+        self._folder_locks: Dict[str, threading.Lock] = {}
+        self._max_finished = max_finished
+        self._lock = threading.Lock()
+
+    def submit(self, folder: str, files: List[str], full: bool = False,
+               splitter: Optional[str] = None) -> IndexingJob:
+        job = IndexingJob(folder, files, full, splitter or DEFAULT_SPLITTER)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        metrics.inc("assistleg_indexing_jobs_total", {"status": QUEUED})
+        self._executor.submit(self._run, job)
+        logger.info("Trabajo de indexación %s encolado: %s (%d archivos)", job.id, folder, len(files))
+        return job
+
+    def get(self, job_id: str) -> Optional[IndexingJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[IndexingJob]:
+        """Trabajos conocidos, del más reciente al más antiguo."""
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+    def _prune(self):
+        finished = [j for j in self._jobs.values() if j.status in (SUCCEEDED, FAILED)]
+        for job in finished[:max(0, len(finished) - self._max_finished)]:
+            del self._jobs[job.id]
+
+    def _folder_lock(self, folder: str) -> threading.Lock:
+        with self._lock:
+            return self._folder_locks.setdefault(folder, threading.Lock())
+
+    def _run(self, job: IndexingJob):
+        with self._folder_lock(job.folder):
+            job.status, job.started = RUNNING, time.time()
+            try:
+                with _parse_pool() as pool:
+                    stats = process_folder(job.folder, pool, full=job.full, splitter=job.splitter,
+                                           progress=job.advance)
+                if stats is None:
+                    raise FileNotFoundError(f"La carpeta '{job.folder}' no existe en backend/rags/")
+                # La versión ya está publicada; así este proceso no espera al sondeo
+                agent_registry.invalidate(job.topic)
+                job.result, job.status = stats, SUCCEEDED
+            except Exception as exc:
+                logger.exception("Falló el trabajo de indexación %s (%s)", job.id, job.folder)
+                job.error, job.status = f"{type(exc).__name__}: {exc}", FAILED
+            finally:
+                job.finished = time.time()
+        metrics.inc("assistleg_indexing_jobs_total", {"status": job.status})
+        logger.info("Trabajo de indexación %s: %s en %.1fs", job.id, job.status, job.finished - job.started)
+
+
+indexing_jobs = IndexingJobManager()
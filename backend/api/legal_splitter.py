@@ -0,0 +1,188 @@
+# backend/api/legal_splitter.py
+
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+
+# DIVISIÓN DE DOCUMENTOS NORMATIVOS POR ESTRUCTURA
+# En lugar de ventanas de 1000 caracteres con 200 de solapamiento, se emite
+# un fragmento por artículo (con sus parágrafos) y metadatos jerárquicos:
+# título, capítulo, artículo. Sirve para la Constitución, el Código
+# Sustantivo del Trabajo y los reglamentos (encabezados TÍTULO / CAPÍTULO /
+# ARTÍCULO / PARÁGRAFO al inicio de línea).
+
+SPLITTER_VERSION = "legal-1"
+# Artículos más largos se parten en varias piezas (sin solapamiento)
+MAX_CHUNK_CHARS = int(os.getenv("ASSISTLEG_MAX_CHUNK_CHARS", "1000"))
+
+# "ARTÍCULO 3.-", "Artículo 23.", "ARTICULO 1o.", "ARTÍCULO 2 0 . -" (PDF escaneado)
+_ARTICLE = re.compile(r"^\s*ART[IÍ]CULO\s+(\d(?:\s?\d){0,3})\s*[oº°]?\s*[.\-:]", re.IGNORECASE)
+_TITLE = re.compile(r"^\s*T[IÍ]TULO\s+([IVXLC]+|\d+|PRELIMINAR)\b\.?\s*(.*)$")
+_CHAPTER = re.compile(r"^\s*CAP[IÍ]TULO\s+([IVXLC]+|\d+)\b\.?\s*(.*)$")
+_PARAGRAPH = re.compile(r"^\s*PAR[AÁ]GRAFO\b", re.IGNORECASE)
+
+# Referencias en la pregunta: "capítulo 3", "del título II"
+_TITLE_QUERY = re.compile(r"(?i)\bt[ií]tulo\s+([ivxlc]+|\d+|preliminar)\b")
+_CHAPTER_QUERY = re.compile(r"(?i)\bcap[ií]tulo\s+([ivxlc]+|\d+)\b")
+
+_ROMAN = {"I": 1, "V": 5, "X": 10, "L": 50, "C": 100}
+
+
+def section_number(raw: str) -> int:
+    """'IV' → 4, '3' → 3, 'PRELIMINAR' → 0."""
+    raw = raw.upper()
+    if raw.isdigit():
+        return int(raw)
+    if raw == "PRELIMINAR":
+        return 0
+    total = 0
+    for current, following in zip(raw, raw[1:] + " "):
+        value = _ROMAN[current]
+        total += -value if _ROMAN.get(following, 0) > value else value
+    return total
+
+
+def parse_structure_reference(query: str) -> Dict[str, int]:
+    """'¿Qué dice el capítulo III del título II?' → {"titulo": 2, "capitulo": 3}."""
+    where = {}
+    for key, pattern in (("titulo", _TITLE_QUERY), ("capitulo", _CHAPTER_QUERY)):
+        match = pattern.search(query or "")
+        if match:
+            where[key] = section_number(match.group(1))
+    return where
+
+
+def _article_number(raw: str) -> str:
+    return re.sub(r"\s", "", raw).lstrip("0") or "0"
+
+
+class _Section:
+    """Fragmento en construcción: líneas + metadatos de su posición."""
+
+    def __init__(self, context: Dict, page: Optional[int], article: Optional[str] = None):
+        self.metadata = dict(context)
+        if article is not None:
+            self.metadata["articulo"] = article
+        if page is not None:
+            self.metadata["page"] = page
+        self.lines: List[str] = []
+        self.paragraphs = 0
+
+    @property
+    def article(self):
+        return self.metadata.get("articulo")
+
+    def text(self) -> str:
+        return "\n".join(self.lines).strip()
+
+
+def _split_long(text: str, max_chars: int) -> List[str]:
+    """Parte un texto largo por líneas en piezas de como mucho max_chars."""
+    pieces, current, size = [], [], 0
+    for line in text.split("\n"):
+        # Una línea sola más larga que el máximo se corta a la fuerza
+        while len(line) > max_chars:
+            if current:
+                pieces.append("\n".join(current))
+                current, size = [], 0
+            pieces.append(line[:max_chars])
+            line = line[max_chars:]
+        if size + len(line) + 1 > max_chars and current:
+            pieces.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        pieces.append("\n".join(current))
+    return [p.strip() for p in pieces if p.strip()]
+
+
+def split_legal_document(pages: List[Tuple[Optional[int], str]], base_metadata: Dict,
+                         max_chars: int = MAX_CHUNK_CHARS) -> List[Tuple[str, Dict]]:
+    """
+    Divide un documento ([(página, texto)] en orden) en fragmentos por
+    artículo: [(texto, metadata)]. Devuelve [] si no se reconoce ningún
+    artículo (el llamador usa entonces la división por tamaño).
+    """
+    context: Dict = {}
+    pending_name = None          # "titulo_nombre"/"capitulo_nombre" en la línea siguiente
+    sections: List[_Section] = []
+    current = _Section(context, None)
+    found_article = False
+
+    for page, text in pages:
+        for line in (text or "").split("\n"):
+            stripped = line.strip()
+            if not stripped:
+                continue
+
+            title = _TITLE.match(line)
+            chapter = None if title else _CHAPTER.match(line)
+            article = None if title or chapter else _ARTICLE.match(line)
+
+            if title or chapter:
+                level = "titulo" if title else "capitulo"
+                match = title or chapter
+                context[level] = section_number(match.group(1))
+                context.pop(f"{level}_nombre", None)
+                if level == "titulo":
+                    context.pop("capitulo", None)
+                    context.pop("capitulo_nombre", None)
+                name = match.group(2).strip(" .-")
+                if name:
+                    context[f"{level}_nombre"] = name
+                    pending_name = None
+                else:
+                    pending_name = f"{level}_nombre"
+                # Lo que siga ya pertenece a la nueva sección
+                sections.append(current)
+                current = _Section(context, page)
+                continue
+
+            if pending_name:
+                context[pending_name] = stripped
+                current.metadata[pending_name] = stripped
+                pending_name = None
+                continue
+
+            if article:
+                number = _article_number(article.group(1))
+                # El mismo número dentro del artículo (texto original o
+                # modificado en las notas del CST) no abre uno nuevo
+                if number != current.article:
+                    sections.append(current)
+                    current = _Section(context, page, number)
+                    found_article = True
+
+            if _PARAGRAPH.match(line) and current.article:
+                current.paragraphs += 1
+
+            if page is not None:
+                current.metadata.setdefault("page", page)
+            current.lines.append(line.rstrip())
+
+    sections.append(current)
+
+    if not found_article:
+        return []
+
+    chunks = []
+    for section in sections:
+        text = section.text()
+        if not text:
+            continue
+        metadata = {**base_metadata, **section.metadata}
+        if section.paragraphs:
+            metadata["paragrafos"] = section.paragraphs
+
+        pieces = [text] if len(text) <= max_chars else _split_long(text, max_chars)
+        for part, piece in enumerate(pieces, start=1):
+            piece_metadata = dict(metadata)
+            if len(pieces) > 1:
+                piece_metadata["parte"] = part
+                if part > 1 and section.article:
+                    # Que las piezas siguientes sigan diciendo de qué artículo son
+                    piece = f"ARTÍCULO {section.article} (continuación)\n{piece}"
+            chunks.append((piece, piece_metadata))
+    return chunks
@@ -0,0 +1,186 @@
+# backend/api/lexical_index.py
+
+import json
+import math
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+
+# ÍNDICE LÉXICO (BM25) DE CADA VECTORSTORE
+# Los embeddings de MiniLM distinguen mal identificadores exactos
+# ("artículo 22", "Ley 100"). Junto a cada <tema>_vs se guarda un índice
+# invertido BM25 de los mismos fragmentos y un mapa artículo → fragmentos.
+
+LEXICAL_INDEX_NAME = "lexical_index.json"
+INDEX_FORMAT_VERSION = 1
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_STOPWORDS = frozenset("""
+a al algo ante como con cual cuales cuando de del donde el ella ellas ellos en entre es esa ese eso esta
+este esto fue ha han hay la las le les lo los mas me mi no nos o para pero por que quien se segun ser si
+sin sobre su sus tambien te tiene todo tu un una uno unos y ya
+""".split())
+
+_TOKEN = re.compile(r"\w+")
+# Encabezado de artículo dentro de un fragmento ("ARTÍCULO 2 0 . -" en los
+# PDF escaneados trae los dígitos separados por espacios)
+_ARTICLE_HEADING = re.compile(r"(?im)^\s*art[ií]culo\s+(\d(?:\s?\d){0,3})\b")
+# Referencia a un artículo en la pregunta del usuario
+_ARTICLE_QUERY = re.compile(r"(?i)\b(?:art[ií]culo|art\.)\s*(\d+)\b")
+
+
+def _fold(text: str) -> str:
+    """Minúsculas y sin tildes."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(_fold(text)) if t not in _STOPWORDS]
+
+
+def _article_number(raw: str) -> str:
+    return re.sub(r"\s", "", raw).lstrip("0") or "0"
+
+
+def find_article_headings(text: str) -> List[str]:
+    """Números de los artículos que empiezan dentro del fragmento."""
+    return [_article_number(m) for m in _ARTICLE_HEADING.findall(text or "")]
+
+
+def parse_article_reference(query: str) -> Optional[str]:
+    """'¿Qué dice el artículo 22?' → '22'."""
+    match = _ARTICLE_QUERY.search(query or "")
+    return _article_number(match.group(1)) if match else None
+
+
+class BM25Index:
+    """Índice invertido BM25 en memoria, persistido como JSON."""
+
+    def __init__(self, ids: List[str], texts: List[str], metadatas: List[dict],
+                 postings: Dict[str, List[Tuple[int, int]]], doc_lengths: List[int],
+                 articles: Dict[str, List[int]]):
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self.articles = articles
+        self.doc_lengths = np.asarray(doc_lengths, dtype=np.float32)
+        self.avg_length = float(self.doc_lengths.mean()) if len(ids) else 0.0
+
+        # Postings como arrays: el scoring de un término es vectorizado
+        n_docs = len(ids)
+        self._postings = {}
+        for term, entries in postings.items():
+            docs = np.fromiter((d for d, _ in entries), dtype=np.int32, count=len(entries))
+            freqs = np.fromiter((f for _, f in entries), dtype=np.float32, count=len(entries))
+            idf = math.log(1 + (n_docs - len(entries) + 0.5) / (len(entries) + 0.5))
+            self._postings[term] = (docs, freqs, idf)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, ids: List[str], texts: List[str], metadatas: List[dict]) -> "BM25Index":
+        postings = defaultdict(list)
+        doc_lengths = []
+        articles = defaultdict(list)
+
+        for position, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths.append(len(tokens))
+            for term, freq in Counter(tokens).items():
+                postings[term].append((position, freq))
+            # Fragmentos por artículo traen el número en los metadatos; los
+            # de tamaño fijo, en sus encabezados
+            article = (metadatas[position] or {}).get("articulo")
+            for number in [str(article)] if article else find_article_headings(text):
+                if position not in articles[number]:
+                    articles[number].append(position)
+
+        return cls(list(ids), list(texts), [dict(m or {}) for m in metadatas],
+                   dict(postings), doc_lengths, dict(articles))
+
+    @classmethod
+    def from_collection(cls, collection) -> "BM25Index":
+        """Construye el índice con los fragmentos de una colección Chroma."""
+        data = collection.get(include=["documents", "metadatas"])
+        return cls.build(data["ids"], data["documents"], data["metadatas"])
+
+    def positions_where(self, where: Dict) -> List[int]:
+        """Posiciones de los fragmentos cuyos metadatos coinciden con where."""
+        return [
+            position for position, metadata in enumerate(self.metadatas)
+            if all(metadata.get(key) == value for key, value in where.items())
+        ]
+
+    def search(self, query: str, k: int = 20, allowed: Optional[List[int]] = None) -> List[Tuple[int, float]]:
+        """[(posición, puntaje BM25)] de los k mejores fragmentos (dentro de allowed, si se da)."""
+        if not len(self.ids):
+            return []
+
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths / (self.avg_length or 1))
+        for term in set(tokenize(query)):
+            entry = self._postings.get(term)
+            if entry is None:
+                continue
+            docs, freqs, idf = entry
+            scores[docs] += idf * freqs * (BM25_K1 + 1) / (freqs + norm[docs])
+
+        if allowed is not None:
+            mask = np.zeros(len(self.ids), dtype=bool)
+            mask[allowed] = True
+            scores[~mask] = 0
+
+        k = min(k, int(np.count_nonzero(scores)))
+        if k <= 0:
+            return []
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(int(i), float(scores[i])) for i in best]
+
+    def article(self, number: str) -> List[int]:
+        return list(self.articles.get(number, []))
+
+    def document(self, position: int) -> Document:
+        return Document(page_content=self.texts[position], metadata=dict(self.metadatas[position]))
+
+    def save(self, persist_path: Path):
+        data = {
+            "version": INDEX_FORMAT_VERSION,
+            "ids": self.ids,
+            "texts": self.texts,
+            "metadatas": self.metadatas,
+            "doc_lengths": self.doc_lengths.astype(int).tolist(),
+            "postings": {
+                term: list(zip(docs.tolist(), freqs.astype(int).tolist()))
+                for term, (docs, freqs, _) in self._postings.items()
+            },
+            "articles": self.articles,
+        }
+        path = Path(persist_path) / LEXICAL_INDEX_NAME
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, persist_path: Path) -> Optional["BM25Index"]:
+        path = Path(persist_path) / LEXICAL_INDEX_NAME
+        if not path.exists():
+            return None
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != INDEX_FORMAT_VERSION:
+            return None
+        return cls(data["ids"], data["texts"], data["metadatas"], data["postings"],
+                   data["doc_lengths"], data["articles"])
@@ -0,0 +1,662 @@
+# backend/api/llm_gateway.py
+
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from api.tokens import count_tokens
+from api.tracing import metrics
+
+logger = logging.getLogger(__name__)
+
+
+# PASARELA RESILIENTE AL LLM
+# Toda llamada al modelo pasa por ResilientChatModel, que envuelve al modelo
+# del proveedor activo (ver config_llm.LLMProvider.get):
+#   - límite de peticiones/min y tokens/min por modelo (token bucket, como la
+#     cuota de Groq): si la espera supera ASSISTLEG_LLM_QUEUE_TIMEOUT, se
+#     rechaza en local (LLMThrottled) en lugar de provocar un 429;
+#   - límite de llamadas en vuelo en el proceso;
+#   - reintentos con backoff exponencial y jitter completo (respeta
+#     Retry-After) solo para errores transitorios: 408/409/429/5xx, timeouts
+#     y errores de conexión;
+#   - hedging opcional: si la respuesta tarda más de ASSISTLEG_LLM_HEDGE_MS
+#     se lanza una segunda petición igual y gana la primera que responde;
+#   - circuit breaker por modelo: tras N fallos seguidos deja de llamarlo
+#     durante un tiempo y después prueba con una sola petición;
+#   - modelo de respaldo, con su propia cuota y su propio breaker, cuando el
+#     principal está abierto, limitado o agota sus reintentos.
+# En streaming se reintenta o se cambia de modelo solo antes del primer
+# fragmento; una vez emitido texto, el error llega al llamador.
+# Eventos (retry, throttle, fallback, hedge, breaker_open, ...) en
+# stats() y en /metrics (assistleg_llm_events_total).
+
+LLM_TIMEOUT_S = float(os.getenv("ASSISTLEG_LLM_TIMEOUT", "30"))
+LLM_MAX_RETRIES = int(os.getenv("ASSISTLEG_LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_BASE_MS = float(os.getenv("ASSISTLEG_LLM_BACKOFF_BASE_MS", "250"))
+LLM_BACKOFF_MAX_MS = float(os.getenv("ASSISTLEG_LLM_BACKOFF_MAX_MS", "4000"))
+# Cuota por modelo (0 = sin límite); por defecto, la del plan gratuito de Groq
+LLM_RPM = int(os.getenv("ASSISTLEG_LLM_RPM", "30"))
+LLM_TPM = int(os.getenv("ASSISTLEG_LLM_TPM", "6000"))
+# Tokens de respuesta que se reservan en el límite de tokens/min
+LLM_OUTPUT_RESERVE_TOKENS = int(os.getenv("ASSISTLEG_LLM_OUTPUT_RESERVE_TOKENS", "300"))
+LLM_QUEUE_TIMEOUT_S = float(os.getenv("ASSISTLEG_LLM_QUEUE_TIMEOUT", "10"))
+LLM_MAX_CONCURRENCY = int(os.getenv("ASSISTLEG_LLM_MAX_CONCURRENCY", "16"))
+LLM_HEDGE_MS = float(os.getenv("ASSISTLEG_LLM_HEDGE_MS", "0"))
+LLM_BREAKER_FAILURES = int(os.getenv("ASSISTLEG_LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN_S = float(os.getenv("ASSISTLEG_LLM_BREAKER_COOLDOWN", "30"))
+# Conexiones HTTP keep-alive compartidas por todos los clientes de Groq
+LLM_POOL_SIZE = int(os.getenv("ASSISTLEG_LLM_POOL_SIZE", "20"))
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMUnavailable(RuntimeError):
+    """Ningún modelo disponible: breakers abiertos o reintentos agotados."""
+
+    status_code = 503
+
+
+class LLMThrottled(LLMUnavailable):
+    """La cuota local del modelo no deja hacer la llamada a tiempo."""
+
+    status_code = 429
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Errores transitorios: vale la pena repetir la petición (o ir al respaldo)."""
+    if isinstance(exc, LLMThrottled):
+        return True
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    status = _status_code(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    # groq.APIConnectionError / APITimeoutError no traen código de estado
+    return type(exc).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+def _retry_after_s(exc: BaseException) -> Optional[float]:
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_s(attempt: int, exc: Optional[BaseException] = None) -> float:
+    """Espera antes del reintento `attempt` (0, 1, ...): jitter completo, o Retry-After."""
+    cap = LLM_BACKOFF_MAX_MS / 1000
+    retry_after = _retry_after_s(exc) if exc is not None else None
+    if retry_after is not None:
+        return min(cap, retry_after)
+    return random.uniform(0, min(cap, LLM_BACKOFF_BASE_MS / 1000 * 2 ** attempt))
+
+
+# POOL HTTP COMPARTIDO
+
+_http_lock = threading.Lock()
+_http_clients: Dict[str, Any] = {}
+
+
+def shared_http_clients():
+    """(httpx.Client, httpx.AsyncClient) con keep-alive, creados en el primer uso."""
+    with _http_lock:
+        if not _http_clients:
+            import httpx
+
+            limits = httpx.Limits(max_connections=LLM_POOL_SIZE,
+                                  max_keepalive_connections=LLM_POOL_SIZE, keepalive_expiry=30.0)
+            timeout = httpx.Timeout(LLM_TIMEOUT_S, connect=5.0)
+            _http_clients["sync"] = httpx.Client(limits=limits, timeout=timeout)
+            _http_clients["async"] = httpx.AsyncClient(limits=limits, timeout=timeout)
+        return _http_clients["sync"], _http_clients["async"]
+
+
+# LIMITADORES
+
+class TokenBucket:
+    """
+    `rate` unidades por segundo, hasta `capacity` acumuladas. reserve() no
+    bloquea: descuenta ya y devuelve cuánto esperar antes de usar la reserva
+    (el saldo puede quedar negativo y los siguientes esperan más).
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float, max_wait_s: float) -> Optional[float]:
+        """Segundos de espera, o None (sin descontar) si superaría max_wait_s."""
+        with self._lock:
+            self._refill(time.monotonic())
+            amount = min(amount, self.capacity)
+            wait_s = max(0.0, amount - self.tokens) / self.rate
+            if wait_s > max_wait_s:
+                return None
+            self.tokens -= amount
+            return wait_s
+
+    def refund(self, amount: float):
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class ConcurrencyLimiter:
+    """Semáforo que sirve a hilos (acquire) y a corrutinas (aacquire)."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            if self.in_flight >= self.limit:
+                return False
+            self.in_flight += 1
+            return True
+
+    def acquire(self, timeout_s: float) -> bool:
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.in_flight < self.limit, timeout_s):
+                return False
+            self.in_flight += 1
+            return True
+
+    async def aacquire(self, timeout_s: float) -> bool:
+        # Sin bloquear el event loop: se reintenta cada pocos ms
+        deadline = time.monotonic() + timeout_s
+        while not self.try_acquire():
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.005)
+        return True
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+
+class CircuitBreaker:
+    """
+    closed → (N fallos seguidos) → open → (cooldown) → half_open → 1 prueba.
+    La prueba caduca al cabo de otro cooldown aunque nadie informe de su
+    resultado (p. ej. el cliente cerró el streaming).
+    """
+
+    def __init__(self, failures: int = LLM_BREAKER_FAILURES, cooldown_s: float = LLM_BREAKER_COOLDOWN_S):
+        self.max_failures = failures
+        self.cooldown_s = cooldown_s
+        self.failures = 0
+        self.state = "closed"
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._trial_started = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        if self.max_failures <= 0:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            if self.state == "open" and now - self._opened_at >= self.cooldown_s:
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and (not self._trial_in_flight
+                                              or now - self._trial_started >= self.cooldown_s):
+                self._trial_in_flight = True
+                self._trial_started = now
+                return True
+            return False
+
+    def cancel_trial(self):
+        """La prueba no llegó a hacerse (p. ej. cuota local agotada)."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.state = "closed"
+            self._trial_in_flight = False
+
+    def record_failure(self) -> bool:
+        """True si este fallo abre el circuito."""
+        if self.max_failures <= 0:
+            return False
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.max_failures):
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                return True
+            return False
+
+
+class _Target:
+    """Un modelo con su cuota y su breaker."""
+
+    def __init__(self, name: str, model: BaseChatModel, rpm: int, tpm: int):
+        self.name = name
+        self.model = model
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.breaker = CircuitBreaker()
+
+    def reserve(self, cost: int, max_wait_s: float) -> Optional[float]:
+        """Espera necesaria para respetar la cuota, o None si no cabe a tiempo."""
+        waits = []
+        if self.requests is not None:
+            wait_s = self.requests.reserve(1, max_wait_s)
+            if wait_s is None:
+                return None
+            waits.append(wait_s)
+        if self.tokens is not None:
+            wait_s = self.tokens.reserve(cost, max_wait_s)
+            if wait_s is None:
+                if self.requests is not None:
+                    self.requests.refund(1)
+                return None
+            waits.append(wait_s)
+        return max(waits, default=0.0)
+
+    def refund(self, cost: int):
+        """Devuelve una reserva que al final no se usó."""
+        if self.requests is not None:
+            self.requests.refund(1)
+        if self.tokens is not None:
+            self.tokens.refund(min(cost, self.tokens.capacity))
+
+
+_hedge_executor: Optional[ThreadPoolExecutor] = None
+_hedge_lock = threading.Lock()
+
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_executor
+    with _hedge_lock:
+        if _hedge_executor is None:
+            workers = 2 * LLM_MAX_CONCURRENCY if LLM_MAX_CONCURRENCY > 0 else 32
+            _hedge_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="assistleg-llm")
+        return _hedge_executor
+
+
+class ResilientChatModel(BaseChatModel):
+    """
+    Envuelve `primary` (y `fallback`, si lo hay) con cuota, límite de
+    concurrencia, reintentos, hedging y circuit breaker. Se usa como
+    cualquier chat model: invoke / ainvoke / stream / astream.
+    """
+
+    primary: BaseChatModel
+    primary_name: str
+    fallback: Optional[BaseChatModel] = None
+    fallback_name: str = ""
+    rpm: int = 0
+    tpm: int = 0
+    max_concurrency: int = 0
+    max_retries: int = LLM_MAX_RETRIES
+    timeout_s: float = LLM_TIMEOUT_S
+    hedge_ms: float = LLM_HEDGE_MS
+    queue_timeout_s: float = LLM_QUEUE_TIMEOUT_S
+
+    _targets: List[_Target] = PrivateAttr()
+    _slots: Optional[ConcurrencyLimiter] = PrivateAttr()
+    _events: Counter = PrivateAttr()
+    _events_lock: Any = PrivateAttr()
+
+    def __init__(self, **data: Any):
+        super().__init__(**data)
+        self._targets = [_Target(self.primary_name, self.primary, self.rpm, self.tpm)]
+        if self.fallback is not None:
+            self._targets.append(_Target(self.fallback_name, self.fallback, self.rpm, self.tpm))
+        self._slots = ConcurrencyLimiter(self.max_concurrency) if self.max_concurrency > 0 else None
+        self._events = Counter()
+        self._events_lock = threading.Lock()
+
+    @property
+    def _llm_type(self) -> str:
+        return "assistleg-resilient"
+
+    # Contadores
+
+    def _event(self, target: _Target, event: str):
+        with self._events_lock:
+            self._events[event] += 1
+        metrics.inc("assistleg_llm_events_total", {"model": target.name, "event": event})
+
+    def stats(self) -> Dict[str, Any]:
+        with self._events_lock:
+            events = dict(self._events)
+        return {
+            "events": events,
+            "in_flight": self._slots.in_flight if self._slots else None,
+            "breakers": {t.name: t.breaker.state for t in self._targets},
+        }
+
+    # Cuota y concurrencia
+
+    @staticmethod
+    def _cost(messages: List[BaseMessage]) -> int:
+        return sum(count_tokens(str(m.content)) for m in messages) + LLM_OUTPUT_RESERVE_TOKENS
+
+    def _admit(self, target: _Target, cost: int) -> float:
+        wait_s = target.reserve(cost, self.queue_timeout_s)
+        if wait_s is None:
+            self._event(target, "throttle")
+            raise LLMThrottled(f"Cuota local de {target.name} agotada")
+        if wait_s > 0:
+            self._event(target, "queued")
+        return wait_s
+
+    def _acquire_slot(self):
+        if self._slots is not None and not self._slots.acquire(self.queue_timeout_s):
+            raise LLMThrottled("Demasiadas llamadas al LLM en vuelo")
+
+    async def _aacquire_slot(self):
+        if self._slots is not None and not await self._slots.aacquire(self.queue_timeout_s):
+            raise LLMThrottled("Demasiadas llamadas al LLM en vuelo")
+
+    def _release_slot(self, *_):
+        if self._slots is not None:
+            self._slots.release()
+
+    # Resultado de un intento
+
+    def _failed(self, target: _Target, exc: BaseException):
+        if isinstance(exc, LLMThrottled):
+            target.breaker.cancel_trial()
+            return
+        self._event(target, "timeout" if isinstance(exc, TimeoutError) or "Timeout" in type(exc).__name__
+                    else "error")
+        if not is_retryable(exc):
+            # El modelo respondió (p. ej. un 400): el servicio está sano
+            target.breaker.record_success()
+        elif target.breaker.record_failure():
+            self._event(target, "breaker_opened")
+            logger.warning("Circuito abierto para %s tras %s fallos", target.name, target.breaker.failures)
+
+    def _succeeded(self, target: _Target):
+        target.breaker.record_success()
+        self._event(target, "success")
+
+    def _attempts(self, target: _Target):
+        """Índices de intento mientras el breaker lo permita."""
+        for attempt in range(self.max_retries + 1):
+            if not target.breaker.allow():
+                self._event(target, "breaker_open")
+                return
+            yield attempt
+
+    def _next_target(self, index: int, exc: Optional[BaseException]):
+        if exc is not None and not is_retryable(exc):
+            raise exc
+        if index + 1 < len(self._targets):
+            self._event(self._targets[index + 1], "fallback")
+            logger.warning("LLM %s no disponible (%s): se usa %s", self._targets[index].name,
+                           type(exc).__name__ if exc else "circuito abierto", self._targets[index + 1].name)
+
+    @staticmethod
+    def _give_up(exc: Optional[BaseException]):
+        if exc is not None:
+            raise exc
+        raise LLMUnavailable("LLM no disponible: circuito abierto")
+
+    # Llamadas
+
+    def _call_once(self, target: _Target, messages, stop, kwargs):
+        return target.model.invoke(messages, stop=stop, **kwargs)
+
+    def _try_hedge_slot(self, target: _Target, cost: int) -> bool:
+        """Cuota y hueco para la segunda petición, solo si los hay ya mismo."""
+        if target.reserve(cost, 0.0) is None:
+            return False
+        if self._slots is not None and not self._slots.try_acquire():
+            target.refund(cost)
+            return False
+        return True
+
+    def _hedged(self, target: _Target, messages, stop, kwargs, cost: int):
+        """
+        Si la primera petición tarda más de hedge_ms, se lanza otra y gana la
+        primera en responder. Recibe el hueco de la primera: cada petición
+        libera el suyo al terminar, también la que pierde y sigue en vuelo.
+        """
+        pool = _get_hedge_executor()
+        try:
+            first = pool.submit(contextvars.copy_context().run, self._call_once, target, messages, stop, kwargs)
+        except BaseException:
+            self._release_slot()
+            raise
+        first.add_done_callback(self._release_slot)
+        try:
+            return first.result(timeout=self.hedge_ms / 1000)
+        except FutureTimeout:
+            pass
+
+        if not self._try_hedge_slot(target, cost):
+            return first.result(timeout=self.timeout_s)
+        self._event(target, "hedge")
+        second = pool.submit(contextvars.copy_context().run, self._call_once, target, messages, stop, kwargs)
+        second.add_done_callback(self._release_slot)
+
+        done, _ = wait([first, second], timeout=self.timeout_s, return_when=FIRST_COMPLETED)
+        for future in (first, second):
+            if future in done and future.exception() is None:
+                if future is second:
+                    self._event(target, "hedge_win")
+                return future.result()
+        pending = [f for f in (first, second) if f not in done]
+        if pending:
+            return pending[0].result(timeout=self.timeout_s)
+        return first.result()
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        cost = self._cost(messages)
+        last_exc: Optional[BaseException] = None
+        for index, target in enumerate(self._targets):
+            for attempt in self._attempts(target):
+                if attempt:
+                    self._event(target, "retry")
+                    time.sleep(backoff_s(attempt - 1, last_exc))
+                try:
+                    time.sleep(self._admit(target, cost))
+                    self._acquire_slot()
+                    if self.hedge_ms > 0:
+                        response = self._hedged(target, messages, stop, kwargs, cost)
+                    else:
+                        try:
+                            response = self._call_once(target, messages, stop, kwargs)
+                        finally:
+                            self._release_slot()
+                except FutureTimeout:
+                    last_exc = TimeoutError(f"{target.name} no respondió en {self.timeout_s}s")
+                    self._failed(target, last_exc)
+                except Exception as exc:
+                    last_exc = exc
+                    self._failed(target, exc)
+                    if not is_retryable(exc) or isinstance(exc, LLMThrottled):
+                        break
+                else:
+                    self._succeeded(target)
+                    return ChatResult(generations=[ChatGeneration(message=response)])
+            self._next_target(index, last_exc)
+        self._give_up(last_exc)
+
+    async def _acall_once(self, target: _Target, messages, stop, kwargs):
+        return await asyncio.wait_for(target.model.ainvoke(messages, stop=stop, **kwargs), self.timeout_s)
+
+    async def _ahedged(self, target: _Target, messages, stop, kwargs, cost: int):
+        first = asyncio.ensure_future(self._acall_once(target, messages, stop, kwargs))
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_ms / 1000)
+        if done:
+            return first.result()
+
+        if not self._try_hedge_slot(target, cost):
+            return await first
+        self._event(target, "hedge")
+        second = asyncio.ensure_future(self._acall_once(target, messages, stop, kwargs))
+        try:
+            pending = {first, second}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self._event(target, "hedge_win")
+                        return task.result()
+            return first.result()
+        finally:
+            for task in (first, second):
+                task.cancel()
+            self._release_slot()
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        cost = self._cost(messages)
+        last_exc: Optional[BaseException] = None
+        for index, target in enumerate(self._targets):
+            for attempt in self._attempts(target):
+                if attempt:
+                    self._event(target, "retry")
+                    await asyncio.sleep(backoff_s(attempt - 1, last_exc))
+                try:
+                    await asyncio.sleep(self._admit(target, cost))
+                    await self._aacquire_slot()
+                    try:
+                        if self.hedge_ms > 0:
+                            response = await self._ahedged(target, messages, stop, kwargs, cost)
+                        else:
+                            response = await self._acall_once(target, messages, stop, kwargs)
+                    finally:
+                        self._release_slot()
+                except Exception as exc:
+                    last_exc = exc
+                    self._failed(target, exc)
+                    if not is_retryable(exc) or isinstance(exc, LLMThrottled):
+                        break
+                else:
+                    self._succeeded(target)
+                    return ChatResult(generations=[ChatGeneration(message=response)])
+            self._next_target(index, last_exc)
+        self._give_up(last_exc)
+
+    # Streaming: reintento o respaldo solo antes del primer fragmento
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        cost = self._cost(messages)
+        last_exc: Optional[BaseException] = None
+        for index, target in enumerate(self._targets):
+            for attempt in self._attempts(target):
+                if attempt:
+                    self._event(target, "retry")
+                    time.sleep(backoff_s(attempt - 1, last_exc))
+                started = False
+                try:
+                    time.sleep(self._admit(target, cost))
+                    self._acquire_slot()
+                    try:
+                        for chunk in target.model.stream(messages, stop=stop, **kwargs):
+                            started = True
+                            yield ChatGenerationChunk(message=chunk)
+                    finally:
+                        self._release_slot()
+                except Exception as exc:
+                    last_exc = exc
+                    self._failed(target, exc)
+                    if started:
+                        raise
+                    if not is_retryable(exc) or isinstance(exc, LLMThrottled):
+                        break
+                else:
+                    self._succeeded(target)
+                    return
+            self._next_target(index, last_exc)
+        self._give_up(last_exc)
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        cost = self._cost(messages)
+        last_exc: Optional[BaseException] = None
+        for index, target in enumerate(self._targets):
+            for attempt in self._attempts(target):
+                if attempt:
+                    self._event(target, "retry")
+                    await asyncio.sleep(backoff_s(attempt - 1, last_exc))
+                started = False
+                try:
+                    await asyncio.sleep(self._admit(target, cost))
+                    await self._aacquire_slot()
+                    try:
+                        async for chunk in target.model.astream(messages, stop=stop, **kwargs):
+                            started = True
+                            yield ChatGenerationChunk(message=chunk)
+                    finally:
+                        self._release_slot()
+                except Exception as exc:
+                    last_exc = exc
+                    self._failed(target, exc)
+                    if started:
+                        raise
+                    if not is_retryable(exc) or isinstance(exc, LLMThrottled):
+                        break
+                else:
+                    self._succeeded(target)
+                    return
+            self._next_target(index, last_exc)
+        self._give_up(last_exc)
@@ -0,0 +1,220 @@
+# backend/api/llm_replay.py
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+logger = logging.getLogger(__name__)
+
+
+# GRABACIÓN Y REPRODUCCIÓN DE RESPUESTAS DEL LLM
+# - "record": cada llamada va al LLM real (Groq) y la respuesta se guarda,
+#   con su latencia y su uso de tokens, en REPLAY_DIR/<hash[:2]>/<hash>.json.
+# - "replay": responde desde esas grabaciones sin red, esperando la latencia
+#   grabada (ASSISTLEG_LLM_REPLAY_LATENCY=0 para responder al instante).
+# La clave es el hash del modelo y del prompt completo (tipo + contenido de
+# cada mensaje): mismo contexto recuperado y mismo historial, misma respuesta.
+# Así una prueba de carga reproduce respuestas y tiempos reales de Groq sin
+# gastar su cuota.
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+REPLAY_DIR = Path(os.getenv("ASSISTLEG_LLM_REPLAY_DIR", str(BACKEND_DIR / "llm_recordings")))
+REPLAY_LATENCY = os.getenv("ASSISTLEG_LLM_REPLAY_LATENCY", "1") != "0"
+# Prompt sin grabación en modo replay: "error" (ReplayMiss) o "fake" (LLM falso)
+REPLAY_MISS = os.getenv("ASSISTLEG_LLM_REPLAY_MISS", "error")
+
+MODES = ("record", "replay")
+
+
+class ReplayMiss(LookupError):
+    """No hay grabación para este prompt."""
+
+
+def prompt_hash(messages: List[BaseMessage], model: str) -> str:
+    payload = json.dumps(
+        {"model": model, "messages": [[m.type, m.content] for m in messages]},
+        ensure_ascii=False, sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RecordingStore:
+    """Un JSON por prompt; escribir uno no bloquea ni corrompe a los demás."""
+
+    def __init__(self, root: Path = REPLAY_DIR):
+        self.root = Path(root)
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        if not path.exists():
+            return None
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def put(self, key: str, record: Dict[str, Any]):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def __len__(self):
+        return sum(1 for _ in self.root.glob("*/*.json")) if self.root.is_dir() else 0
+
+
+class RecordReplayChatModel(BaseChatModel):
+    """
+    mode="record": delega en `upstream` y graba. mode="replay": lee de
+    `store`; si falta la grabación usa `upstream` (si lo hay) o lanza
+    ReplayMiss.
+    """
+
+    mode: str
+    model_name: str
+    store: Any
+    upstream: Optional[BaseChatModel] = None
+    replay_latency: bool = REPLAY_LATENCY
+
+    @property
+    def _llm_type(self) -> str:
+        return f"assistleg-{self.mode}"
+
+    # Grabaciones
+
+    def _lookup(self, messages: List[BaseMessage]):
+        key = prompt_hash(messages, self.model_name)
+        if self.mode == "record":
+            return key, None
+        record = self.store.get(key)
+        if record is None:
+            if self.upstream is None:
+                raise ReplayMiss(f"Sin grabación para el prompt {key[:12]} en {self.store.root}")
+            logger.warning("Prompt %s sin grabación: responde el LLM de respaldo", key[:12])
+        return key, record
+
+    def _save(self, key: str, messages: List[BaseMessage], content: str, usage: Any, latency_s: float):
+        question = next((str(m.content) for m in reversed(messages) if m.type == "human"), "")
+        self.store.put(key, {
+            "model": self.model_name,
+            "content": content,
+            "usage": dict(usage) if usage else None,
+            "latency_s": round(latency_s, 4),
+            "recorded_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "question": question[:300],
+        })
+
+    def _replayed(self, record: Dict[str, Any]) -> AIMessage:
+        return AIMessage(content=record["content"], usage_metadata=record.get("usage") or None)
+
+    def _delay(self, record: Dict[str, Any]) -> float:
+        return float(record.get("latency_s") or 0.0) if self.replay_latency else 0.0
+
+    @staticmethod
+    def _words(record: Dict[str, Any]) -> List[ChatGenerationChunk]:
+        words = record["content"].split(" ")
+        chunks = [AIMessageChunk(content=w if i == 0 else " " + w) for i, w in enumerate(words)]
+        if record.get("usage"):
+            chunks[-1].usage_metadata = record["usage"]
+        return [ChatGenerationChunk(message=c) for c in chunks]
+
+    # Llamadas
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        key, record = self._lookup(messages)
+        if record is None:
+            start = time.perf_counter()
+            response = self.upstream.invoke(messages, stop=stop, **kwargs)
+            if self.mode == "record":
+                self._save(key, messages, response.content, response.usage_metadata,
+                           time.perf_counter() - start)
+            return ChatResult(generations=[ChatGeneration(message=response)])
+
+        time.sleep(self._delay(record))
+        return ChatResult(generations=[ChatGeneration(message=self._replayed(record))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        key, record = self._lookup(messages)
+        if record is None:
+            start = time.perf_counter()
+            response = await self.upstream.ainvoke(messages, stop=stop, **kwargs)
+            if self.mode == "record":
+                self._save(key, messages, response.content, response.usage_metadata,
+                           time.perf_counter() - start)
+            return ChatResult(generations=[ChatGeneration(message=response)])
+
+        await asyncio.sleep(self._delay(record))
+        return ChatResult(generations=[ChatGeneration(message=self._replayed(record))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        key, record = self._lookup(messages)
+        if record is None:
+            start = time.perf_counter()
+            pieces, usage = [], None
+            for chunk in self.upstream.stream(messages, stop=stop, **kwargs):
+                pieces.append(str(chunk.content))
+                usage = chunk.usage_metadata or usage
+                yield ChatGenerationChunk(message=chunk)
+            if self.mode == "record":
+                self._save(key, messages, "".join(pieces), usage, time.perf_counter() - start)
+            return
+
+        chunks = self._words(record)
+        for chunk in chunks:
+            time.sleep(self._delay(record) / len(chunks))
+            yield chunk
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        key, record = self._lookup(messages)
+        if record is None:
+            start = time.perf_counter()
+            pieces, usage = [], None
+            async for chunk in self.upstream.astream(messages, stop=stop, **kwargs):
+                pieces.append(str(chunk.content))
+                usage = chunk.usage_metadata or usage
+                yield ChatGenerationChunk(message=chunk)
+            if self.mode == "record":
+                self._save(key, messages, "".join(pieces), usage, time.perf_counter() - start)
+            return
+
+        chunks = self._words(record)
+        for chunk in chunks:
+            await asyncio.sleep(self._delay(record) / len(chunks))
+            yield chunk
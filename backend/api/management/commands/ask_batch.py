@@ -0,0 +1,55 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.batch import BATCH_LLM_CONCURRENCY, BatchError, run_batch
+
+
+def _read_items(path: str):
+    """JSONL (una pregunta por línea), una lista JSON o {"items": [...]}."""
+    with (sys.stdin if path == "-" else open(path, encoding="utf-8")) as f:
+        text = f.read()
+    try:
+        data = json.loads(text)
+    except ValueError:
+        try:
+            return [json.loads(line) for line in text.splitlines() if line.strip()]
+        except ValueError as exc:
+            raise CommandError(f"Entrada inválida (ni JSON ni JSONL): {exc}")
+    return data.get("items") if isinstance(data, dict) else data
+
+
+class Command(BaseCommand):
+    help = "Responde un lote de preguntas {id, topic, question} y escribe los resultados en JSONL."
+
+    def add_arguments(self, parser):
+        parser.add_argument("input", help="Archivo JSONL o JSON con las preguntas ('-' para stdin)")
+        parser.add_argument("--output", "-o", help="Archivo JSONL de salida (por defecto, stdout)")
+        parser.add_argument("--llm-concurrency", type=int, default=BATCH_LLM_CONCURRENCY,
+                            help="Llamadas al LLM en vuelo")
+        parser.add_argument("--max-items", type=int, default=None, help="Límite de preguntas del lote")
+
+    def handle(self, *args, **options):
+        items = _read_items(options["input"])
+        kwargs = {"max_items": options["max_items"]} if options["max_items"] else {}
+        try:
+            results = run_batch(items, options["llm_concurrency"], **kwargs)
+        except BatchError as exc:
+            raise CommandError(str(exc))
+
+        out = open(options["output"], "w", encoding="utf-8") if options["output"] else self.stdout
+        summary = {}
+        try:
+            for result in results:
+                if "summary" in result:
+                    summary = result["summary"]
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+        finally:
+            if options["output"]:
+                out.close()
+
+        self.stderr.write(json.dumps(summary, ensure_ascii=False))
+        if summary.get("error"):
+            raise CommandError(f"{summary['error']} preguntas con error")
@@ -0,0 +1,19 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.config_llm import llm_provider, HEALTH_CHECK_PROMPT
+
+
+class Command(BaseCommand):
+    help = "Hace una llamada real al LLM (Groq) para comprobar la conexión y medir la latencia."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--prompt", default=HEALTH_CHECK_PROMPT)
+
+    def handle(self, *args, **options):
+        result = llm_provider.health_check(options["prompt"])
+        self.stdout.write(json.dumps(result, ensure_ascii=False, indent=2))
+
+        if not result["ok"]:
+            raise CommandError("El LLM no respondió correctamente.")
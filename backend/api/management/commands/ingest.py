@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from api.create_vectorstores import DEFAULT_BATCH_SIZE, DEFAULT_SPLITTER, DEFAULT_WORKERS, SPLITTERS, ingest
+from api.vector_snapshot import SNAPSHOT_FORMATS
+
+
+class Command(BaseCommand):
+    help = "Indexa (de forma incremental) los documentos de backend/rags/ en sus vectorstores."
+
+    def add_arguments(self, parser):
+        parser.add_argument("folders", nargs="*", help="Carpetas de backend/rags/ (por defecto, todas)")
+        parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument("--full", action="store_true",
+                            help="Ignorar el manifiesto y reconstruir desde cero")
+        parser.add_argument("--splitter", choices=SPLITTERS, default=DEFAULT_SPLITTER)
+        parser.add_argument("--snapshot-format", choices=[*SNAPSHOT_FORMATS, "none"],
+                            help="Instantánea mapeable del índice (por defecto float16)")
+
+    def handle(self, *args, **options):
+        ingest(options["folders"], options["workers"], options["batch_size"], options["full"],
+               options["splitter"], options["snapshot_format"])
@@ -0,0 +1,177 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from api import rag_loader
+from api.vector_index import NumPyVectorIndex
+from api.vector_snapshot import DEFAULT_SNAPSHOT_FORMAT, SNAPSHOT_FORMATS, export_snapshot, load_snapshot
+from api.vectorstore_versions import (
+    begin_version, discard_version, publish_version, read_pointer, topic_lock, version_path,
+)
+
+BACKEND_DIR = Path(__file__).resolve().parents[3]
+
+# Un proceso nuevo por formato: carga el índice, hace una búsqueda (toca
+# todas las páginas de la matriz) y mide tiempos y memoria residente.
+# RssAnon es memoria privada del worker; RssFile, páginas de archivos
+# mapeados que comparten todos los procesos a través de la caché del SO.
+_PROBE = """
+import json, sys, time
+import numpy as np
+
+def rss():
+    out = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "RssAnon", "RssFile"):
+                    out[key] = round(int(value.split()[0]) / 1024, 2)
+    except OSError:
+        import resource
+        out["VmRSS"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2)
+    return out
+
+mode, persist, directory, dim = sys.argv[1], sys.argv[2], sys.argv[3], int(sys.argv[4])
+import chromadb
+from langchain_community.vectorstores import Chroma
+from api.vector_index import NumPyVectorIndex
+from api.vector_snapshot import load_snapshot
+
+vector = np.random.default_rng(0).normal(size=dim).astype(np.float32)
+before = rss()
+start = time.perf_counter()
+if mode in ("chroma", "numpy"):
+    store = Chroma(client=chromadb.PersistentClient(path=persist), persist_directory=persist)
+    if mode == "numpy":
+        index = NumPyVectorIndex.from_collection(store._collection)
+else:
+    index = load_snapshot(persist, directory, check_fresh=False)
+load_ms = (time.perf_counter() - start) * 1000
+after_load = rss()
+
+start = time.perf_counter()
+if mode == "chroma":
+    store.similarity_search_by_vector(vector.tolist(), k=5)
+else:
+    [index.document(p) for p, _ in index.search(vector, 5)]
+query_ms = (time.perf_counter() - start) * 1000
+print(json.dumps({"load_ms": round(load_ms, 2), "first_query_ms": round(query_ms, 2),
+                  "rss_before_mib": before, "rss_after_load_mib": after_load, "rss_after_query_mib": rss()}))
+"""
+
+
+def _probe(mode: str, persist_dir: Path, directory: Path, dim: int) -> dict:
+    env = dict(os.environ, PYTHONPATH=str(BACKEND_DIR))
+    out = subprocess.run(
+        [sys.executable, "-c", _PROBE, mode, str(persist_dir), str(directory), str(dim)],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    if out.returncode != 0:
+        return {"error": out.stderr.strip().splitlines()[-1] if out.stderr.strip() else out.returncode}
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def _directory_bytes(directory: Path) -> int:
+    return sum(p.stat().st_size for p in directory.rglob("*") if p.is_file())
+
+
+def _overlap_at_k(reference: NumPyVectorIndex, candidate: NumPyVectorIndex, queries, k: int) -> float:
+    hits = 0
+    for vector in queries:
+        expected = {p for p, _ in reference.search(vector, k)}
+        hits += len(expected & {p for p, _ in candidate.search(vector, k)})
+    return round(hits / (len(queries) * k), 4)
+
+
+class Command(BaseCommand):
+    help = ("Exporta la instantánea mapeable del índice vectorial de cada tema (la que leen los workers "
+            "con ASSISTLEG_VECTOR_ENGINE=numpy) o, con --report, compara carga, RSS y tamaño por formato.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("topics", nargs="*", help="Temas <tema>_vs (por defecto, todos)")
+        parser.add_argument("--format", choices=SNAPSHOT_FORMATS, default=DEFAULT_SNAPSHOT_FORMAT)
+        parser.add_argument("--report", action="store_true",
+                            help="No exportar: medir chroma, numpy y cada formato en procesos nuevos")
+        parser.add_argument("--queries", type=int, default=100, help="Consultas para la paridad del --report")
+        parser.add_argument("--k", type=int, default=5)
+        parser.add_argument("--json", help="Guardar el --report en este archivo")
+
+    def handle(self, *args, **options):
+        available = rag_loader.list_available_topics()
+        topics = options["topics"] or available
+        unknown = [t for t in topics if t not in available]
+        if unknown:
+            raise CommandError(f"Temas desconocidos: {', '.join(unknown)}")
+        if not topics:
+            raise CommandError("No hay vectorstores (ejecuta manage.py ingest).")
+
+        if not options["report"]:
+            for topic in topics:
+                version, header = self._export_topic(topic, options["format"])
+                self.stdout.write(f"{topic} (versión {version}): {json.dumps(header, ensure_ascii=False)}")
+            self.stdout.write("Si el servidor está corriendo: POST /api/registry/invalidate/")
+            return
+
+        report = [self._report_topic(topic, options) for topic in topics]
+        self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+        if options["json"]:
+            with open(options["json"], "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+
+    def _export_topic(self, topic: str, fmt: str):
+        """
+        Exporta la instantánea en una versión nueva (copia de la vigente) y la
+        publica: la vigente no se toca mientras los workers la están leyendo.
+        """
+        import chromadb
+        from langchain_community.vectorstores import Chroma
+
+        topic_dir = rag_loader.VECTORSTORES_PATH / topic
+        with topic_lock(topic_dir):
+            previous = read_pointer(topic_dir) or {}
+            version, build_dir = begin_version(topic_dir)
+            try:
+                # La colección de la copia: la instantánea queda al día con su manifiesto
+                store = Chroma(client=chromadb.PersistentClient(path=str(build_dir)),
+                               persist_directory=str(build_dir))
+                header = export_snapshot(NumPyVectorIndex.from_collection(store._collection), build_dir, fmt)
+            except BaseException:
+                discard_version(build_dir)
+                raise
+            publish_version(topic_dir, version, build_dir, folder=previous.get("folder", topic.removesuffix("_vs")),
+                            chunks=header["documents"], snapshot=fmt)
+        return version, header
+
+    def _report_topic(self, topic: str, options) -> dict:
+        persist_dir = version_path(rag_loader.VECTORSTORES_PATH / topic)
+        reference = NumPyVectorIndex.from_collection(rag_loader.get_vectorstore(topic)._collection)
+        dim = int(reference.matrix.shape[1]) if len(reference) else 0
+        result = {"topic": topic, "documents": len(reference), "dim": dim, "formats": {}}
+        if not len(reference):
+            return result
+
+        rng = np.random.default_rng(0)
+        positions = rng.choice(len(reference), min(options["queries"], len(reference)), replace=False)
+        queries = reference.matrix[positions] + rng.normal(scale=0.02, size=(len(positions), dim)).astype(np.float32)
+
+        result["formats"]["chroma"] = _probe("chroma", persist_dir, persist_dir, dim)
+        result["formats"]["numpy"] = _probe("numpy", persist_dir, persist_dir, dim)
+        with tempfile.TemporaryDirectory(prefix="assistleg-snapshot-") as tmp:
+            for fmt in SNAPSHOT_FORMATS:
+                directory = Path(tmp) / fmt
+                export_snapshot(reference, persist_dir, fmt, dest=directory)
+                mapped = load_snapshot(persist_dir, directory, check_fresh=False)
+                result["formats"][fmt] = {
+                    "disk_bytes": _directory_bytes(directory),
+                    f"overlap@{options['k']}_vs_float32": _overlap_at_k(reference, mapped, queries, options["k"]),
+                    **_probe("snapshot", persist_dir, directory, dim),
+                }
+                del mapped
+        return result
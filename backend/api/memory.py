@@ -1,25 +1,274 @@
 # backend/api/memory.py
 
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Sequence
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
 from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_community.chat_message_histories import ChatMessageHistory
 
-# Una sola instancia de ChatMessageHistory para toda la app.
-_global_history = ChatMessageHistory()
+from api.tokens import CHARS_PER_TOKEN, count_tokens
+from api.tracing import span
+
+
+# CONFIGURACIÓN
+# Cada sesión (session_id) tiene su propio historial, acotado en turnos y
+# en tokens, para que el prompt no crezca con el tráfico total del servidor.
+
+MEMORY_BACKEND = os.getenv("ASSISTLEG_MEMORY_BACKEND", "memory")   # "memory" | "sqlite"
+MAX_TURNS = int(os.getenv("ASSISTLEG_MEMORY_MAX_TURNS", "20"))
+MAX_TOKENS = int(os.getenv("ASSISTLEG_MEMORY_MAX_TOKENS", "4000"))
+MAX_SESSIONS = int(os.getenv("ASSISTLEG_MEMORY_MAX_SESSIONS", "1000"))
+SESSION_TTL_S = int(os.getenv("ASSISTLEG_MEMORY_TTL", "3600"))
+
+DEFAULT_SESSION_ID = "web_user_1"
+
+
+def _trim(messages: List[BaseMessage], max_turns: int, max_tokens: int) -> int:
+    """
+    Devuelve cuántos mensajes antiguos hay que descartar para respetar los
+    límites. Siempre se conserva el último turno (pregunta + respuesta).
+    """
+    drop = max(0, len(messages) - 2 * max_turns)
+    tokens = sum(count_tokens(m.content) for m in messages[drop:])
+    while tokens > max_tokens and len(messages) - drop > 2:
+        tokens -= count_tokens(messages[drop].content)
+        drop += 1
+    return drop
+
+
+class BoundedChatMessageHistory(BaseChatMessageHistory):
+    """Historial en memoria limitado a max_turns turnos y max_tokens tokens."""
+
+    def __init__(self, max_turns: int = MAX_TURNS, max_tokens: int = MAX_TOKENS):
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self._messages: List[BaseMessage] = []
+        self._lock = threading.Lock()
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        with self._lock:
+            return list(self._messages)
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        with span("memory_write", backend="memory"), self._lock:
+            self._messages.extend(messages)
+            drop = _trim(self._messages, self.max_turns, self.max_tokens)
+            if drop:
+                del self._messages[:drop]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._messages = []
+
+
+class InMemoryHistoryStore:
+    """
+    Historiales por sesión en memoria del proceso, con expulsión LRU cuando
+    hay más de max_sessions sesiones y por TTL tras ttl_s sin actividad.
+    """
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, ttl_s: int = SESSION_TTL_S,
+                 max_turns: int = MAX_TURNS, max_tokens: int = MAX_TOKENS):
+        self.max_sessions = max_sessions
+        self.ttl_s = ttl_s
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self._sessions = OrderedDict()   # session_id -> (history, last_access)
+        self._lock = threading.Lock()
+        self._evictions = 0
+        self._expirations = 0
+
+    def _expire(self, now: float):
+        # Las sesiones más antiguas están al principio (orden LRU)
+        while self._sessions:
+            session_id, (_, last_access) = next(iter(self._sessions.items()))
+            if now - last_access <= self.ttl_s:
+                break
+            self._sessions.popitem(last=False)
+            self._expirations += 1
+
+    def get(self, session_id: str) -> BaseChatMessageHistory:
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+
+            entry = self._sessions.pop(session_id, None)
+            history = entry[0] if entry else BoundedChatMessageHistory(self.max_turns, self.max_tokens)
+            self._sessions[session_id] = (history, now)
+
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self._evictions += 1
+
+            return history
+
+    def clear(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            histories = [h for h, _ in self._sessions.values()]
+            messages = [m for h in histories for m in h.messages]
+            return {
+                "backend": "memory",
+                "sessions": len(histories),
+                "messages": len(messages),
+                "approx_tokens": sum(count_tokens(m.content) for m in messages),
+                "bytes": sum(len(m.content.encode("utf-8")) for m in messages),
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+            }
+
+
+class SQLiteChatMessageHistory(BaseChatMessageHistory):
+    """
+    Historial de una sesión guardado en db.sqlite3 (modelo api.ChatMessage).
+    No toca la base de datos al construirse, solo al leer o escribir.
+    """
+
+    def __init__(self, session_id: str, store: "SQLiteHistoryStore"):
+        self.session_id = session_id
+        self.store = store
+
+    @staticmethod
+    def _to_message(row) -> BaseMessage:
+        if row.role == "user":
+            return HumanMessage(content=row.content)
+        return AIMessage(content=row.content)
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        from api.models import ChatMessage
+
+        rows = ChatMessage.objects.filter(session_id=self.session_id).order_by("id")
+        return [self._to_message(row) for row in rows]
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        from api.models import ChatMessage
+
+        with span("memory_write", backend="sqlite"):
+            ChatMessage.objects.bulk_create([
+                ChatMessage(
+                    session_id=self.session_id,
+                    role="user" if m.type == "human" else "assistant",
+                    content=m.content,
+                )
+                for m in messages
+            ])
+
+            rows = list(ChatMessage.objects.filter(session_id=self.session_id).order_by("id"))
+            drop = _trim([self._to_message(r) for r in rows], self.store.max_turns, self.store.max_tokens)
+            if drop:
+                ChatMessage.objects.filter(id__in=[r.id for r in rows[:drop]]).delete()
+
+            self.store.maybe_purge()
+
+    def clear(self) -> None:
+        from api.models import ChatMessage
+
+        ChatMessage.objects.filter(session_id=self.session_id).delete()
+
+
+class SQLiteHistoryStore:
+    """Historiales persistentes en db.sqlite3; sobreviven reinicios del servidor."""
+
+    def __init__(self, ttl_s: int = SESSION_TTL_S,
+                 max_turns: int = MAX_TURNS, max_tokens: int = MAX_TOKENS):
+        self.ttl_s = ttl_s
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self._last_purge = time.monotonic()
+        self._expirations = 0
+
+    def get(self, session_id: str) -> BaseChatMessageHistory:
+        return SQLiteChatMessageHistory(session_id, self)
+
+    def maybe_purge(self):
+        # Limpieza perezosa: como mucho una vez cada décima parte del TTL
+        now = time.monotonic()
+        if now - self._last_purge >= self.ttl_s / 10:
+            self._last_purge = now
+            self.purge_expired()
+
+    def clear(self, session_id: str):
+        self.get(session_id).clear()
+
+    def purge_expired(self) -> int:
+        """Borra las sesiones sin actividad en los últimos ttl_s segundos; devuelve cuántas."""
+        from datetime import timedelta
+
+        from django.db.models import Max
+        from django.utils import timezone
+
+        from api.models import ChatMessage
+
+        cutoff = timezone.now() - timedelta(seconds=self.ttl_s)
+        expired = (
+            ChatMessage.objects.values("session_id")
+            .annotate(last=Max("created_at"))
+            .filter(last__lt=cutoff)
+            .values_list("session_id", flat=True)
+        )
+        expired = list(expired)
+        ChatMessage.objects.filter(session_id__in=expired).delete()
+        self._expirations += len(expired)
+        return len(expired)
+
+    def stats(self) -> dict:
+        from django.db.models.functions import Length
+        from django.db.models import Sum
+
+        from api.models import ChatMessage
+
+        qs = ChatMessage.objects.all()
+        chars = qs.aggregate(total=Sum(Length("content")))["total"] or 0
+        return {
+            "backend": "sqlite",
+            "sessions": qs.values("session_id").distinct().count(),
+            "messages": qs.count(),
+            "approx_tokens": (chars + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN,
+            "chars": chars,
+            "expirations": self._expirations,
+        }
+
+
+STORES = {
+    "memory": InMemoryHistoryStore,
+    "sqlite": SQLiteHistoryStore,
+}
+
+history_store = STORES[MEMORY_BACKEND]()
+
+
+def get_session_history(session_id: str = None) -> BaseChatMessageHistory:
+    """Historial de la sesión indicada (una memoria independiente por usuario/chat)."""
+    return history_store.get(session_id or DEFAULT_SESSION_ID)
+
+def record_turn(session_id: str, question: str, answer: str):
+    """
+    Guarda un turno completo (pregunta + respuesta) en la memoria.
+    Lo usan las rutas que no pasan por RunnableWithMessageHistory (streaming).
+    """
+    history = get_session_history(session_id)
+    history.add_messages([HumanMessage(content=question), AIMessage(content=answer)])
 
-def _get_global_history(_config = None):
-    # Ignoramos cualquier config y devolvemos la misma memoria global.
-    return _global_history
+def memory_stats() -> dict:
+    return history_store.stats()
 
 def with_memory(chain):
     """
-    Envuelve cualquier chain con memoria conversacional global.
-    Configuración clave: `configurable_fields=None` evita que RunnableWithMessageHistory
-    exija que el usuario pase session_id en cada invoke().
+    Envuelve cualquier chain con memoria conversacional POR SESIÓN.
+    El session_id llega en config["configurable"]["session_id"].
     """
     return RunnableWithMessageHistory(
         runnable=chain,
-        get_session_history=lambda config: _get_global_history(config),
+        get_session_history=get_session_history,
         input_messages_key="input",
         history_messages_key="chat_history",
-        configurable_fields=None,  # <-- evita requerir session_id
     )
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_id', models.CharField(max_length=128)),
+                ('role', models.CharField(max_length=16)),
+                ('content', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['session_id', 'id'], name='api_chatmes_session_9d6924_idx'), models.Index(fields=['created_at'], name='api_chatmes_created_ede6cd_idx')],
+            },
+        ),
+    ]
@@ -1,3 +1,19 @@
 from django.db import models
 
-# Create your models here.
+
+class ChatMessage(models.Model):
+    """Mensaje de una conversación (backend de memoria "sqlite", ver api/memory.py)."""
+
+    session_id = models.CharField(max_length=128)
+    role = models.CharField(max_length=16)   # "user" | "assistant"
+    content = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["session_id", "id"]),
+            models.Index(fields=["created_at"]),
+        ]
+
+    def __str__(self):
+        return f"[{self.session_id}] {self.role}: {self.content[:50]}"
@@ -0,0 +1,253 @@
+# backend/api/prompt_builder.py
+
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from api.prompt_templates import assistant_system_prompt, render_chat_history
+from api.tokens import count_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+
+# PRESUPUESTO DE TOKENS DEL PROMPT
+# El prompt total (system + historial + contexto + pregunta) no supera
+# PROMPT_MAX_TOKENS, así la latencia de Groq no crece con la conversación.
+
+PROMPT_MAX_TOKENS = int(os.getenv("ASSISTLEG_PROMPT_MAX_TOKENS", "3000"))
+# Parte del presupuesto libre que se reserva al contexto recuperado (el resto,
+# y lo que el contexto no use, va al historial)
+CONTEXT_SHARE = float(os.getenv("ASSISTLEG_PROMPT_CONTEXT_SHARE", "0.6"))
+# Tope del resumen de turnos antiguos dentro del presupuesto del historial
+SUMMARY_MAX_TOKENS = int(os.getenv("ASSISTLEG_SUMMARY_MAX_TOKENS", "300"))
+# "extractive" (sin llamadas extra, por defecto) o "llm"
+SUMMARY_MODE = os.getenv("ASSISTLEG_SUMMARY_MODE", "extractive")
+
+# Tokens por línea del resumen extractivo
+_SUMMARY_LINE_TOKENS = 40
+# Tokens fijos del template ("Pregunta: ", saltos de línea, roles...)
+_TEMPLATE_OVERHEAD_TOKENS = 20
+_MAX_CACHED_SESSIONS = 1000
+
+_SUMMARY_TEMPLATE = "Resumen de la conversación anterior:\n{summary}\n\nÚltimos mensajes:\n{recent}"
+_SUMMARY_HEADERS_TOKENS = count_tokens(_SUMMARY_TEMPLATE.format(summary="", recent=""))
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def _message_role_content(msg: Any) -> Tuple[str, str]:
+    if isinstance(msg, dict):
+        return msg.get("role", "user"), str(msg.get("content", ""))
+    if hasattr(msg, "type") and hasattr(msg, "content"):
+        return {"human": "user", "ai": "assistant"}.get(msg.type, msg.type), str(msg.content)
+    if isinstance(msg, (list, tuple)) and len(msg) >= 2:
+        return str(msg[0]), str(msg[1])
+    return "user", str(msg)
+
+
+def _message_key(msg: Any) -> str:
+    role, content = _message_role_content(msg)
+    return hashlib.sha1(f"{role}\x00{content}".encode("utf-8")).hexdigest()
+
+
+def _summary_line(msg: Any) -> str:
+    """Resumen extractivo de un mensaje: su primera oración, acotada."""
+    role, content = _message_role_content(msg)
+    first = _SENTENCE_END.split(content.strip(), maxsplit=1)[0]
+    label = "El usuario preguntó" if role == "user" else "El asistente respondió"
+    return f"- {label}: {truncate_to_tokens(first, _SUMMARY_LINE_TOKENS)}"
+
+
+class HistorySummarizer:
+    """
+    Resume incrementalmente los turnos que ya no caben en el presupuesto.
+    El resumen se guarda por sesión: en cada petición solo se procesan los
+    mensajes que no se habían resumido antes.
+    """
+
+    def __init__(self, max_tokens: int = SUMMARY_MAX_TOKENS, mode: str = SUMMARY_MODE):
+        self.max_tokens = max_tokens
+        self.mode = mode
+        self._cache = OrderedDict()   # session_id -> (summary, set(message_keys))
+        self._lock = threading.Lock()
+
+    def summarize(self, session_id: Optional[str], old_messages: List[Any]) -> str:
+        if not old_messages:
+            return ""
+
+        with self._lock:
+            summary, seen = self._cache.pop(session_id, ("", set()))
+
+        keys = [_message_key(m) for m in old_messages]
+        new_messages = [m for m, k in zip(old_messages, keys) if k not in seen]
+        if new_messages:
+            summary = self._fold(summary, new_messages)
+        # Solo hace falta recordar los mensajes que siguen en el historial
+        seen = set(keys)
+
+        if session_id is not None:
+            with self._lock:
+                self._cache[session_id] = (summary, seen)
+                while len(self._cache) > _MAX_CACHED_SESSIONS:
+                    self._cache.popitem(last=False)
+
+        return summary
+
+    def _fold(self, summary: str, new_messages: List[Any]) -> str:
+        if self.mode == "llm":
+            return self._fold_with_llm(summary, new_messages)
+        return self._fold_extractive(summary, new_messages)
+
+    def _fold_extractive(self, summary: str, new_messages: List[Any]) -> str:
+        lines = [line for line in summary.splitlines() if line]
+        lines.extend(_summary_line(m) for m in new_messages)
+        # Si no cabe, se olvidan primero las líneas más antiguas
+        while len(lines) > 1 and count_tokens("\n".join(lines)) > self.max_tokens:
+            lines.pop(0)
+        return truncate_to_tokens("\n".join(lines), self.max_tokens)
+
+    def _fold_with_llm(self, summary: str, new_messages: List[Any]) -> str:
+        from api.config_llm import get_llm
+
+        request = (
+            "Actualiza este resumen de una conversación jurídica incorporando los "
+            "nuevos mensajes. Sé breve y conserva las normas citadas.\n\n"
+            f"Resumen actual:\n{summary or '(vacío)'}\n\n"
+            f"Nuevos mensajes:\n{render_chat_history(new_messages)}"
+        )
+        try:
+            response = get_llm().invoke(request)
+        except Exception as exc:
+            logger.warning("Error resumiendo el historial con el LLM: %r", exc)
+            return self._fold_extractive(summary, new_messages)
+
+        text = getattr(response, "content", str(response))
+        return truncate_to_tokens(text.strip(), self.max_tokens)
+
+    def forget(self, session_id: str):
+        with self._lock:
+            self._cache.pop(session_id, None)
+
+
+history_summarizer = HistorySummarizer()
+
+
+def _pack_context(docs: List[Any], budget: int) -> Tuple[str, int]:
+    """Mete los documentos (en orden de relevancia) hasta agotar el presupuesto."""
+    parts: List[str] = []
+    used = 0
+    for doc in docs:
+        text = str(getattr(doc, "page_content", doc)).strip()
+        if not text:
+            continue
+        tokens = count_tokens(text)
+        if used + tokens > budget:
+            remaining = budget - used
+            # Solo vale la pena un fragmento recortado si queda sitio razonable
+            if remaining > 50:
+                text = truncate_to_tokens(text, remaining)
+                parts.append(text)
+                used += count_tokens(text)
+            break
+        parts.append(text)
+        used += tokens
+    return "\n".join(parts), used
+
+
+def _pack_history(messages: List[Any], budget: int, session_id: Optional[str],
+                  summarizer: HistorySummarizer) -> Tuple[str, Dict[str, int]]:
+    """
+    Conserva literalmente los turnos más recientes que quepan y resume el resto.
+    """
+    empty = {"history_tokens": 0, "summary_tokens": 0, "messages_kept": 0, "messages_summarized": 0}
+    if not messages or budget <= 0:
+        return "", empty
+
+    lines = [render_chat_history([msg]) for msg in messages]
+    line_tokens = [count_tokens(line) + 1 for line in lines]
+
+    # Si todo cabe, no hay nada que resumir
+    if sum(line_tokens) <= budget:
+        text = "\n".join(lines)
+        return text, {**empty, "history_tokens": count_tokens(text), "messages_kept": len(lines)}
+
+    # De más reciente a más antiguo hasta llenar el presupuesto, dejando
+    # hueco para el resumen de lo que no quepa
+    recent_budget = budget - min(summarizer.max_tokens, budget // 3)
+    kept: List[str] = []
+    used = 0
+    for line, tokens in zip(reversed(lines), reversed(line_tokens)):
+        if used + tokens > recent_budget:
+            if not kept:
+                # El último mensaje siempre entra, aunque sea recortado
+                kept.append(truncate_to_tokens(line, recent_budget))
+                used = recent_budget
+            break
+        kept.append(line)
+        used += tokens
+    kept.reverse()
+
+    older = messages[:len(messages) - len(kept)]
+    summary = summarizer.summarize(session_id, older)
+    # Lo que queda, menos los encabezados y el "…" que puede añadir el recorte
+    summary = truncate_to_tokens(summary, max(0, budget - used - _SUMMARY_HEADERS_TOKENS - 1))
+
+    recent_text = "\n".join(kept)
+    if summary:
+        text = _SUMMARY_TEMPLATE.format(summary=summary, recent=recent_text)
+    else:
+        text = recent_text
+
+    return text, {
+        "history_tokens": count_tokens(text),
+        "summary_tokens": count_tokens(summary),
+        "messages_kept": len(kept),
+        "messages_summarized": len(older),
+    }
+
+
+def build_prompt_parts(question: str, chat_history: Any, docs: List[Any],
+                       session_id: Optional[str] = None,
+                       max_tokens: int = PROMPT_MAX_TOKENS,
+                       summarizer: HistorySummarizer = history_summarizer) -> Dict[str, Any]:
+    """
+    Reparte el presupuesto de tokens entre system prompt, contexto recuperado
+    e historial. Devuelve el historial y el contexto ya recortados, junto con
+    el conteo de tokens de cada parte.
+    """
+    if isinstance(chat_history, str):
+        chat_history = [("user", chat_history)] if chat_history else []
+    messages = list(chat_history or [])
+
+    system_tokens = count_tokens(assistant_system_prompt)
+    question_tokens = count_tokens(question)
+    free = max(0, max_tokens - system_tokens - question_tokens - _TEMPLATE_OVERHEAD_TOKENS)
+
+    # 1) Contexto: su cuota; lo que sobre pasa al historial
+    context_text, context_tokens = _pack_context(docs or [], int(free * CONTEXT_SHARE))
+
+    # 2) Historial: el resto del presupuesto
+    history_text, history_stats = _pack_history(
+        messages, free - context_tokens, session_id, summarizer
+    )
+
+    tokens = {
+        "system_tokens": system_tokens,
+        "question_tokens": question_tokens,
+        "context_tokens": context_tokens,
+        **history_stats,
+    }
+    tokens["total_tokens"] = (
+        system_tokens + question_tokens + context_tokens
+        + history_stats["history_tokens"] + _TEMPLATE_OVERHEAD_TOKENS
+    )
+
+    return {
+        "history_text": history_text,
+        "context_text": context_text,
+        "tokens": tokens,
+    }
@@ -37,6 +37,7 @@ def render_chat_history(history: List[Any]) -> str:
 
     `history` puede ser:
     - una lista de dicts con {'role': 'user'|'assistant', 'content': '...'}
+    - una lista de mensajes de LangChain (HumanMessage, AIMessage, ...)
     - una lista de tuples, o ya un string (en cuyo caso se devuelve tal cual).
     """
     if history is None:
@@ -53,6 +54,10 @@ def render_chat_history(history: List[Any]) -> str:
             role = msg.get("role", "user")
             content = msg.get("content", "")
             out_lines.append(f"{role.capitalize()}: {content}")
+        # Manejar mensajes de LangChain (HumanMessage / AIMessage)
+        elif hasattr(msg, "type") and hasattr(msg, "content"):
+            role = {"human": "user", "ai": "assistant"}.get(msg.type, msg.type)
+            out_lines.append(f"{role.capitalize()}: {msg.content}")
         # Manejar tuplas/listas: (role, content)
         elif isinstance(msg, (list, tuple)) and len(msg) >= 2:
             role, content = msg[0], msg[1]
@@ -61,6 +66,5 @@ def render_chat_history(history: List[Any]) -> str:
         else:
             out_lines.append(str(msg))
 
-    # Limita longitud si es demasiado largo (opcional)
-    joined = "\n".join(out_lines)
-    return joined
+    # La longitud la controla prompt_builder (presupuesto de tokens + resumen)
+    return "\n".join(out_lines)
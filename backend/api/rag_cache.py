@@ -0,0 +1,170 @@
+# backend/api/rag_cache.py
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+
+from api.topics import key_includes
+from api.tracing import span
+
+
+# CACHÉS DE LA RUTA DE RECUPERACIÓN
+# - Embeddings de consultas: la misma pregunta no se vuelve a embeber.
+# - Resultados de búsqueda: (tema, versión del índice, consulta, parámetros)
+#   → documentos. La versión cambia al reconstruir el vectorstore, así que
+#   las entradas viejas dejan de acertar solas.
+
+EMBEDDING_CACHE_SIZE = int(os.getenv("ASSISTLEG_EMBEDDING_CACHE_SIZE", "2048"))
+RETRIEVAL_CACHE_SIZE = int(os.getenv("ASSISTLEG_RETRIEVAL_CACHE_SIZE", "1024"))
+
+
+class LRUCache:
+    """LRU sencillo y seguro entre hilos, con contadores de aciertos."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def discard_where(self, predicate):
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Envuelve un modelo de embeddings y cachea embed_query(). embed_documents()
+    (ingestión) pasa directo al modelo.
+    """
+
+    def __init__(self, base: Embeddings, max_entries: int = EMBEDDING_CACHE_SIZE):
+        self.base = base
+        self.cache = LRUCache(max_entries)
+        self._embed_seconds = 0.0
+        self._embed_calls = 0
+
+    def embed_query(self, text: str) -> List[float]:
+        with span("embed") as stage:
+            vector = self.cache.get(text)
+            if vector is not None:
+                stage.set(cache_hit=True)
+                return list(vector)
+
+            stage.set(cache_hit=False)
+            start = time.perf_counter()
+            vector = self.base.embed_query(text)
+            self._embed_seconds += time.perf_counter() - start
+            self._embed_calls += 1
+
+            self.cache.put(text, tuple(vector))
+            return vector
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Varias consultas a la vez: las que no están en caché se embeben en
+        una sola llamada al modelo y quedan cacheadas para embed_query().
+        """
+        with span("embed", batch=len(texts)) as stage:
+            vectors = {text: self.cache.get(text) for text in dict.fromkeys(texts)}
+            missing = [text for text, vector in vectors.items() if vector is None]
+            stage.set(cache_hit=not missing, missing=len(missing))
+            if missing:
+                start = time.perf_counter()
+                for text, vector in zip(missing, self.base.embed_documents(missing)):
+                    vectors[text] = tuple(vector)
+                    self.cache.put(text, vectors[text])
+                self._embed_seconds += time.perf_counter() - start
+                self._embed_calls += len(missing)
+            return [list(vectors[text]) for text in texts]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.base.embed_documents(texts)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.cache.stats()
+        avg = (self._embed_seconds / self._embed_calls) if self._embed_calls else 0.0
+        stats["avg_embed_ms"] = round(avg * 1000, 2)
+        # Tiempo de CPU de embedding ahorrado por los aciertos (estimado)
+        stats["saved_embed_seconds"] = round(avg * stats["hits"], 3)
+        return stats
+
+
+retrieval_cache = LRUCache(RETRIEVAL_CACHE_SIZE)
+
+
+class CachedRetriever(BaseRetriever):
+    """
+    Retriever que memoriza los documentos devueltos por `inner` para cada
+    (tema, versión, consulta, tipo de búsqueda, parámetros).
+    """
+
+    inner: BaseRetriever
+    topic: str
+    version: Any
+    search_type: str
+    search_kwargs: Dict[str, Any]
+
+    def _cache_key(self, query: str):
+        params = json.dumps(self.search_kwargs, sort_keys=True, default=str)
+        return (self.topic, self.version, query, self.search_type, params)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: Optional[CallbackManagerForRetrieverRun] = None
+    ) -> List[Document]:
+        with span("search", topic=self.topic, search_type=self.search_type) as stage:
+            key = self._cache_key(query)
+            docs = retrieval_cache.get(key)
+            if docs is not None:
+                stage.set(cache_hit=True, documents=len(docs))
+                return list(docs)
+
+            docs = self.inner.invoke(query)
+            retrieval_cache.put(key, tuple(docs))
+            stage.set(cache_hit=False, documents=len(docs))
+            return docs
+
+
+def forget_topic(topic: Optional[str] = None):
+    """Descarta los resultados cacheados de un tema (o de todos), incluidas las búsquedas multi-tema."""
+    retrieval_cache.discard_where(lambda key: topic is None or key_includes(key[0], topic))
@@ -1,37 +1,376 @@
 # backend/api/rag_loader.py
 
+import logging
 import os
+import threading
+import time
 from pathlib import Path
-from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
+
+from api.embeddings import EMBEDDING_BACKEND, EMBEDDING_MODEL_NAME, build_embeddings
+from api.federated import FederatedRetriever
+from api.hybrid_retriever import HybridRetriever
+from api.lexical_index import BM25Index
+from api.rag_cache import CachedQueryEmbeddings, CachedRetriever, forget_topic, retrieval_cache
+from api.reranker import ENABLED as RERANK_ENABLED, RERANK_FETCH_K
+from api.topics import ALL_TOPICS, is_multi_topic, make_topic_key, split_topic_key
+from api.tracing import span
+from api.vector_index import VECTOR_ENGINE, NumPyRetriever, NumPyVectorIndex
+from api.vector_snapshot import SNAPSHOTS_ENABLED, load_snapshot
+from api.vectorstore_versions import current_version, has_index, version_path
+
+logger = logging.getLogger(__name__)
 
 VECTORSTORES_PATH = Path(__file__).resolve().parents[1] / "vectorstores"
 
-def load_rag_for_topic(topic_name: str):
+# Parámetros del retriever (MMR → mejor calidad jurídica)
+RETRIEVER_SEARCH_TYPE = "mmr"
+RETRIEVER_SEARCH_KWARGS = {"k": 5, "fetch_k": 20, "lambda_mult": 0.35}
+# Con reranking se traen más candidatos; el cross-encoder deja los mejores
+if RERANK_ENABLED:
+    RETRIEVER_SEARCH_KWARGS["k"] = max(RETRIEVER_SEARCH_KWARGS["k"], RERANK_FETCH_K)
+# Fusión con el índice léxico BM25 (si está desactivada, solo vectores)
+HYBRID_RETRIEVAL = os.getenv("ASSISTLEG_HYBRID_RETRIEVAL", "1") != "0"
+# Cada cuántos segundos se relee el puntero de versión de un tema (una
+# ingestión en otro proceso publica versiones nuevas sin avisar)
+VERSION_POLL_SECONDS = float(os.getenv("ASSISTLEG_VECTORSTORE_POLL_S", "1"))
+
+
+# RECURSOS COMPARTIDOS POR EL PROCESO
+# El modelo de embeddings y los clientes Chroma son caros de crear:
+# se construyen una sola vez y se reutilizan entre peticiones.
+# Vectorstores e índices se guardan como (versión, objeto): cuando se publica
+# otra versión del tema (api/vectorstore_versions.py) se carga la nueva, y
+# las peticiones en vuelo terminan con los objetos de la anterior.
+
+_lock = threading.RLock()
+_embeddings = None
+_chroma_clients = {}
+_vectorstores = {}
+_lexical_indexes = {}
+_vector_indexes = {}
+# Versión vigente de cada tema: (id, momento en que se leyó el puntero).
+# Forma parte de las claves de la caché de resultados
+_versions = {}
+# Temas con índice: (directorio, temas, momento en que se listó). Cada
+# pregunta valida su tema contra esta lista, que se relee con el mismo
+# intervalo que los punteros de versión
+_topic_listing = None
+
+
+def get_embeddings():
+    """
+    Devuelve el modelo de embeddings compartido (se carga una sola vez),
+    con caché LRU de embeddings de consultas y micro-batching de las que
+    fallan en la caché.
+    """
+    global _embeddings
+
+    if _embeddings is None:
+        with _lock:
+            if _embeddings is None:
+                logger.info("Cargando modelo de embeddings: %s (%s)", EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND)
+                with span("embedding_model_load", backend=EMBEDDING_BACKEND):
+                    _embeddings = CachedQueryEmbeddings(build_embeddings())
+    return _embeddings
+
+
+def list_available_topics():
+    """Lista las carpetas <topic>_vs presentes en backend/vectorstores/."""
+    global _topic_listing
+
+    now = time.monotonic()
+    listing = _topic_listing
+    if listing is None or listing[0] != VECTORSTORES_PATH or now - listing[2] >= VERSION_POLL_SECONDS:
+        topics = sorted(
+            p.name for p in VECTORSTORES_PATH.iterdir()
+            if p.is_dir() and p.name.endswith("_vs") and has_index(p)
+        ) if VECTORSTORES_PATH.is_dir() else []
+        listing = _topic_listing = (VECTORSTORES_PATH, topics, now)
+    return list(listing[1])
+
+
+def resolve_topics(topic_key: str):
+    """
+    Temas que abarca una clave: "constitucion_vs", "a_vs+b_vs" o "all".
+    Devuelve [] si alguno no existe.
+    """
+    available = list_available_topics()
+    if topic_key == ALL_TOPICS:
+        return available
+    topics = split_topic_key(topic_key)
+    if not topics or any(t not in available for t in topics):
+        return []
+    return topics
+
+
+def request_topic_key(data):
+    """
+    Tema de una pregunta: "topic": "constitucion_vs", "topic": "all" o
+    "topics": ["codigo_trabajo_vs", "constitucion_vs"]. Devuelve la clave
+    canónica, o None si algún tema no existe.
+    """
+    topics = data.get("topics")
+    if isinstance(topics, list) and topics:
+        key = make_topic_key(str(t) for t in topics)
+    else:
+        key = data.get("topic")
+    resolved = resolve_topics(key) if isinstance(key, str) else []
+    if not resolved:
+        return None
+    # Un solo tema pedido como lista usa el agente de ese tema
+    return key if key == ALL_TOPICS else make_topic_key(resolved)
+
+
+def unknown_topic_message(data) -> str:
+    return f"Tema desconocido: {data.get('topics') or data.get('topic')}"
+
+
+def _get_chroma_client(persist_dir: Path):
+    """Un único cliente Chroma por directorio persistido."""
+    import chromadb
+
+    key = str(persist_dir)
+    client = _chroma_clients.get(key)
+    if client is None:
+        client = chromadb.PersistentClient(path=key)
+        _chroma_clients[key] = client
+    return client
+
+
+def _cached(cache: dict, topic_name: str, version):
+    entry = cache.get(topic_name)
+    return entry[1] if entry is not None and entry[0] == version else None
+
+
+def _current_persist_dir(topic_name: str):
+    """(versión vigente, directorio de esa versión) del índice del tema."""
+    topic_dir = VECTORSTORES_PATH / topic_name
+    if topic_name not in list_available_topics():
+        raise FileNotFoundError(f"No se encontró el vectorstore: {topic_dir}")
+    version = get_vectorstore_version(topic_name)
+    return version, version_path(topic_dir, version)
+
+
+def _forget_chroma_clients(topic_name: str, keep: Path = None):
+    """Suelta los clientes Chroma de otras versiones del tema (los usa quien ya los tenga)."""
+    topic_dir = VECTORSTORES_PATH / topic_name
+    for key in [k for k in _chroma_clients if Path(k).is_relative_to(topic_dir) and k != str(keep)]:
+        _chroma_clients.pop(key, None)
+
+
+def get_vectorstore(topic_name: str):
+    """
+    Devuelve el vectorstore Chroma de la versión vigente del tema,
+    abriéndolo solo la primera vez.
+    """
+    vectorstore = _cached(_vectorstores, topic_name, get_vectorstore_version(topic_name))
+    if vectorstore is not None:
+        return vectorstore
+
+    with _lock:
+        version, persist_dir = _current_persist_dir(topic_name)
+        vectorstore = _cached(_vectorstores, topic_name, version)
+        if vectorstore is not None:
+            return vectorstore
+
+        logger.info("Cargando vectorstore desde: %s", persist_dir)
 
-    persist_dir = VECTORSTORES_PATH / topic_name
+        # langchain_community y chromadb solo se importan si hace falta Chroma
+        # (con ASSISTLEG_VECTOR_ENGINE=numpy y una instantánea al día, nunca)
+        from langchain_community.vectorstores import Chroma
 
-    if not persist_dir.exists():
-        raise FileNotFoundError(
-            f"No se encontró el vectorstore: {persist_dir}"
+        embeddings = get_embeddings()
+        with span("vectorstore_load", topic=topic_name):
+            vectorstore = Chroma(
+                client=_get_chroma_client(persist_dir),
+                persist_directory=str(persist_dir),
+                embedding_function=embeddings
+            )
+        _vectorstores[topic_name] = (version, vectorstore)
+        _forget_chroma_clients(topic_name, keep=persist_dir)
+
+    logger.info("Vectorstore %s (versión %s) cargado.", topic_name, version)
+    return vectorstore
+
+
+def get_lexical_index(topic_name: str):
+    """
+    Índice BM25 del tema. Se genera en la ingestión; si un vectorstore
+    antiguo no lo tiene, se construye una vez desde la colección Chroma
+    (sin calcular embeddings) y se guarda a su lado.
+    """
+    index = _cached(_lexical_indexes, topic_name, get_vectorstore_version(topic_name))
+    if index is not None:
+        return index
+
+    with _lock:
+        version, persist_dir = _current_persist_dir(topic_name)
+        index = _cached(_lexical_indexes, topic_name, version)
+        if index is not None:
+            return index
+
+        with span("lexical_index_load", topic=topic_name):
+            index = BM25Index.load(persist_dir)
+            if index is None:
+                logger.info("Construyendo índice léxico de %s", topic_name)
+                index = BM25Index.from_collection(get_vectorstore(topic_name)._collection)
+                try:
+                    index.save(persist_dir)
+                except OSError as exc:
+                    logger.warning("No se pudo guardar el índice léxico de %s: %r", topic_name, exc)
+        _lexical_indexes[topic_name] = (version, index)
+    return index
+
+
+def get_vector_index(topic_name: str) -> NumPyVectorIndex:
+    """
+    Índice NumPy del tema (ASSISTLEG_VECTOR_ENGINE=numpy): se mapea desde
+    la instantánea del tema si está al día (sin abrir Chroma) o se lee una
+    vez de la colección. Las búsquedas ya no pasan por el cliente Chroma.
+    """
+    index = _cached(_vector_indexes, topic_name, get_vectorstore_version(topic_name))
+    if index is not None:
+        return index
+
+    with _lock:
+        version, persist_dir = _current_persist_dir(topic_name)
+        index = _cached(_vector_indexes, topic_name, version)
+        if index is not None:
+            return index
+
+        with span("vector_index_load", topic=topic_name) as stage:
+            index = load_snapshot(persist_dir) if SNAPSHOTS_ENABLED else None
+            stage.set(source="snapshot" if index is not None else "chroma")
+            if index is None:
+                index = NumPyVectorIndex.from_collection(get_vectorstore(topic_name)._collection)
+        _vector_indexes[topic_name] = (version, index)
+    logger.info("Índice vectorial en memoria de %s (versión %s): %s", topic_name, version, index.stats())
+    return index
+
+
+def invalidate_vectorstore(topic_name: str = None):
+    """
+    Olvida el vectorstore (y su cliente Chroma) de un tema, o de todos si
+    topic_name es None, y vuelve a leer su puntero de versión. Las versiones
+    nuevas se detectan solas; sirve para forzarlo sin esperar al sondeo.
+    """
+    global _topic_listing
+
+    with _lock:
+        _topic_listing = None
+        topics = [topic_name] if topic_name else list(
+            set(_vectorstores) | set(_lexical_indexes) | set(_vector_indexes) | set(_versions)
         )
+        for topic in topics:
+            _vectorstores.pop(topic, None)
+            _lexical_indexes.pop(topic, None)
+            _vector_indexes.pop(topic, None)
+            _forget_chroma_clients(topic)
+            _versions.pop(topic, None)
+
+    forget_topic(topic_name)
+
+
+def get_vectorstore_version(topic_name: str):
+    """
+    Versión vigente del índice del tema: el id de su current.json, "legacy"
+    o None si no existe. El puntero se relee como mucho cada
+    ASSISTLEG_VECTORSTORE_POLL_S segundos.
+    """
+    now = time.monotonic()
+    entry = _versions.get(topic_name)
+    if entry is None or now - entry[1] >= VERSION_POLL_SECONDS:
+        entry = (current_version(VECTORSTORES_PATH / topic_name), now)
+        _versions[topic_name] = entry
+    return entry[0]
+
 
-    print(f" Cargando vectorstore desde: {persist_dir}")
+def topic_version(topic_key: str):
+    """Versión de una clave de tema; en las multi-tema, la de cada tema que abarca."""
+    if is_multi_topic(topic_key):
+        return tuple((topic, get_vectorstore_version(topic)) for topic in resolve_topics(topic_key))
+    return get_vectorstore_version(topic_key)
 
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2"
+
+def cache_stats() -> dict:
+    """Contadores de las cachés de embeddings de consultas y de resultados."""
+    stats = {"retrieval": retrieval_cache.stats()}
+    if isinstance(_embeddings, CachedQueryEmbeddings):
+        stats["query_embeddings"] = _embeddings.stats()
+        if hasattr(_embeddings.base, "stats"):
+            stats["embedding_batches"] = _embeddings.base.stats()
+    if _vector_indexes:
+        stats["vector_index"] = {topic: index.stats() for topic, (_, index) in list(_vector_indexes.items())}
+    loaded = {**_lexical_indexes, **_vectorstores, **_vector_indexes}
+    if loaded:
+        stats["vectorstore_versions"] = {topic: version for topic, (version, _) in sorted(loaded.items())}
+    return stats
+
+
+def load_rag_for_topics(topic_key: str):
+    """
+    Retriever sobre varios temas (clave "a_vs+b_vs" o "all"): un solo
+    embedding de la pregunta y búsqueda en paralelo en cada vectorstore.
+    """
+    topics = resolve_topics(topic_key)
+    if not topics:
+        raise FileNotFoundError(f"Temas desconocidos: {topic_key}")
+
+    stores = {
+        topic: (
+            get_vector_index(topic) if VECTOR_ENGINE == "numpy" else get_vectorstore(topic)._collection,
+            get_lexical_index(topic) if HYBRID_RETRIEVAL else None,
+        )
+        for topic in topics
+    }
+    retriever = FederatedRetriever(
+        stores=stores,
+        embeddings=get_embeddings(),
+        k=RETRIEVER_SEARCH_KWARGS["k"],
     )
 
-    vectorstore = Chroma(
-        persist_directory=str(persist_dir),
-        embedding_function=embeddings
+    return CachedRetriever(
+        inner=retriever,
+        topic=topic_key,
+        version=tuple(get_vectorstore_version(t) for t in topics),
+        search_type="federated",
+        search_kwargs={"k": retriever.k, "fetch_k": retriever.fetch_k, "quota": retriever.quota},
     )
 
+
+def load_rag_for_topic(topic_name: str):
+
+    if is_multi_topic(topic_name):
+        return load_rag_for_topics(topic_name)
+
     # RAG inteligente: MMR → mejor calidad jurídica
-    retriever = vectorstore.as_retriever(
-        search_type="mmr",
-        search_kwargs={"k": 5, "fetch_k": 20, "lambda_mult": 0.35}
-    )
+    if VECTOR_ENGINE == "numpy":
+        # Mismos resultados, sin pasar por el cliente Chroma en cada búsqueda
+        retriever = NumPyRetriever(
+            index=get_vector_index(topic_name),
+            embeddings=get_embeddings(),
+            search_type=RETRIEVER_SEARCH_TYPE,
+            search_kwargs=dict(RETRIEVER_SEARCH_KWARGS),
+        )
+    else:
+        retriever = get_vectorstore(topic_name).as_retriever(
+            search_type=RETRIEVER_SEARCH_TYPE,
+            search_kwargs=dict(RETRIEVER_SEARCH_KWARGS)
+        )
 
-    print("✔ Vectorstore cargado.")
-    return retriever
+    if HYBRID_RETRIEVAL:
+        # BM25 + vectores (RRF) y acceso directo a "artículo N"
+        retriever = HybridRetriever(
+            vector_retriever=retriever,
+            lexical_index=get_lexical_index(topic_name),
+            k=RETRIEVER_SEARCH_KWARGS["k"],
+        )
+
+    # Consultas repetidas no vuelven a embeber ni a ejecutar MMR
+    return CachedRetriever(
+        inner=retriever,
+        topic=topic_name,
+        version=get_vectorstore_version(topic_name),
+        search_type=f"hybrid+{RETRIEVER_SEARCH_TYPE}" if HYBRID_RETRIEVAL else RETRIEVER_SEARCH_TYPE,
+        search_kwargs=dict(RETRIEVER_SEARCH_KWARGS),
+    )
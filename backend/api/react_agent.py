@@ -1,21 +1,31 @@
 # backend/api/react_agent.py
 
-from typing import Dict, Any, List, Union
-import traceback
+from typing import Dict, Any, Iterator, List, Optional, Union
+import logging
+import time
 
 from langchain_core.tools import Tool
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnableConfig, RunnableLambda, RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
 
-from api.config_llm import groq_llm, create_retrieval_chain
-from api.memory import with_memory
-from api.rag_loader import load_rag_for_topic
-from api.prompt_templates import legal_chat_prompt, render_chat_history
+from api.answer_cache import ENABLED as ANSWER_CACHE_ENABLED, answer_cache, is_cacheable
+from api.config_llm import get_llm
+from api.executors import run_in_embedding_executor
+from api.lexical_index import parse_article_reference
+from api.memory import get_session_history, record_turn, with_memory
+from api.rag_loader import HYBRID_RETRIEVAL, load_rag_for_topic
+from api.prompt_builder import build_prompt_parts
+from api.prompt_templates import legal_chat_prompt
+from api.reranker import rerank_documents
+from api.retrieval_router import RETRIEVE, retrieval_router
+from api.tracing import TIMING_HEADER, Trace, activate, span
+
+logger = logging.getLogger(__name__)
 
 
 def _normalize_rag_result(result: Any) -> str:
     """
-    Convierte la salida de rag_chain.invoke(...) a texto plano seguro.
+    Convierte la salida del retriever (o de un rag_chain) a texto plano seguro.
     Acepta:
       - str
       - dict con keys habituales: "context", "answer", "texts", "documents"
@@ -31,9 +41,9 @@ def _normalize_rag_result(result: Any) -> str:
         if isinstance(result, str):
             return result.strip()
 
-        # Si es lista/tupla -> unir
+        # Si es lista/tupla -> unir (Documents del retriever -> page_content)
         if isinstance(result, (list, tuple)):
-            return "\n".join([str(x).strip() for x in result if x is not None]).strip()
+            return "\n".join([str(getattr(x, "page_content", x)).strip() for x in result if x is not None]).strip()
 
         # Si es dict-like: buscar keys habituales
         if isinstance(result, dict):
@@ -74,127 +84,401 @@ def _normalize_rag_result(result: Any) -> str:
         return ""
 
 
-def build_legal_agent(topic_name: str):
+def _build_messages(question: str, history_text: str, rag_context: str) -> List[Any]:
+    """
+    Construye la lista de mensajes para el LLM: prompt legal + historial +
+    pregunta y, si existe, el contexto recuperado como mensaje SYSTEM.
+    history_text y rag_context ya vienen recortados por prompt_builder.
+    """
+
+    # 3) Construir prompt mediante legal_chat_prompt de forma segura
+    try:
+        prompt_value = legal_chat_prompt.format_prompt(chat_history=history_text, input=question)
+    except Exception:
+        # Si el template falla, hacemos un fallback seguro
+        logger.exception("legal_chat_prompt.format_prompt falló")
+        prompt_value = None
+
+    # 4) Conservar una lista de mensajes para invocar LLM
+    messages: List[Any] = []
+    if prompt_value is not None and hasattr(prompt_value, "to_messages"):
+        # PromptValue -> mensajes
+        try:
+            messages = prompt_value.to_messages()
+        except Exception:
+            logger.exception("prompt_value.to_messages falló")
+            messages = []
+    if not messages:
+        # Fallback base
+        messages = [
+            {"role": "system", "content": "Eres AssistLeg, un asistente jurídico experto."},
+            {"role": "user", "content": (history_text + "\n\n" + question).strip()}
+        ]
+
+    # 5) Inyectar el contexto recuperado (si existe) como SYSTEM message
+    #    Nota: no debe contener texto tipo "documentos" visible al usuario;
+    #    aquí lo inyectamos únicamente como apoyo interno.
+    if rag_context:
+        messages.append({
+            "role": "system",
+            "content": rag_context
+        })
+
+    return messages
+
+
+def _extract_answer(response: Any) -> str:
+    # 7) Extraer texto de la respuesta LLM
+    try:
+        if hasattr(response, "content"):
+            return response.content
+        return str(response)
+    except Exception:
+        # Fallback
+        return str(response)
+
+
+def _llm_usage(response: Any) -> Dict[str, int]:
+    """Tokens de entrada/salida que informa el proveedor (usage_metadata), si los da."""
+    usage = getattr(response, "usage_metadata", None) or {}
+    return {
+        key: usage[key] for key in ("input_tokens", "output_tokens")
+        if isinstance(usage.get(key), int)
+    }
+
+
+def retrieve_documents(retriever: Any, q: Union[str, Dict[str, Any]]) -> List[Any]:
+    """
+    Ejecuta el retriever y, si está activado, el reranking (ver reranker).
+    Ante cualquier error devuelve [] (se responde sin contexto).
+    """
+    if isinstance(q, dict):
+        q = q.get("input", "") or q.get("query", "")
+    try:
+        return rerank_documents(q, retriever.invoke(q) or [])
+    except Exception:
+        # Log interno para debugging; no exponer al usuario
+        logger.exception("Error invocando el retriever")
+        return []
 
-    print(f" Cargando vectorstore para el tema: {topic_name}")
 
-    # 1) Cargar retriever y crear RAG chain
-    retriever = load_rag_for_topic(topic_name)
-    rag_chain = create_retrieval_chain(retriever)
+def _session_id(config: Optional[RunnableConfig]) -> Optional[str]:
+    return ((config or {}).get("configurable") or {}).get("session_id")
 
- 
-    # TOOL: Devuelve SOLO el texto del contexto recuperado
-    # Maneja robustamente distintos tipos de salida del rag_chain
 
-    def tool_buscar_documentos_legales(q: Union[str, Dict[str, Any]]) -> str:
+def _prompt_messages(question: str, chat_history: Any, docs: List[Any],
+                     config: Optional[RunnableConfig]) -> List[Any]:
+    """Aplica el presupuesto de tokens (ver prompt_builder) y arma los mensajes."""
+    return _traced_prompt(question, chat_history, docs, _session_id(config))
+
+
+def _traced_prompt(question: str, chat_history: Any, docs: List[Any], session_id: Optional[str]) -> List[Any]:
+    with span("prompt_build") as stage:
+        parts = build_prompt_parts(question, chat_history, docs, session_id)
+        tokens = parts["tokens"]
+        stage.set(prompt_tokens=tokens["total_tokens"], context_tokens=tokens["context_tokens"],
+                  history_tokens=tokens["history_tokens"], documents=len(docs))
+        return _build_messages(question, parts["history_text"], parts["context_text"])
+
+
+def _lookup_cached_answer(topic_name: str, question: str):
+    """
+    Consulta la caché semántica. Devuelve (respuesta | None, vector | None);
+    vector es None si la pregunta no es cacheable (seguimiento de la charla)
+    o si cita un "artículo N": esa sale del índice de artículos sin ningún
+    embedding (ver hybrid_retriever), y la caché obligaría a calcularlo.
+    """
+    if not ANSWER_CACHE_ENABLED or not is_cacheable(question):
+        return None, None
+    if HYBRID_RETRIEVAL and parse_article_reference(question) is not None:
+        return None, None
+    with span("answer_cache", topic=topic_name) as stage:
         try:
-            # rag_chain.invoke puede aceptar str o dict dependiendo de su implementación
-            raw = rag_chain.invoke(q)
+            cached, vector = answer_cache.lookup(topic_name, question)
         except Exception as exc:
-            # Log interno para debugging; no exponer al usuario
-            print("⚠ Error invocando rag_chain:", repr(exc))
-            traceback.print_exc()
-            return ""
+            logger.warning("Error consultando la caché de respuestas: %r", exc)
+            cached, vector = None, None
+        stage.set(cache_hit=cached is not None)
+        return cached, vector
+
+
+def _store_cached_answer(topic_name: str, question: str, answer: str, vector: Any):
+    """
+    Solo para respuestas con route RETRIEVE: las que salen del contexto o del
+    historial de una sesión no sirven a otra con la misma pregunta.
+    """
+    if vector is None or not answer:
+        return
+    answer_cache.store(topic_name, question, answer, vector)
+
+
+LLM_ERROR_MESSAGE = "Lo siento, ocurrió un error al procesar la consulta. Intenta de nuevo en unos segundos."
+
+
+def build_legal_agent(topic_name: str, retriever: Any = None):
+
+    logger.info("Construyendo agente para el tema: %s", topic_name)
+
+    # 1) Cargar retriever (vectorstore compartido, ver rag_loader), salvo que
+    #    lo pase el registro, que lo comparte con el streaming
+    retriever = retriever or load_rag_for_topic(topic_name)
+
 
-        # Normalizar a texto plano
-        context_text = _normalize_rag_result(raw)
-        return context_text
+    # TOOL: Devuelve SOLO los documentos recuperados (sin pasar por el LLM);
+    # prompt_builder decide cuánto de ellos cabe en el prompt
+
+    def tool_buscar_documentos_legales(q: Union[str, Dict[str, Any]]) -> List[Any]:
+        return retrieve_documents(retriever, q)
+
+    async def atool_buscar_documentos_legales(q: Union[str, Dict[str, Any]]) -> List[Any]:
+        # Embedding + búsqueda MMR son CPU: se ejecutan en el pool acotado
+        # para no bloquear el event loop ni saturar la CPU con demasiados hilos
+        return await run_in_embedding_executor(tool_buscar_documentos_legales, q)
 
     tools = {
         "buscar_documentos_legales": Tool.from_function(
             func=tool_buscar_documentos_legales,
+            coroutine=atool_buscar_documentos_legales,
             name="buscar_documentos_legales",
             description="Recupera textos relevantes del tema legal seleccionado."
         )
     }
 
-  
+
     # EJECUTOR DEL AGENTE (ReAct manual)
 
-    def agent_executor(inputs: Dict[str, Any]) -> str:
+    def agent_executor(inputs: Dict[str, Any], config: RunnableConfig) -> str:
         question = inputs.get("input", "")
         if not question:
             return "No recibí ninguna pregunta."
 
-        print(" Ejecutando agente jurídico...")
+        logger.debug("Ejecutando agente jurídico (%s)", topic_name)
+
+        # 0) Caché semántica: una pregunta casi igual ya respondida en este tema
+        cached, vector = _lookup_cached_answer(topic_name, question)
+        if cached is not None:
+            logger.debug("Respuesta servida desde la caché semántica")
+            return cached
+
+        # 1) Recuperar documentos relevantes desde RAG, salvo que el router
+        #    decida reutilizar los del turno anterior o responder con el historial
+        chat_history = inputs.get("chat_history", [])
+        session_id = _session_id(config)
+        route = retrieval_router.route(session_id, topic_name, question, has_history=bool(chat_history))
+        docs = route.documents
+        if route.decision == RETRIEVE:
+            try:
+                docs = tools["buscar_documentos_legales"].invoke(question) or []
+            except Exception:
+                # Log interno y continuar con contexto vacío (fallback)
+                logger.exception("Error en la herramienta de búsqueda")
+                docs = []
+            retrieval_router.remember(session_id, topic_name, question, docs, route.vector)
 
-        # 1) Recuperar documentos relevantes desde RAG (texto plano)
+        messages = _prompt_messages(question, chat_history, docs, config)
+
+        # 6) Llamada al LLM (capturar excepciones)
         try:
-            rag_context = tools["buscar_documentos_legales"].invoke(question) or ""
-        except Exception as exc:
-            # Log interno y continuar con contexto vacío (fallback)
-            print(" Error en la herramienta de búsqueda:", repr(exc))
-            traceback.print_exc()
-            rag_context = ""
+            with span("llm") as stage:
+                response = get_llm().invoke(messages)
+                stage.set(**_llm_usage(response))
+        except Exception:
+            logger.exception("Error invocando el LLM")
+            # Mensaje amigable al usuario (sin detalles técnicos)
+            return LLM_ERROR_MESSAGE
 
-        # 2) Renderizar historial (seguro)
-        history_text = render_chat_history(inputs.get("chat_history", []))
+        answer = _extract_answer(response)
+        if route.decision == RETRIEVE:
+            _store_cached_answer(topic_name, question, answer, vector)
+        return answer
 
-        # 3) Construir prompt mediante legal_chat_prompt de forma segura
-        try:
-            prompt_value = legal_chat_prompt.format(chat_history=history_text, input=question)
-        except Exception as e:
-            # Si el template falla, hacemos un fallback seguro
-            print(" Warning: legal_chat_prompt.format falló:", repr(e))
-            traceback.print_exc()
-            prompt_value = None
-
-        # 4) Conservar una lista de mensajes para invocar LLM
-        messages: List[Dict[str, str]] = []
-        if prompt_value is not None and hasattr(prompt_value, "to_messages"):
-            # PromptValue -> mensajes
+    async def aagent_executor(inputs: Dict[str, Any], config: RunnableConfig) -> str:
+        """Versión asíncrona: mismos pasos, sin bloquear el event loop."""
+        question = inputs.get("input", "")
+        if not question:
+            return "No recibí ninguna pregunta."
+
+        # El embedding de la pregunta es CPU: al pool acotado
+        cached, vector = await run_in_embedding_executor(_lookup_cached_answer, topic_name, question)
+        if cached is not None:
+            return cached
+
+        chat_history = inputs.get("chat_history", [])
+        session_id = _session_id(config)
+        route = await run_in_embedding_executor(
+            retrieval_router.route, session_id, topic_name, question, bool(chat_history))
+        docs = route.documents
+        if route.decision == RETRIEVE:
             try:
-                messages = prompt_value.to_messages()
-            except Exception as e:
-                print(" Warning: prompt_value.to_messages falló:", repr(e))
-                traceback.print_exc()
-                messages = []
-        elif isinstance(prompt_value, str):
-            messages = [{"role": "user", "content": prompt_value}]
-        else:
-            # Fallback base
-            messages = [
-                {"role": "system", "content": "Eres AssistLeg, un asistente jurídico experto."},
-                {"role": "user", "content": (history_text + "\n\n" + question).strip()}
-            ]
-
-        # 5) Inyectar el contexto recuperado (si existe) como SYSTEM message
-        #    Nota: no debe contener texto tipo "documentos" visible al usuario;
-        #    aquí lo inyectamos únicamente como apoyo interno.
-        if rag_context:
-            messages.append({
-                "role": "system",
-                "content": rag_context
-            })
+                docs = await tools["buscar_documentos_legales"].ainvoke(question) or []
+            except Exception:
+                logger.exception("Error en la herramienta de búsqueda")
+                docs = []
+            await run_in_embedding_executor(
+                retrieval_router.remember, session_id, topic_name, question, docs, route.vector)
 
-        # 6) Llamada al LLM (capturar excepciones)
-        try:
-            response = groq_llm.invoke(messages)
-        except Exception as exc:
-            print(" Error invocando groq_llm:", repr(exc))
-            traceback.print_exc()
-            # Mensaje amigable al usuario (sin detalles técnicos)
-            return "Lo siento, ocurrió un error al procesar la consulta. Intenta de nuevo en unos segundos."
+        messages = _prompt_messages(question, chat_history, docs, config)
 
-        # 7) Extraer texto de la respuesta LLM
         try:
-            if hasattr(response, "content"):
-                return response.content
-            return str(response)
+            with span("llm") as stage:
+                response = await get_llm().ainvoke(messages)
+                stage.set(**_llm_usage(response))
         except Exception:
-            # Fallback
-            return str(response)
+            logger.exception("Error invocando el LLM")
+            return LLM_ERROR_MESSAGE
+
+        answer = _extract_answer(response)
+        if route.decision == RETRIEVE:
+            _store_cached_answer(topic_name, question, answer, vector)
+        return answer
 
 
     # Construcción final del Chain (con memoria)
 
     chain = (
         RunnablePassthrough.assign(input=lambda d: d.get("input"))
-        | agent_executor
+        | RunnableLambda(agent_executor, afunc=aagent_executor)
         | StrOutputParser()
     )
 
     chain_with_memory = with_memory(chain)
 
-    print(" Agente legal ReAct optimizado y listo.")
+    logger.info("Agente legal '%s' listo.", topic_name)
     return chain_with_memory
+
+
+def stream_legal_answer(topic_name: str, question: str, session_id: str,
+                        retriever: Any = None) -> Iterator[Dict[str, Any]]:
+    """
+    Versión en streaming del agente: produce eventos a medida que avanza.
+
+      {"event": "retrieval", ...}  en cuanto termina la búsqueda RAG
+      {"event": "token", ...}      por cada fragmento que emite el LLM
+      {"event": "done", ...}       con la respuesta completa
+
+    Al terminar guarda la pregunta y la respuesta COMPLETA en la memoria de
+    la sesión, igual que hace with_memory() en la ruta no streaming. Por
+    defecto busca con el retriever del agente del tema (agent_registry), no
+    con uno nuevo en cada petición.
+    """
+    if not question:
+        yield {"event": "done", "answer": "No recibí ninguna pregunta."}
+        return
+
+    # La traza se activa solo en los tramos sin yield: entre dos eventos el
+    # generador puede reanudarse en otro hilo (servidor ASGI)
+    trace = Trace("ask_stream", topic=topic_name)
+    error = None
+    try:
+        with activate(trace):
+            history = get_session_history(session_id)
+            # 0) Caché semántica: se responde de inmediato, sin RAG ni LLM
+            cached, vector = _lookup_cached_answer(topic_name, question)
+
+        if cached is not None:
+            yield {"event": "retrieval", "documents": 0, "cached": True, "elapsed_ms": 0}
+            yield {"event": "token", "text": cached}
+            with activate(trace):
+                record_turn(session_id, question, cached)
+            yield _done_event(cached, trace)
+            return
+
+        # 1) Recuperación RAG, o contexto del turno anterior / solo historial
+        #    según el router (se informa antes de empezar a generar)
+        start = time.perf_counter()
+        with activate(trace):
+            route = retrieval_router.route(session_id, topic_name, question, has_history=bool(history.messages))
+            docs = route.documents
+            if route.decision == RETRIEVE:
+                if retriever is None:
+                    # Import aquí: api.registry importa este módulo
+                    from api.registry import agent_registry
+
+                    retriever = agent_registry.get_retriever(topic_name)
+                docs = retrieve_documents(retriever, question)
+                retrieval_router.remember(session_id, topic_name, question, docs, route.vector)
+        yield {
+            "event": "retrieval",
+            "documents": len(docs),
+            "route": route.decision,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+        }
+
+        with activate(trace):
+            messages = _traced_prompt(question, history.messages, docs, session_id)
+
+        # 2) Generación token a token
+        pieces: List[str] = []
+        try:
+            with trace.span("llm", streamed=True) as stage:
+                usage: Dict[str, int] = {}
+                for chunk in get_llm().stream(messages):
+                    usage.update(_llm_usage(chunk))
+                    text = _extract_answer(chunk)
+                    if text:
+                        pieces.append(text)
+                        yield {"event": "token", "text": text}
+                stage.set(**usage)
+        except Exception:
+            logger.exception("Error en streaming del LLM")
+            vector = None   # respuesta incompleta: no se cachea
+            if not pieces:
+                pieces = [LLM_ERROR_MESSAGE]
+                yield {"event": "token", "text": LLM_ERROR_MESSAGE}
+
+        answer = "".join(pieces)
+        with activate(trace):
+            if route.decision == RETRIEVE:
+                _store_cached_answer(topic_name, question, answer, vector)
+            # 3) Memoria: se registra la respuesta completa, no los fragmentos
+            record_turn(session_id, question, answer)
+
+        yield _done_event(answer, trace)
+    except BaseException as exc:
+        # GeneratorExit incluido: el cliente cerró la conexión
+        error = type(exc).__name__
+        raise
+    finally:
+        trace.finish(error)
+
+
+def _done_event(answer: str, trace: Trace) -> Dict[str, Any]:
+    event = {"event": "done", "answer": answer}
+    if TIMING_HEADER:
+        # En streaming no se pueden añadir cabeceras al final: va en el evento
+        event["timing"] = trace.stage_totals()
+    return event
+
+
+# RUTA SIN MEMORIA (lotes de preguntas, ver api/batch.py)
+# Los mismos pasos del agente, separados para que quien los llama pueda
+# repartirlos en pools distintos (recuperación en el de embeddings, LLM con
+# su propio tope de concurrencia). No leen ni escriben el historial: cada
+# pregunta es independiente.
+
+def retrieve_standalone(topic_name: str, question: str, retriever: Any = None):
+    """
+    Caché semántica y, si no acierta, recuperación RAG. Devuelve
+    (respuesta cacheada | None, vector para la caché, documentos).
+    """
+    cached, vector = _lookup_cached_answer(topic_name, question)
+    if cached is not None:
+        return cached, vector, []
+    docs = retrieve_documents(retriever or load_rag_for_topic(topic_name), question)
+    return None, vector, docs
+
+
+def generate_standalone(topic_name: str, question: str, docs: List[Any], vector: Any = None):
+    """
+    Llamada al LLM con el contexto recuperado y sin historial. Devuelve
+    (respuesta, uso de tokens). A diferencia del agente, un error del LLM
+    se propaga: el llamador informa el fallo de esa pregunta.
+    """
+    messages = _traced_prompt(question, [], docs, None)
+    with span("llm") as stage:
+        response = get_llm().invoke(messages)
+        usage = _llm_usage(response)
+        stage.set(**usage)
+    answer = _extract_answer(response)
+    _store_cached_answer(topic_name, question, answer, vector)
+    return answer, usage
@@ -0,0 +1,215 @@
+# backend/api/registry.py
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from api import rag_loader
+from api.answer_cache import answer_cache
+from api.react_agent import build_legal_agent
+from api.reranker import ENABLED as RERANK_ENABLED, reranker
+from api.retrieval_router import retrieval_router
+from api.topics import key_includes
+
+logger = logging.getLogger(__name__)
+
+
+class AgentRegistry:
+    """
+    Registro por proceso de agentes legales ya construidos (uno por tema).
+
+    - Se llena perezosamente en la primera pregunta de cada tema, o por
+      adelantado con warm_up().
+    - Es seguro entre hilos: cada tema tiene su propio lock, de modo que dos
+      peticiones simultáneas al mismo tema construyen el agente una sola vez
+      y un tema lento no bloquea a los demás.
+    - invalidate() descarta agentes y vectorstores tras reconstruir un índice.
+    - Cada agente recuerda la versión del índice con la que se construyó; si
+      se publica otra (ver api/vectorstore_versions.py), la siguiente
+      petición lo reconstruye y las que están en vuelo terminan con el viejo.
+    - Guarda también el retriever de cada agente: el streaming, que no pasa
+      por el agente, busca con el mismo (get_retriever()).
+    """
+
+    def __init__(self, builder: Callable = build_legal_agent):
+        self._builder = builder
+        self._lock = threading.Lock()
+        self._topic_locks: Dict[str, threading.Lock] = {}
+        self._agents: Dict[str, object] = {}
+        self._retrievers: Dict[str, object] = {}
+        self._versions: Dict[str, object] = {}
+        self._invalidation_callbacks: List[Callable] = []
+        # Se incrementa en cada invalidación; un agente construido durante
+        # una invalidación no se guarda porque podría usar el índice viejo.
+        self._generation = 0
+
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        self._version_swaps = 0
+        self._build_seconds: Dict[str, float] = {}
+
+    def _topic_lock(self, topic_name: str) -> threading.Lock:
+        with self._lock:
+            lock = self._topic_locks.get(topic_name)
+            if lock is None:
+                lock = threading.Lock()
+                self._topic_locks[topic_name] = lock
+            return lock
+
+    def get(self, topic_name: str):
+        """Devuelve el agente del tema, construyéndolo si aún no existe."""
+        return self._entry(topic_name)[0]
+
+    def get_retriever(self, topic_name: str):
+        """El retriever con el que busca el agente del tema (se construye si aún no existe)."""
+        return self._entry(topic_name)[1]
+
+    def _entry(self, topic_name: str):
+        """(agente, retriever) del tema."""
+        with self._lock:
+            entry = (self._agents.get(topic_name), self._retrievers.get(topic_name))
+        if entry[0] is not None:
+            version = rag_loader.topic_version(topic_name)
+            if version == self._versions.get(topic_name):
+                with self._lock:
+                    self._hits += 1
+                return entry
+            self._swap_version(topic_name, version)
+
+        with self._topic_lock(topic_name):
+            # Otro hilo pudo construirlo mientras esperábamos el lock
+            with self._lock:
+                entry = (self._agents.get(topic_name), self._retrievers.get(topic_name))
+                if entry[0] is not None:
+                    self._hits += 1
+                    return entry
+
+            generation = self._generation
+            # Antes de construir: si se publica otra versión mientras tanto,
+            # la siguiente petición lo notará y lo reconstruirá
+            version = rag_loader.topic_version(topic_name)
+            start = time.perf_counter()
+            retriever = rag_loader.load_rag_for_topic(topic_name)
+            agent = self._builder(topic_name, retriever)
+            elapsed = time.perf_counter() - start
+
+            with self._lock:
+                if generation == self._generation:
+                    self._agents[topic_name] = agent
+                    self._retrievers[topic_name] = retriever
+                    self._versions[topic_name] = version
+                self._misses += 1
+                self._build_seconds[topic_name] = elapsed
+
+        logger.info("Agente '%s' construido en %.2fs", topic_name, elapsed)
+        return agent, retriever
+
+    def _swap_version(self, topic_name: str, version):
+        """Se publicó otra versión del índice del tema: descarta lo que dependía de la anterior."""
+        previous = self._versions.get(topic_name)
+        if isinstance(version, tuple):
+            # Multi-tema: solo los temas que cambiaron (o que aparecieron)
+            before = dict(previous or ())
+            changed = [topic for topic, v in version if before.get(topic) != v] or [topic_name]
+        else:
+            changed = [topic_name]
+        logger.info("Nueva versión del índice de '%s': %s -> %s", topic_name, previous, version)
+        with self._lock:
+            self._version_swaps += 1
+            # Por si ningún tema cambió (uno desapareció de "all")
+            self._agents.pop(topic_name, None)
+            self._retrievers.pop(topic_name, None)
+        for topic in changed:
+            self.invalidate(topic)
+
+    def warm_up(self, topics: Optional[List[str]] = None):
+        """
+        Construye por adelantado los agentes de los temas indicados (por
+        defecto, todas las carpetas *_vs de backend/vectorstores/).
+        Un tema que falla no impide calentar los demás.
+        """
+        topics = topics if topics is not None else rag_loader.list_available_topics()
+        if RERANK_ENABLED:
+            # La carga del cross-encoder corre en su propio hilo
+            reranker.ensure_loading()
+        for topic in topics:
+            try:
+                self.get(topic)
+            except Exception as exc:
+                logger.warning("No se pudo precargar el tema '%s': %r", topic, exc)
+
+    def invalidate(self, topic_name: Optional[str] = None):
+        """
+        Descarta el agente (y el vectorstore) de un tema, o de todos si
+        topic_name es None. Llamar después de reconstruir un vectorstore.
+        """
+        with self._lock:
+            # Los agentes multi-tema que usan ese tema también se descartan
+            topics = [t for t in self._agents if topic_name is None or key_includes(t, topic_name)]
+            for topic in topics:
+                self._agents.pop(topic, None)
+                self._retrievers.pop(topic, None)
+                self._versions.pop(topic, None)
+            self._invalidations += 1
+            self._generation += 1
+            callbacks = list(self._invalidation_callbacks)
+
+        rag_loader.invalidate_vectorstore(topic_name)
+
+        for callback in callbacks:
+            callback(topic_name)
+
+    def on_invalidate(self, callback: Callable):
+        """Registra un callback(topic_name) que se ejecuta en cada invalidación."""
+        with self._lock:
+            self._invalidation_callbacks.append(callback)
+
+    def stats(self) -> Dict[str, object]:
+        """Métricas de uso del registro."""
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "topics_loaded": sorted(self._agents),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": (self._hits / total) if total else 0.0,
+                "invalidations": self._invalidations,
+                "version_swaps": self._version_swaps,
+                "versions": dict(self._versions),
+                "build_seconds": dict(self._build_seconds),
+            }
+
+
+# Instancia única para todo el proceso
+agent_registry = AgentRegistry()
+
+# Las respuestas cacheadas de un tema dejan de valer al reconstruir su índice
+# (las de una versión reemplazada ya se descartan solas al consultarlas; así
+# además se libera la memoria)
+agent_registry.on_invalidate(answer_cache.invalidate)
+agent_registry.on_invalidate(retrieval_router.invalidate)
+
+
+def get_legal_agent(topic_name: str):
+    return agent_registry.get(topic_name)
+
+
+def warm_up_in_background():
+    """
+    Precarga los agentes de todos los temas en un hilo aparte para que el
+    arranque del servidor no espere a que cargue el modelo de embeddings.
+    Se desactiva con ASSISTLEG_WARMUP=0.
+    """
+    if os.getenv("ASSISTLEG_WARMUP", "1") == "0":
+        return None
+
+    thread = threading.Thread(
+        target=agent_registry.warm_up,
+        name="assistleg-warmup",
+        daemon=True,
+    )
+    thread.start()
+    return thread
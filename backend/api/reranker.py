@@ -0,0 +1,193 @@
+# backend/api/reranker.py
+
+import logging
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from api.tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+# RERANKING CON UN CROSS-ENCODER LOCAL (CPU)
+# Entre el retriever y el LLM: puntúa cada (pregunta, fragmento), reordena
+# y descarta los fragmentos poco relevantes, así el prompt lleva menos
+# tokens y mejor contexto. Es opcional (ASSISTLEG_RERANK=1) y nunca puede
+# costar más que RERANK_BUDGET_MS por petición:
+#   - si el modelo aún no está cargado, se carga en segundo plano y esa
+#     petición sigue sin reranking;
+#   - si no da tiempo a puntuar todos los candidatos, se puntúan los
+#     primeros (en el orden del retriever) y el resto queda detrás: antes
+#     de cada lote se estima su coste con la media móvil por par y no se
+#     empieza si no cabe en lo que queda del presupuesto;
+#   - la primera llamada, sin esa media todavía, puntúa un solo lote.
+
+ENABLED = os.getenv("ASSISTLEG_RERANK", "0") == "1"
+RERANK_MODEL_NAME = os.getenv("ASSISTLEG_RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+RERANK_BUDGET_MS = float(os.getenv("ASSISTLEG_RERANK_BUDGET_MS", "300"))
+# Candidatos que pide el retriever cuando hay reranking, y cuántos pasan al prompt
+RERANK_FETCH_K = int(os.getenv("ASSISTLEG_RERANK_FETCH_K", "8"))
+RERANK_TOP_N = int(os.getenv("ASSISTLEG_RERANK_TOP_N", "5"))
+# Relevancia mínima (sigmoide del logit del cross-encoder) para entrar al prompt
+RERANK_MIN_SCORE = float(os.getenv("ASSISTLEG_RERANK_MIN_SCORE", "0.1"))
+RERANK_BATCH_SIZE = 4
+# Cada petición que se salta por presupuesto rebaja así la estimación por par:
+# una medición fuera de lo normal (la primera inferencia en frío) no deja el
+# reranking apagado para siempre
+RERANK_SKIP_DECAY = 0.8
+
+
+def _sigmoid(x: float) -> float:
+    return 1.0 / (1.0 + math.exp(-x))
+
+
+class CrossEncoderReranker:
+
+    def __init__(self, model_name: str = RERANK_MODEL_NAME, budget_ms: float = RERANK_BUDGET_MS,
+                 top_n: int = RERANK_TOP_N, min_score: float = RERANK_MIN_SCORE, model=None):
+        self.model_name = model_name
+        self.budget_ms = budget_ms
+        self.top_n = top_n
+        self.min_score = min_score
+        self._model = model
+        self._loading = None
+        self._load_error = None
+        self._lock = threading.Lock()
+        # Media móvil del coste por par (ms): estima cuántos caben en el presupuesto
+        self._ms_per_pair = None
+
+        self._calls = 0
+        self._skipped_not_loaded = 0
+        self._skipped_budget = 0
+        self._truncated = 0
+        self._dropped = 0
+        self._total_ms = 0.0
+
+    # CARGA DEL MODELO
+
+    def _load(self):
+        try:
+            from sentence_transformers import CrossEncoder
+
+            logger.info("Cargando cross-encoder: %s", self.model_name)
+            self._model = CrossEncoder(self.model_name, device="cpu")
+        except Exception as exc:
+            logger.warning("No se pudo cargar el cross-encoder %s: %r", self.model_name, exc)
+            self._load_error = repr(exc)
+
+    def ensure_loading(self) -> bool:
+        """True si el modelo está listo; si no, lanza su carga en segundo plano."""
+        if self._model is not None:
+            return True
+        with self._lock:
+            if self._loading is None and self._load_error is None:
+                self._loading = threading.Thread(target=self._load, name="assistleg-rerank-load", daemon=True)
+                self._loading.start()
+        return False
+
+    def wait_until_loaded(self, timeout: Optional[float] = None) -> bool:
+        """Espera a que termine la carga (benchmarks, arranque). True si el modelo está listo."""
+        self.ensure_loading()
+        if self._loading is not None:
+            self._loading.join(timeout)
+        return self._model is not None
+
+    # RERANKING
+
+    def _score(self, query: str, docs: List[Any]) -> List[float]:
+        pairs = [(query, str(getattr(d, "page_content", d))) for d in docs]
+        logits = self._model.predict(pairs, batch_size=RERANK_BATCH_SIZE, show_progress_bar=False)
+        return [_sigmoid(float(x)) for x in logits]
+
+    def rerank(self, query: str, docs: List[Any], budget_ms: Optional[float] = None) -> List[Any]:
+        """Devuelve como mucho top_n documentos, los más relevantes primero."""
+        if not docs:
+            return docs
+        budget_ms = self.budget_ms if budget_ms is None else budget_ms
+
+        if not self.ensure_loading():
+            with self._lock:
+                self._skipped_not_loaded += 1
+            return docs[:self.top_n]
+
+        # ¿Cuántos candidatos caben en el presupuesto? Sin medición todavía
+        # (primera llamada) no se sabe: se puntúa un solo lote
+        ms_per_pair = self._ms_per_pair
+        if ms_per_pair:
+            capacity = min(len(docs), int(budget_ms / ms_per_pair))
+        else:
+            capacity = min(len(docs), RERANK_BATCH_SIZE)
+        if capacity <= 0:
+            with self._lock:
+                self._skipped_budget += 1
+                self._ms_per_pair *= RERANK_SKIP_DECAY
+            return docs[:self.top_n]
+
+        start = time.perf_counter()
+        scored = []
+        for offset in range(0, capacity, RERANK_BATCH_SIZE):
+            batch = docs[offset:min(offset + RERANK_BATCH_SIZE, capacity)]
+            # Antes de cada lote: si no cabe en lo que queda, se para aquí
+            remaining_ms = budget_ms - (time.perf_counter() - start) * 1000
+            if ms_per_pair and len(batch) * ms_per_pair > remaining_ms:
+                break
+            scored.extend(zip(self._score(query, batch), batch))
+        if not scored:
+            # Ni el primer lote cabía en lo que quedaba
+            with self._lock:
+                self._skipped_budget += 1
+            return docs[:self.top_n]
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        unscored = docs[len(scored):]
+
+        ranked = sorted(scored, key=lambda item: item[0], reverse=True)
+        # El mejor fragmento se conserva siempre, aunque puntúe bajo
+        kept = [doc for score, doc in ranked if score >= self.min_score] or [ranked[0][1]]
+        result = (kept + unscored)[:self.top_n]
+
+        with self._lock:
+            per_pair = elapsed_ms / len(scored)
+            self._ms_per_pair = per_pair if self._ms_per_pair is None else 0.8 * self._ms_per_pair + 0.2 * per_pair
+            self._calls += 1
+            self._total_ms += elapsed_ms
+            self._dropped += len(scored) - len(kept)
+            if unscored:
+                self._truncated += 1
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": ENABLED,
+                "model": self.model_name,
+                "loaded": self._model is not None,
+                "load_error": self._load_error,
+                "budget_ms": self.budget_ms,
+                "calls": self._calls,
+                "avg_ms": round(self._total_ms / self._calls, 1) if self._calls else 0.0,
+                "ms_per_pair": round(self._ms_per_pair, 2) if self._ms_per_pair else None,
+                "skipped_not_loaded": self._skipped_not_loaded,
+                "skipped_budget": self._skipped_budget,
+                "truncated": self._truncated,
+                "dropped_documents": self._dropped,
+            }
+
+
+reranker = CrossEncoderReranker()
+
+
+def rerank_documents(query: str, docs: List[Any]) -> List[Any]:
+    """Rerank si está activado; si no, los documentos tal cual."""
+    if not ENABLED:
+        return docs
+    with span("rerank", candidates=len(docs)) as stage:
+        try:
+            docs = reranker.rerank(query, docs)
+        except Exception:
+            logger.exception("Error en el reranking")
+            docs = docs[:RERANK_TOP_N]
+        stage.set(documents=len(docs))
+        return docs
@@ -0,0 +1,245 @@
+# backend/api/retrieval_router.py
+
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from api.answer_cache import normalize_question
+from api.lexical_index import parse_article_reference
+from api.memory import MAX_SESSIONS, SESSION_TTL_S
+from api.rag_loader import get_embeddings, topic_version
+from api.topics import key_includes
+from api.tracing import metrics, span
+
+logger = logging.getLogger(__name__)
+
+
+# ENRUTADO DE LA RECUPERACIÓN
+# Antes de buscar en el vectorstore se decide, sin llamar al LLM:
+#   - "retrieve": pregunta nueva → embedding + búsqueda, como siempre;
+#   - "reuse":    seguimiento sobre lo mismo ("¿y si el contrato es verbal?")
+#                 → los fragmentos del turno anterior de la sesión;
+#   - "history":  pedir algo sobre la propia charla ("resume lo que acabas
+#                 de explicar") → sin contexto, el LLM responde con el historial.
+# Primero reglas por palabras clave; si no deciden, un clasificador por
+# similitud del embedding de la pregunta (el MiniLM ya cargado; el vector
+# queda en la caché de embeddings y la búsqueda lo reutiliza) con frases
+# prototipo de cada ruta y con la pregunta anterior de la sesión.
+# Ante la duda se recupera. Cada decisión se registra (logger y
+# assistleg_route_total en /metrics) para medir las búsquedas ahorradas.
+
+ENABLED = os.getenv("ASSISTLEG_ROUTER", "1") != "0"
+# Similitud con la pregunta anterior a partir de la cual se reutiliza su contexto
+REUSE_THRESHOLD = float(os.getenv("ASSISTLEG_ROUTER_REUSE_THRESHOLD", "0.80"))
+# Similitud mínima con los prototipos de "history" para no recuperar
+HISTORY_THRESHOLD = float(os.getenv("ASSISTLEG_ROUTER_HISTORY_THRESHOLD", "0.75"))
+
+RETRIEVE, REUSE, HISTORY = "retrieve", "reuse", "history"
+
+# Pedidos sobre la propia conversación: no necesitan documentos
+_HISTORY_PATTERNS = re.compile(
+    r"\b(resume|resumes|resumir|resumen|resumelo|resúmelo|en pocas palabras|"
+    r"repite|repetir|repítelo|reformula|expl[ií]ca(lo)? (mas|más) (simple|sencillo|claro)|"
+    r"lo que (acabas de|me) (decir|explicar|dijiste|explicaste)|"
+    r"(lo que|que) (dijiste|explicaste|mencionaste))\b|"
+    r"^(ok|vale|perfecto|entendido|(muchas )?gracias)( gracias)?$"
+)
+# Seguimientos que remiten al turno anterior: el mismo contexto sirve.
+# Solo anáforas claras; "¿y si...?" lo decide la similitud con la pregunta anterior
+_REUSE_PATTERNS = re.compile(
+    r"\b(eso|lo anterior|ese artículo|esa norma|ese caso|en ese caso|"
+    r"dicho artículo|dicha norma|más detalle|mas detalle|profundiza|amplía)\b"
+)
+# Referencias explícitas a la norma: siempre se busca
+_RETRIEVE_PATTERNS = re.compile(r"\b(art[ií]culo|art\.?)\s*\d+|\b(ley|decreto|c[oó]digo)\s+\d+")
+
+# Frases prototipo de cada ruta para el clasificador por embeddings
+PROTOTYPES = {
+    HISTORY: [
+        "puedes resumir lo que acabas de explicar",
+        "explícalo con palabras más sencillas",
+        "repite la respuesta anterior",
+        "dame un resumen de nuestra conversación",
+        "qué me dijiste antes",
+        "gracias por la explicación",
+    ],
+    RETRIEVE: [
+        "qué dice la ley sobre el contrato de trabajo",
+        "cuáles son los derechos fundamentales",
+        "cuánto dura el periodo de prueba",
+        "qué requisitos tiene la homologación de asignaturas",
+        "qué sanciones disciplinarias existen",
+    ],
+}
+
+
+class RouteDecision(NamedTuple):
+    decision: str
+    reason: str
+    documents: List[Any]
+    vector: Optional[np.ndarray] = None
+
+
+class _SessionContext(NamedTuple):
+    topic: str
+    version: Any       # versión del índice de la que salieron los fragmentos
+    question: str
+    vector: Optional[np.ndarray]
+    documents: List[Any]
+    updated: float
+
+
+class RetrievalRouter:
+    """
+    Decide la ruta de cada pregunta y recuerda, por sesión, la última
+    pregunta recuperada con sus fragmentos (LRU + TTL, como la memoria).
+    Los fragmentos de una versión del índice ya reemplazada no se reutilizan.
+    """
+
+    def __init__(self, reuse_threshold: float = REUSE_THRESHOLD, history_threshold: float = HISTORY_THRESHOLD,
+                 max_sessions: int = MAX_SESSIONS, ttl_s: int = SESSION_TTL_S, embed=None, version_of=None):
+        self.reuse_threshold = reuse_threshold
+        self.history_threshold = history_threshold
+        self.max_sessions = max_sessions
+        self.ttl_s = ttl_s
+        self._embed = embed
+        self._version_of = version_of or topic_version
+        self._sessions: "OrderedDict[str, _SessionContext]" = OrderedDict()
+        self._prototypes: Optional[Dict[str, np.ndarray]] = None
+        self._lock = threading.Lock()
+        self._decisions = Counter()
+
+    # Embeddings
+
+    def _vector(self, text: str) -> Optional[np.ndarray]:
+        try:
+            embed = self._embed or get_embeddings().embed_query
+            vector = np.asarray(embed(text), dtype=np.float32)
+        except Exception as exc:
+            logger.warning("Router sin embedding (%r): se recupera", exc)
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _prototype_matrix(self) -> Dict[str, np.ndarray]:
+        if self._prototypes is None:
+            embed = self._embed or get_embeddings().embed_documents
+            prototypes = {}
+            for route, phrases in PROTOTYPES.items():
+                matrix = np.asarray(embed(phrases), dtype=np.float32)
+                prototypes[route] = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+            self._prototypes = prototypes
+        return self._prototypes
+
+    # Contexto por sesión
+
+    def _previous(self, session_id: str, topic: str) -> Optional[_SessionContext]:
+        now = time.monotonic()
+        with self._lock:
+            while self._sessions:
+                oldest_id, oldest = next(iter(self._sessions.items()))
+                if now - oldest.updated <= self.ttl_s:
+                    break
+                self._sessions.popitem(last=False)
+            previous = self._sessions.get(session_id)
+        if previous is None or previous.topic != topic:
+            return None
+        if previous.version != self._version_of(topic):
+            return None
+        return previous
+
+    def remember(self, session_id: str, topic: str, question: str, documents: List[Any],
+                 vector: Optional[np.ndarray] = None):
+        """Guarda los fragmentos recuperados en este turno para los seguimientos."""
+        if not ENABLED or not session_id:
+            return
+        if vector is None and parse_article_reference(question) is None:
+            # Ya calculado por la búsqueda: acierto en la caché de embeddings.
+            # "artículo N" se resolvió sin embedding: no se calcula solo para esto
+            vector = self._vector(question)
+        context = _SessionContext(topic, self._version_of(topic), question, vector, list(documents), time.monotonic())
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._sessions[session_id] = context
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def invalidate(self, topic: Optional[str] = None):
+        """Olvida los fragmentos guardados de un tema (o de todos) al reconstruir su índice."""
+        with self._lock:
+            stale = [sid for sid, ctx in self._sessions.items() if topic is None or key_includes(ctx.topic, topic)]
+            for session_id in stale:
+                del self._sessions[session_id]
+
+    # Decisión
+
+    def _classify(self, question: str, normalized: str, previous: Optional[_SessionContext],
+                  has_history: bool):
+        """(ruta, motivo, vector de la pregunta o None)."""
+        if _RETRIEVE_PATTERNS.search(normalized):
+            return RETRIEVE, "explicit_reference", None
+        if has_history and _HISTORY_PATTERNS.search(normalized):
+            return HISTORY, "keyword", None
+        if previous is not None and previous.documents and _REUSE_PATTERNS.search(normalized):
+            return REUSE, "keyword", None
+        if not has_history:
+            return RETRIEVE, "no_history", None
+
+        vector = self._vector(question)
+        if vector is None:
+            return RETRIEVE, "no_embedding", None
+
+        prototypes = self._prototype_matrix()
+        history_score = float(np.max(prototypes[HISTORY] @ vector))
+        retrieve_score = float(np.max(prototypes[RETRIEVE] @ vector))
+        if history_score >= self.history_threshold and history_score > retrieve_score:
+            return HISTORY, "similar_to_history", vector
+
+        if previous is not None and previous.documents and previous.vector is not None:
+            if float(previous.vector @ vector) >= self.reuse_threshold:
+                return REUSE, "similar_to_previous", vector
+
+        return RETRIEVE, "new_question", vector
+
+    def route(self, session_id: Optional[str], topic: str, question: str, has_history: bool) -> RouteDecision:
+        """
+        Ruta de la pregunta. Con "reuse", `documents` trae los fragmentos
+        del turno anterior; con "retrieve" hay que buscar y llamar a remember().
+        """
+        if not ENABLED:
+            return RouteDecision(RETRIEVE, "disabled", [])
+
+        with span("route", topic=topic) as stage:
+            previous = self._previous(session_id, topic) if session_id else None
+            decision, reason, vector = self._classify(question, normalize_question(question), previous, has_history)
+            documents = list(previous.documents) if decision == REUSE else []
+            stage.set(decision=decision, reason=reason)
+
+        with self._lock:
+            self._decisions[(decision, reason)] += 1
+        metrics.inc("assistleg_route_total", {"decision": decision, "reason": reason})
+        logger.info("route=%s reason=%s topic=%s session=%s", decision, reason, topic, session_id)
+        return RouteDecision(decision, reason, documents, vector)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            by_decision = Counter()
+            for (decision, _), count in self._decisions.items():
+                by_decision[decision] += count
+            return {
+                "enabled": ENABLED,
+                "sessions": len(self._sessions),
+                "decisions": dict(by_decision),
+                "reasons": {f"{d}:{r}": c for (d, r), c in sorted(self._decisions.items())},
+                # Búsquedas (embedding + vectorstore) que no se hicieron
+                "saved_retrievals": by_decision[REUSE] + by_decision[HISTORY],
+            }
+
+
+retrieval_router = RetrievalRouter()
@@ -1,3 +1,939 @@
-from django.test import TestCase
+# backend/api/tests.py
 
-# Create your tests here.
+import contextvars
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.messages import AIMessage, HumanMessage
+from rest_framework.test import APIClient
+
+from api import create_vectorstores, llm_gateway, rag_loader, react_agent, registry, tracing
+from api.answer_cache import SemanticAnswerCache, normalize_question
+from api.embeddings import MicroBatchingEmbeddings
+from api.fake_llm import FakeChatModel, FakeLLMError
+from api.federated import ARTICLE_SCORE, merge_results, search_topic
+from api.indexing_jobs import UploadError, save_upload
+from api.legal_splitter import split_legal_document
+from api.lexical_index import BM25Index
+from api.llm_gateway import CircuitBreaker, LLMThrottled, LLMUnavailable, ResilientChatModel
+from api.memory import BoundedChatMessageHistory, InMemoryHistoryStore, SQLiteHistoryStore
+from api.models import ChatMessage
+from api.prompt_builder import HistorySummarizer, build_prompt_parts
+from api.prompt_templates import assistant_system_prompt
+from api.registry import AgentRegistry, agent_registry
+from api.reranker import RERANK_BATCH_SIZE, CrossEncoderReranker
+from api.retrieval_router import HISTORY, RETRIEVE, REUSE, RetrievalRouter, RouteDecision, _SessionContext
+from api.tokens import count_tokens
+from api.tracing import MetricsRegistry, current_trace, span, trace_request
+from api.vector_index import NumPyVectorIndex
+from api.vector_snapshot import export_snapshot, load_snapshot
+from api.vectorstore_versions import begin_version, collect_garbage, list_versions, publish_version, topic_lock
+
+
+class BM25IndexTests(SimpleTestCase):
+
+    def setUp(self):
+        self.index = BM25Index.build(
+            ["a", "b", "c"],
+            [
+                "ARTÍCULO 1. El contrato de trabajo puede ser verbal o escrito.",
+                "ARTÍCULO 2. El periodo de prueba no puede exceder de dos meses.",
+                "Disposiciones finales sobre la vigencia de la norma.",
+            ],
+            [{"articulo": "1"}, {"articulo": "2"}, {}],
+        )
+
+    def test_search_ranks_matching_fragments(self):
+        results = self.index.search("duración del periodo de prueba", k=3)
+        self.assertEqual(results[0][0], 1)
+        self.assertEqual(len(results), 1)
+
+    def test_search_within_allowed_positions(self):
+        self.assertEqual(self.index.search("contrato trabajo", allowed=[1, 2]), [])
+
+    def test_articles_from_metadata(self):
+        self.assertEqual(self.index.article("2"), [1])
+        self.assertEqual(self.index.article("9"), [])
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.index.save(Path(tmp))
+            loaded = BM25Index.load(Path(tmp))
+        self.assertEqual(loaded.search("periodo de prueba"), self.index.search("periodo de prueba"))
+        self.assertEqual(loaded.document(0).metadata, {"articulo": "1"})
+
+
+class LegalSplitterTests(SimpleTestCase):
+
+    PAGES = [
+        (1, "TÍTULO I\nDISPOSICIONES GENERALES\nCAPÍTULO II. Del contrato\n"
+            "ARTÍCULO 1o. Objeto. Este código regula las relaciones de trabajo.\n"
+            "PARÁGRAFO. Se aplica en todo el territorio."),
+        (2, "ARTÍCULO 2. Aplicación territorial.\nTÍTULO II. Del salario\nARTÍCULO 3. Salario mínimo."),
+    ]
+
+    def test_one_fragment_per_article_with_structure(self):
+        chunks = split_legal_document(self.PAGES, {"source": "cst.pdf"})
+        self.assertEqual([m["articulo"] for _, m in chunks], ["1", "2", "3"])
+        first = chunks[0][1]
+        self.assertEqual((first["titulo"], first["titulo_nombre"], first["capitulo"]), (1, "DISPOSICIONES GENERALES", 2))
+        self.assertEqual((first["page"], first["paragrafos"], first["source"]), (1, 1, "cst.pdf"))
+        # Un título nuevo cierra el capítulo anterior
+        self.assertEqual(chunks[2][1]["titulo"], 2)
+        self.assertNotIn("capitulo", chunks[2][1])
+
+    def test_long_articles_are_split_in_parts(self):
+        pages = [(1, "ARTÍCULO 7. Jornada.\n" + "\n".join(["línea de texto de la jornada"] * 20))]
+        chunks = split_legal_document(pages, {}, max_chars=200)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual([m["parte"] for _, m in chunks], list(range(1, len(chunks) + 1)))
+        self.assertTrue(chunks[1][0].startswith("ARTÍCULO 7 (continuación)"))
+        self.assertTrue(all(len(text) <= 200 + len("ARTÍCULO 7 (continuación)\n") for text, _ in chunks))
+
+    def test_text_without_articles(self):
+        self.assertEqual(split_legal_document([(1, "Un texto sin artículos.")], {}), [])
+
+
+class _SlowCrossEncoder:
+    """Cross-encoder falso: tarda ms_per_pair por par y cuenta los pares puntuados."""
+
+    def __init__(self, ms_per_pair):
+        self.ms_per_pair = ms_per_pair
+        self.batches = []
+
+    def predict(self, pairs, **kwargs):
+        self.batches.append(len(pairs))
+        time.sleep(self.ms_per_pair * len(pairs) / 1000)
+        return [1.0] * len(pairs)
+
+
+class RerankerBudgetTests(SimpleTestCase):
+
+    def setUp(self):
+        self.model = _SlowCrossEncoder(ms_per_pair=10)
+        self.reranker = CrossEncoderReranker(model=self.model, budget_ms=100, top_n=20, min_score=0.0)
+        self.docs = [Document(page_content=f"fragmento {i}") for i in range(20)]
+
+    def test_first_call_scores_a_single_batch(self):
+        result = self.reranker.rerank("pregunta", self.docs)
+        self.assertEqual(self.model.batches, [RERANK_BATCH_SIZE])
+        self.assertEqual(len(result), 20)
+        self.assertEqual(self.reranker.stats()["truncated"], 1)
+
+    def test_batches_stop_within_the_budget(self):
+        self.reranker.rerank("pregunta", self.docs)
+        self.model.batches.clear()
+
+        start = time.perf_counter()
+        self.reranker.rerank("pregunta", self.docs)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        # 100 ms a ~10 ms por par: unos 9 pares, nunca los 20
+        self.assertLess(sum(self.model.batches), 20)
+        self.assertLess(elapsed_ms, 100 * 1.5)
+
+
+def _fake_embed():
+    # Sirve como embed_query y como embed_documents (así lo usa el router)
+    model = DeterministicFakeEmbedding(size=32)
+    return lambda text: model.embed_documents(text) if isinstance(text, list) else model.embed_query(text)
+
+
+class _FakeRetriever:
+    def invoke(self, question):
+        return [Document(page_content="Artículo 1. Texto de prueba.")]
+
+
+class AnswerCacheRouteTests(SimpleTestCase):
+    """Solo las respuestas recuperadas del índice pasan a la caché compartida."""
+
+    def setUp(self):
+        self.cache = SemanticAnswerCache(embed=_fake_embed())
+        patches = [
+            mock.patch.object(react_agent, "answer_cache", self.cache),
+            mock.patch.object(react_agent, "get_llm", lambda: FakeChatModel(latency_s=0, answer="respuesta")),
+            mock.patch.object(agent_registry, "get_retriever", lambda topic: _FakeRetriever()),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def _ask(self, decision, session_id, question="cuánto dura el periodo de prueba"):
+        docs = [Document(page_content="fragmento del turno anterior")] if decision == REUSE else []
+        route = RouteDecision(decision, "test", docs)
+        with mock.patch.object(react_agent.retrieval_router, "route", return_value=route), \
+                mock.patch.object(react_agent.retrieval_router, "remember"):
+            events = list(react_agent.stream_legal_answer("tema_vs", question, session_id))
+        return events[-1]["answer"]
+
+    def test_reuse_and_history_answers_are_not_stored(self):
+        for decision in (REUSE, HISTORY):
+            with self.subTest(decision=decision):
+                self._ask(decision, f"sesion-{decision}")
+                self.assertEqual(self.cache.stats()["stores"], 0)
+                # Otra sesión con la misma pregunta no recibe esa respuesta
+                self.assertIsNone(self.cache.lookup("tema_vs", "cuánto dura el periodo de prueba")[0])
+
+    def test_retrieved_answer_is_stored(self):
+        self._ask(RETRIEVE, "sesion-a")
+        self.assertEqual(self.cache.stats()["stores"], 1)
+        self.assertEqual(self.cache.lookup("tema_vs", "cuánto dura el periodo de prueba")[0], "respuesta")
+
+
+class RetrievalRouterClassifyTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = RetrievalRouter(embed=_fake_embed())
+
+    def _classify(self, question, previous=None, has_history=True):
+        return self.router._classify(question, normalize_question(question), previous, has_history)[:2]
+
+    def _previous(self):
+        docs = [Document(page_content="Artículo 1.")]
+        return _SessionContext("tema_vs", None, "qué es el periodo de prueba", None, docs, time.monotonic())
+
+    def test_history_keywords_with_and_without_accent(self):
+        for question in ("explícalo más simple", "explicalo mas sencillo", "explica más claro"):
+            with self.subTest(question=question):
+                self.assertEqual(self._classify(question), (HISTORY, "keyword"))
+
+    def test_explicit_reference_always_retrieves(self):
+        self.assertEqual(self._classify("resume el artículo 5", self._previous()), (RETRIEVE, "explicit_reference"))
+
+    def test_first_question_retrieves(self):
+        self.assertEqual(self._classify("resume eso", has_history=False), (RETRIEVE, "no_history"))
+
+    def test_follow_up_reuses_previous_documents(self):
+        self.assertEqual(self._classify("y en ese caso qué pasa", self._previous()), (REUSE, "keyword"))
+        # Sin fragmentos del turno anterior no hay nada que reutilizar
+        self.assertNotEqual(self._classify("y en ese caso qué pasa")[0], REUSE)
+
+
+class AskBatchPermissionTests(SimpleTestCase):
+
+    def test_anonymous_clients_are_rejected(self):
+        response = APIClient().post("/api/ask/batch/", {"items": [{"question": "hola"}]}, format="json")
+        self.assertEqual(response.status_code, 403)
+
+    def test_admin_reaches_the_batch(self):
+        client = APIClient()
+        client.force_authenticate(user=User(username="admin", is_staff=True))
+        response = client.post("/api/ask/batch/", {"items": []}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("error", response.json())
+
+
+class VectorstoreVersionsGCTests(SimpleTestCase):
+
+    def setUp(self):
+        self.topic_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.topic_dir, True)
+
+    def _publish(self):
+        version, build_dir = begin_version(self.topic_dir, copy_current=False)
+        (build_dir / "chroma.sqlite3").touch()
+        publish_version(self.topic_dir, version, build_dir)
+        return version
+
+    def test_keeps_recent_versions_and_respects_the_grace_period(self):
+        versions = [self._publish() for _ in range(3)]
+        # Recién reemplazadas: todavía dentro del periodo de gracia
+        self.assertEqual(collect_garbage(self.topic_dir, keep=1, grace_seconds=600), [])
+
+        self.assertEqual(collect_garbage(self.topic_dir, keep=2, grace_seconds=0), versions[:1])
+        self.assertEqual(list_versions(self.topic_dir), versions[1:])
+
+    def test_never_removes_current_or_unpublished_versions(self):
+        current = self._publish()
+        building, _ = begin_version(self.topic_dir, copy_current=True)
+        self.assertEqual(collect_garbage(self.topic_dir, keep=1, grace_seconds=0), [])
+        self.assertEqual(list_versions(self.topic_dir), [current])
+        self.assertTrue((self.topic_dir / "versions" / building).is_dir())
+
+
+class IndexVersionTests(SimpleTestCase):
+    """Al publicarse otra versión del índice, nada de la anterior se reutiliza."""
+
+    def setUp(self):
+        self.version = "v1"
+
+    def _version_of(self, topic):
+        return self.version
+
+    def test_answer_cache_drops_answers_of_a_replaced_version(self):
+        cache = SemanticAnswerCache(embed=_fake_embed(), version_of=self._version_of)
+        cache.store("tema_vs", "qué es el periodo de prueba", "respuesta v1")
+        self.assertEqual(cache.lookup("tema_vs", "qué es el periodo de prueba")[0], "respuesta v1")
+
+        self.version = "v2"
+        self.assertIsNone(cache.lookup("tema_vs", "qué es el periodo de prueba")[0])
+        self.assertEqual(cache.stats()["stale_versions"], 1)
+
+    def test_router_does_not_reuse_documents_of_a_replaced_version(self):
+        router = RetrievalRouter(embed=_fake_embed(), version_of=self._version_of)
+        docs = [Document(page_content="Artículo 1.")]
+        router.remember("sesion-a", "tema_vs", "qué es el periodo de prueba", docs)
+        self.assertEqual(router.route("sesion-a", "tema_vs", "y en ese caso", has_history=True).decision, REUSE)
+
+        self.version = "v2"
+        self.assertEqual(router.route("sesion-a", "tema_vs", "y en ese caso", has_history=True).decision, RETRIEVE)
+
+
+def _gateway(primary, fallback=None, **kwargs):
+    return ResilientChatModel(primary=primary, primary_name="principal", fallback=fallback,
+                              fallback_name="respaldo" if fallback is not None else "", **kwargs)
+
+
+class LLMGatewayTests(SimpleTestCase):
+
+    def setUp(self):
+        # Sin esperas entre reintentos
+        patch = mock.patch.object(llm_gateway, "backoff_s", return_value=0.0)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_breaker_opens_and_half_opens(self):
+        breaker = CircuitBreaker(failures=2, cooldown_s=0.05)
+        self.assertFalse(breaker.record_failure())
+        self.assertTrue(breaker.record_failure())
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, "half_open")
+        # Una sola prueba a la vez
+        self.assertFalse(breaker.allow())
+        # Si la prueba falla, vuelve a abrirse
+        self.assertTrue(breaker.record_failure())
+        self.assertEqual(breaker.state, "open")
+
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+
+    def test_open_breaker_stops_calling_the_model(self):
+        model = _gateway(FakeChatModel(latency_s=0, failure_rate=1.0, seed=1), max_retries=0)
+        model._targets[0].breaker = CircuitBreaker(failures=2, cooldown_s=60)
+        for _ in range(2):
+            with self.assertRaises(FakeLLMError):
+                model.invoke("hola")
+        with self.assertRaises(LLMUnavailable):
+            model.invoke("hola")
+        self.assertEqual(model.stats()["events"]["breaker_open"], 1)
+        self.assertEqual(model.stats()["breakers"], {"principal": "open"})
+
+    def test_token_bucket_rejection_refunds_the_request(self):
+        model = _gateway(FakeChatModel(latency_s=0, seed=2), rpm=10, tpm=100, queue_timeout_s=0)
+        target = model._targets[0]
+        # La primera llamada gasta toda la cuota de tokens/min
+        model.invoke("hola")
+        requests_left = target.requests.tokens
+        with self.assertRaises(LLMThrottled):
+            model.invoke("hola")
+        # La segunda no cabe en tokens/min: la petición que ya había
+        # reservado en peticiones/min se devuelve
+        self.assertAlmostEqual(target.requests.tokens, requests_left, delta=0.1)
+        self.assertEqual(model.stats()["events"], {"success": 1, "throttle": 1})
+        self.assertEqual(target.breaker.state, "closed")
+
+    def test_retries_then_falls_back_on_transient_errors(self):
+        for status in (429, 503):
+            with self.subTest(status=status), mock.patch.object(FakeLLMError, "status_code", status):
+                model = _gateway(FakeChatModel(latency_s=0, failure_rate=1.0, seed=3),
+                                 FakeChatModel(latency_s=0, seed=4, answer="respuesta del respaldo"),
+                                 max_retries=2)
+                self.assertEqual(model.invoke("hola").content, "respuesta del respaldo")
+                events = model.stats()["events"]
+                self.assertEqual(events["retry"], 2)
+                self.assertEqual(events["error"], 3)
+                self.assertEqual(events["fallback"], 1)
+
+    def test_client_errors_are_not_retried(self):
+        with mock.patch.object(FakeLLMError, "status_code", 400):
+            model = _gateway(FakeChatModel(latency_s=0, failure_rate=1.0, seed=5),
+                             FakeChatModel(latency_s=0, seed=6), max_retries=2)
+            with self.assertRaises(FakeLLMError):
+                model.invoke("hola")
+        self.assertNotIn("retry", model.stats()["events"])
+        self.assertNotIn("fallback", model.stats()["events"])
+
+    def test_no_retry_after_the_first_streamed_chunk(self):
+        model = _gateway(FakeChatModel(latency_s=0, failure_rate=1.0, seed=7, answer="uno dos tres cuatro"),
+                         FakeChatModel(latency_s=0, seed=8), max_retries=2)
+        received = []
+        with self.assertRaises(FakeLLMError):
+            for chunk in model.stream("hola"):
+                received.append(chunk.content)
+        self.assertEqual("".join(received), "uno dos")
+        events = model.stats()["events"]
+        self.assertNotIn("retry", events)
+        self.assertNotIn("fallback", events)
+
+
+class SemanticAnswerCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        # Todas las preguntas con el mismo vector: solo deciden los identificadores
+        self.cache = SemanticAnswerCache(embed=lambda text: [1.0, 0.0, 0.0], version_of=lambda topic: None)
+        self.cache.store("tema_vs", "¿Qué dice la Ley 100?", "respuesta ley 100")
+
+    def test_similar_question_about_another_norm_misses(self):
+        self.assertIsNone(self.cache.lookup("tema_vs", "qué dice la ley 50")[0])
+        self.assertIsNone(self.cache.lookup("tema_vs", "qué dice la ley 100 de 1993")[0])
+
+    def test_similar_question_with_the_same_identifiers_hits(self):
+        self.assertEqual(self.cache.lookup("tema_vs", "y qué dice la ley 100")[0], "respuesta ley 100")
+
+    def test_chapter_numerals_count_as_identifiers(self):
+        self.cache.store("tema_vs", "qué regula el capítulo III", "respuesta capítulo III")
+        self.assertIsNone(self.cache.lookup("tema_vs", "qué regula el capítulo IV")[0])
+        self.assertEqual(self.cache.lookup("tema_vs", "que regula el capitulo iii")[0], "respuesta capítulo III")
+
+
+class RerankerRecoveryTests(SimpleTestCase):
+
+    def test_one_slow_measurement_does_not_disable_reranking(self):
+        model = _SlowCrossEncoder(ms_per_pair=1)
+        reranker = CrossEncoderReranker(model=model, budget_ms=50, top_n=20, min_score=0.0)
+        docs = [Document(page_content=f"fragmento {i}") for i in range(8)]
+        # Primera inferencia en frío: 200 ms por par, más que todo el presupuesto
+        reranker._ms_per_pair = 200.0
+
+        for _ in range(20):
+            reranker.rerank("pregunta", docs)
+        self.assertGreater(reranker.stats()["skipped_budget"], 0)
+        self.assertTrue(model.batches)
+        self.assertLess(reranker.stats()["ms_per_pair"], 50)
+
+
+class RerankerEmptyBatchTests(SimpleTestCase):
+
+    def test_no_batch_fits_in_what_is_left(self):
+        model = _SlowCrossEncoder(ms_per_pair=0)
+        reranker = CrossEncoderReranker(model=model, budget_ms=100, top_n=3)
+        reranker._ms_per_pair = 10.0
+        docs = [Document(page_content=f"fragmento {i}") for i in range(8)]
+        # Cada lectura del reloj avanza un segundo: el primer lote ya no cabe
+        clock = iter(range(0, 1000))
+        with mock.patch("api.reranker.time.perf_counter", side_effect=lambda: float(next(clock))):
+            self.assertEqual(reranker.rerank("pregunta", docs), docs[:3])
+        self.assertEqual(model.batches, [])
+        self.assertEqual(reranker.stats()["skipped_budget"], 1)
+
+
+class VectorstoreTopicLockTests(SimpleTestCase):
+
+    def test_second_ingestion_waits_for_the_first(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            topic_dir = Path(tmp) / "tema_vs"
+            order = []
+
+            def second():
+                with topic_lock(topic_dir):
+                    order.append("second")
+
+            with topic_lock(topic_dir):
+                worker = threading.Thread(target=second)
+                worker.start()
+                worker.join(0.3)
+                self.assertTrue(worker.is_alive())
+                order.append("first")
+            worker.join(5)
+            self.assertEqual(order, ["first", "second"])
+
+
+class LLMGatewayHedgeTests(SimpleTestCase):
+
+    def test_hedge_without_a_free_slot_refunds_its_quota(self):
+        gateway = _gateway(FakeChatModel(latency_s=0.1), rpm=60, max_concurrency=1, hedge_ms=20)
+        self.assertTrue(gateway.invoke("pregunta").content)
+        # Solo se gastó la petición que de verdad salió
+        self.assertGreater(gateway._targets[0].requests.tokens, 58.5)
+        self.assertNotIn("hedge", gateway.stats()["events"])
+
+    def test_losing_request_keeps_its_slot_until_it_ends(self):
+        gateway = _gateway(FakeChatModel(latency_s=0), max_concurrency=2, hedge_ms=20)
+        release = threading.Event()
+        calls = []
+
+        def call_once(target, messages, stop, kwargs):
+            calls.append(1)
+            if len(calls) == 1:
+                release.wait(5)
+                return AIMessage(content="lenta")
+            return AIMessage(content="rápida")
+
+        # La primera petición tarda, la de cobertura responde ya
+        with mock.patch.object(ResilientChatModel, "_call_once", side_effect=call_once):
+            self.assertEqual(gateway.invoke("pregunta").content, "rápida")
+            self.assertEqual(gateway._slots.in_flight, 1)
+            release.set()
+            deadline = time.monotonic() + 5
+            while gateway._slots.in_flight and time.monotonic() < deadline:
+                time.sleep(0.01)
+        self.assertEqual(gateway._slots.in_flight, 0)
+
+
+def _turn(number: int, size: int = 8):
+    return [HumanMessage(content=f"p{number}".ljust(size, ".")), AIMessage(content=f"r{number}".ljust(size, "."))]
+
+
+class ChatMemoryTests(SimpleTestCase):
+
+    def test_history_keeps_the_last_turns(self):
+        history = BoundedChatMessageHistory(max_turns=2, max_tokens=10_000)
+        for number in range(3):
+            history.add_messages(_turn(number))
+        self.assertEqual([m.content[:2] for m in history.messages], ["p1", "r1", "p2", "r2"])
+
+    def test_history_fits_the_token_budget_but_keeps_the_last_turn(self):
+        history = BoundedChatMessageHistory(max_turns=10, max_tokens=5)
+        history.add_messages(_turn(0))
+        history.add_messages(_turn(1))
+        # Cada turno son 4 tokens: solo cabe el último
+        self.assertEqual([m.content[:2] for m in history.messages], ["p1", "r1"])
+        history.add_messages(_turn(2, size=80))
+        self.assertEqual([m.content[:2] for m in history.messages], ["p2", "r2"])
+
+    def test_store_evicts_the_least_recently_used_session(self):
+        store = InMemoryHistoryStore(max_sessions=2)
+        first = store.get("a")
+        store.get("b").add_messages(_turn(0))
+        store.get("a")
+        store.get("c")
+        self.assertIs(store.get("a"), first)
+        self.assertEqual(store.stats()["sessions"], 2)
+        self.assertEqual(store.stats()["evictions"], 1)
+        # "b" era la menos usada: vuelve vacía
+        self.assertEqual(store.get("b").messages, [])
+
+    def test_store_expires_idle_sessions(self):
+        store = InMemoryHistoryStore(ttl_s=10)
+        with mock.patch("api.memory.time.monotonic", return_value=100.0):
+            old = store.get("a")
+            old.add_messages(_turn(0))
+        with mock.patch("api.memory.time.monotonic", return_value=105.0):
+            self.assertIs(store.get("a"), old)
+        with mock.patch("api.memory.time.monotonic", return_value=116.0):
+            self.assertEqual(store.get("a").messages, [])
+        self.assertEqual(store.stats()["expirations"], 1)
+
+
+class SQLiteChatMemoryTests(TestCase):
+
+    def test_history_is_trimmed_per_session(self):
+        store = SQLiteHistoryStore(max_turns=2, max_tokens=10_000)
+        for number in range(3):
+            store.get("a").add_messages(_turn(number))
+        store.get("b").add_messages(_turn(9))
+        self.assertEqual([m.content[:2] for m in store.get("a").messages], ["p1", "r1", "p2", "r2"])
+        self.assertIsInstance(store.get("a").messages[0], HumanMessage)
+        self.assertEqual(store.stats()["sessions"], 2)
+        store.clear("a")
+        self.assertEqual(store.get("a").messages, [])
+
+    def test_purge_removes_idle_sessions_only(self):
+        store = SQLiteHistoryStore(ttl_s=60)
+        store.get("vieja").add_messages(_turn(0))
+        store.get("nueva").add_messages(_turn(1))
+        ChatMessage.objects.filter(session_id="vieja").update(created_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(store.purge_expired(), 1)
+        self.assertEqual(store.get("vieja").messages, [])
+        self.assertEqual(len(store.get("nueva").messages), 2)
+
+
+def _long_history(turns: int):
+    messages = []
+    for number in range(turns):
+        messages.append(HumanMessage(content=f"Pregunta {number} sobre el contrato de trabajo. " + "detalle " * 30))
+        messages.append(AIMessage(content=f"Respuesta {number} con la norma aplicable. " + "explicación " * 30))
+    return messages
+
+
+class PromptBuilderTests(SimpleTestCase):
+
+    def setUp(self):
+        self.max_tokens = count_tokens(assistant_system_prompt) + 600
+
+    def test_history_over_the_budget_is_summarized(self):
+        messages = _long_history(12)
+        parts = build_prompt_parts("¿Y el periodo de prueba?", messages, [], session_id="s",
+                                   max_tokens=self.max_tokens, summarizer=HistorySummarizer())
+        tokens = parts["tokens"]
+        self.assertLessEqual(tokens["total_tokens"], self.max_tokens)
+        self.assertGreater(tokens["messages_summarized"], 0)
+        self.assertEqual(tokens["messages_kept"] + tokens["messages_summarized"], len(messages))
+        self.assertIn("Resumen de la conversación anterior", parts["history_text"])
+        self.assertIn("Respuesta 11", parts["history_text"])
+        # Los turnos antiguos solo aparecen resumidos
+        self.assertNotIn("Pregunta 0 sobre el contrato de trabajo. detalle", parts["history_text"])
+
+    def test_session_summary_only_folds_new_messages(self):
+        summarizer = HistorySummarizer()
+        messages = _long_history(12)
+        with mock.patch.object(summarizer, "_fold", wraps=summarizer._fold) as fold:
+            first = build_prompt_parts("¿Y las vacaciones?", messages, [], session_id="s",
+                                       max_tokens=self.max_tokens, summarizer=summarizer)
+            summarized = first["tokens"]["messages_summarized"]
+            self.assertEqual(len(fold.call_args.args[1]), summarized)
+
+            # La misma conversación: el resumen guardado vale tal cual
+            build_prompt_parts("¿Y las vacaciones?", messages, [], session_id="s",
+                               max_tokens=self.max_tokens, summarizer=summarizer)
+            self.assertEqual(fold.call_count, 1)
+
+            # Un turno más: solo se resumen los mensajes que acaban de salir
+            messages += _long_history(13)[-2:]
+            second = build_prompt_parts("¿Y las cesantías?", messages, [], session_id="s",
+                                        max_tokens=self.max_tokens, summarizer=summarizer)
+        self.assertEqual(fold.call_count, 2)
+        self.assertEqual(len(fold.call_args.args[1]), second["tokens"]["messages_summarized"] - summarized)
+
+
+class IncrementalIngestTests(SimpleTestCase):
+
+    def setUp(self):
+        tmp = Path(tempfile.mkdtemp(prefix="assistleg-ingest-"))
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        self.folder = tmp / "rags" / "tema"
+        self.folder.mkdir(parents=True)
+        for name, value in (("RAGS_PATH", tmp / "rags"), ("VECTORSTORES_PATH", tmp / "vectorstores")):
+            patch = mock.patch.object(create_vectorstores, name, value)
+            patch.start()
+            self.addCleanup(patch.stop)
+        patch = mock.patch.object(create_vectorstores, "_get_embedding_model",
+                                  return_value=DeterministicFakeEmbedding(size=16))
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def _write(self, name: str, text: str):
+        (self.folder / name).write_text(text, encoding="utf-8")
+
+    def _ingest(self):
+        with mock.patch.object(create_vectorstores, "file_sha256", wraps=create_vectorstores.file_sha256) as sha:
+            stats = create_vectorstores.process_folder("tema", snapshot_format="none")
+        # Cada archivo se lee una sola vez por ejecución
+        self.assertEqual(sha.call_count, len(list(self.folder.iterdir())))
+        return stats
+
+    def test_rerun_skips_unchanged_files_and_reindexes_changed_ones(self):
+        law = "ARTÍCULO 1. El contrato de trabajo puede ser verbal.\nARTÍCULO 2. El periodo de prueba."
+        self._write("a.txt", law)
+        self._write("copia.txt", law)
+        self._write("b.txt", "ARTÍCULO 1. Las vacaciones son de quince días hábiles.")
+        first = self._ingest()
+        self.assertEqual(first["updated"], 3)
+        # Dos archivos idénticos no comparten ids de fragmentos
+        self.assertEqual(first["total_chunks"], first["chunks"])
+
+        again = self._ingest()
+        self.assertEqual((again["skipped"], again["updated"], again["version"]), (3, 0, first["version"]))
+
+        self._write("b.txt", "ARTÍCULO 1. Las vacaciones son de quince días hábiles remunerados.")
+        changed = self._ingest()
+        self.assertEqual((changed["skipped"], changed["updated"]), (2, 1))
+        self.assertNotEqual(changed["version"], first["version"])
+        self.assertEqual(changed["total_chunks"], first["total_chunks"])
+
+
+class FederatedSearchTests(SimpleTestCase):
+
+    def test_merge_respects_the_quota_then_fills_with_leftovers(self):
+        per_topic = {
+            "a_vs": [(Document(page_content=f"a{i}"), score) for i, score in enumerate((0.9, 0.8, 0.7, 0.6))],
+            "b_vs": [(Document(page_content="b0"), 0.5)],
+        }
+        merged = merge_results(per_topic, k=4, quota=2)
+        self.assertEqual([d.page_content for d in merged], ["a0", "a1", "b0", "a2"])
+        merged = merge_results(per_topic, k=5, quota=2)
+        self.assertEqual([d.page_content for d in merged], ["a0", "a1", "b0", "a2", "a3"])
+
+    def test_merge_drops_repeated_texts_across_topics(self):
+        per_topic = {
+            "a_vs": [(Document(page_content="El contrato  de trabajo"), 0.7), (Document(page_content="a1"), 0.6)],
+            "b_vs": [(Document(page_content="El contrato de\ntrabajo"), 0.9)],
+        }
+        merged = merge_results(per_topic, k=3, quota=3)
+        self.assertEqual([d.page_content for d in merged], ["El contrato de\ntrabajo", "a1"])
+
+    def test_cited_article_skips_the_vector_search(self):
+        index = BM25Index.build(
+            ["x1", "x2"],
+            ["ARTÍCULO 1. El contrato de trabajo.", "ARTÍCULO 2. El periodo de prueba."],
+            [{"articulo": "1"}, {"articulo": "2"}],
+        )
+        collection = mock.Mock()
+        results = search_topic("codigo_trabajo_vs", (collection, index), "¿Qué dice el artículo 2?",
+                               np.ones(4, dtype=np.float32))
+        self.assertEqual([(d.page_content, s) for d, s in results],
+                         [("ARTÍCULO 2. El periodo de prueba.", ARTICLE_SCORE)])
+        self.assertEqual(results[0][0].metadata["tema"], "codigo_trabajo")
+        collection.query.assert_not_called()
+
+        # Un artículo que el tema no tiene: búsqueda normal
+        collection.count.return_value = 0
+        self.assertEqual(search_topic("codigo_trabajo_vs", (collection, index), "artículo 99", np.ones(4)), [])
+        collection.count.assert_called_once()
+
+
+class TopicListingTests(SimpleTestCase):
+
+    def setUp(self):
+        tmp = Path(tempfile.mkdtemp(prefix="assistleg-topics-"))
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        for name in ("a_vs", "b_vs"):
+            (tmp / name).mkdir()
+            (tmp / name / "current.json").write_text('{"version": "v1"}', encoding="utf-8")
+        self.root = tmp
+        patch = mock.patch.object(rag_loader, "VECTORSTORES_PATH", tmp)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.addCleanup(rag_loader.invalidate_vectorstore)
+        rag_loader.invalidate_vectorstore()
+
+    def test_request_topic_key_lists_the_folder_once_per_poll_interval(self):
+        with mock.patch.object(rag_loader, "has_index", wraps=rag_loader.has_index) as has_index:
+            self.assertEqual(rag_loader.request_topic_key({"topics": ["b_vs", "a_vs"]}), "a_vs+b_vs")
+            self.assertEqual(rag_loader.request_topic_key({"topic": "a_vs"}), "a_vs")
+            self.assertIsNone(rag_loader.request_topic_key({"topic": "c_vs"}))
+        self.assertEqual(has_index.call_count, 2)
+
+    def test_invalidate_sees_new_topics_at_once(self):
+        self.assertEqual(rag_loader.list_available_topics(), ["a_vs", "b_vs"])
+        (self.root / "c_vs").mkdir()
+        (self.root / "c_vs" / "current.json").write_text('{"version": "v1"}', encoding="utf-8")
+        rag_loader.invalidate_vectorstore()
+        self.assertEqual(rag_loader.list_available_topics(), ["a_vs", "b_vs", "c_vs"])
+
+
+class AgentRegistryRetrieverTests(SimpleTestCase):
+
+    def setUp(self):
+        patches = [
+            mock.patch.object(rag_loader, "topic_version", return_value="v1"),
+            mock.patch.object(rag_loader, "load_rag_for_topic", side_effect=lambda topic: _FakeRetriever()),
+            mock.patch.object(react_agent, "get_llm", lambda: FakeChatModel(latency_s=0, answer="respuesta")),
+            mock.patch.object(react_agent, "_lookup_cached_answer", return_value=(None, None)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.registry = AgentRegistry(builder=lambda topic, retriever: ("agente", topic, retriever))
+
+    def test_agent_and_stream_share_one_retriever(self):
+        agent = self.registry.get("tema_vs")
+        self.assertIs(self.registry.get_retriever("tema_vs"), agent[2])
+        rag_loader.load_rag_for_topic.assert_called_once_with("tema_vs")
+
+        route = RouteDecision(RETRIEVE, "test", [])
+        with mock.patch.object(react_agent.retrieval_router, "route", return_value=route), \
+                mock.patch.object(react_agent.retrieval_router, "remember"), \
+                mock.patch.object(registry, "agent_registry", self.registry):
+            for _ in range(2):
+                events = list(react_agent.stream_legal_answer("tema_vs", "qué es el contrato", "sesion-stream"))
+                self.assertEqual(events[0]["documents"], 1)
+        rag_loader.load_rag_for_topic.assert_called_once_with("tema_vs")
+
+    def test_invalidate_drops_the_retriever_too(self):
+        first = self.registry.get_retriever("tema_vs")
+        self.registry.invalidate("tema_vs")
+        self.assertIsNot(self.registry.get_retriever("tema_vs"), first)
+
+
+class MicroBatchingEmbeddingsTests(SimpleTestCase):
+
+    def test_stats_report_the_wrapped_backend(self):
+        batcher = MicroBatchingEmbeddings(DeterministicFakeEmbedding(size=8), max_wait_ms=1, backend="onnx-int8")
+        self.assertEqual(len(batcher.embed_query("contrato de trabajo")), 8)
+        self.assertEqual(batcher.stats()["backend"], "onnx-int8")
+
+
+class NumPyChromaParityTests(SimpleTestCase):
+    """El índice en memoria devuelve lo mismo que Chroma sobre la misma colección."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        import chromadb
+        from langchain_community.vectorstores import Chroma
+
+        cls.embedding = DeterministicFakeEmbedding(size=32)
+        texts = [f"ARTÍCULO {i}. Disposición número {i} sobre el tema {i % 5}." for i in range(40)]
+        cls.store = Chroma.from_texts(
+            texts, cls.embedding, metadatas=[{"articulo": str(i)} for i in range(40)],
+            ids=[f"id-{i}" for i in range(40)], client=chromadb.EphemeralClient(),
+            collection_name="assistleg-parity",
+        )
+        cls.index = NumPyVectorIndex.from_collection(cls.store._collection, ann="exact")
+        cls.queries = [cls.embedding.embed_query(q) for q in ("contrato", "periodo de prueba", "vacaciones")]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.store.delete_collection()
+        super().tearDownClass()
+
+    def test_search_matches_similarity_search(self):
+        for vector in self.queries:
+            expected = [d.page_content for d in self.store.similarity_search_by_vector(vector, k=5)]
+            self.assertEqual([self.index.texts[p] for p, _ in self.index.search(vector, 5)], expected)
+
+    def test_mmr_matches_max_marginal_relevance_search(self):
+        for vector in self.queries:
+            expected = self.store.max_marginal_relevance_search_by_vector(vector, k=4, fetch_k=12, lambda_mult=0.35)
+            chosen = self.index.mmr(vector, k=4, fetch_k=12, lambda_mult=0.35)
+            self.assertEqual([self.index.texts[p] for p in chosen], [d.page_content for d in expected])
+
+
+class VectorSnapshotTests(SimpleTestCase):
+
+    def setUp(self):
+        self.persist = Path(tempfile.mkdtemp(prefix="assistleg-snapshot-"))
+        self.addCleanup(shutil.rmtree, self.persist, ignore_errors=True)
+        (self.persist / "ingest_manifest.json").write_text('{"a.txt": {}}', encoding="utf-8")
+        rng = np.random.default_rng(0)
+        self.index = NumPyVectorIndex.from_embeddings(
+            [f"id-{i}" for i in range(30)],
+            [f"Artículo {i}. Texto ñandú {i}." for i in range(30)],
+            [{"articulo": str(i)} if i % 2 else {} for i in range(30)],
+            rng.normal(size=(30, 16)), ann="exact",
+        )
+        self.queries = rng.normal(size=(5, 16)).astype(np.float32)
+
+    def test_round_trip_keeps_records_and_neighbours(self):
+        for fmt in ("float16", "int8"):
+            with self.subTest(fmt=fmt):
+                header = export_snapshot(self.index, self.persist, fmt)
+                self.assertEqual((header["format"], header["documents"]), (fmt, 30))
+                mapped = load_snapshot(self.persist, ann="exact")
+                self.assertEqual(list(mapped.ids), self.index.ids)
+                self.assertEqual(list(mapped.texts), self.index.texts)
+                self.assertEqual(list(mapped.metadatas), self.index.metadatas)
+                np.testing.assert_allclose(mapped.rows(), self.index.rows(), atol=0.02)
+                for vector in self.queries:
+                    self.assertEqual(mapped.search(vector, 1)[0][0], self.index.search(vector, 1)[0][0])
+
+    def test_snapshot_is_ignored_after_a_new_ingestion(self):
+        export_snapshot(self.index, self.persist, "float16")
+        (self.persist / "ingest_manifest.json").write_text('{"b.txt": {}}', encoding="utf-8")
+        self.assertIsNone(load_snapshot(self.persist))
+        self.assertEqual(len(load_snapshot(self.persist, check_fresh=False)), 30)
+
+
+class DocumentUploadTests(SimpleTestCase):
+
+    def setUp(self):
+        self.rags = Path(tempfile.mkdtemp(prefix="assistleg-rags-"))
+        self.addCleanup(shutil.rmtree, self.rags, ignore_errors=True)
+        patch = mock.patch("api.indexing_jobs.RAGS_PATH", self.rags)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def _files(self):
+        return sorted(p.name for p in (self.rags / "tema").iterdir())
+
+    def test_filename_is_reduced_to_a_safe_basename(self):
+        saved = save_upload("tema", SimpleUploadedFile("../../etc/ley 100 (2024)$.txt", b"ARTICULO 1."))
+        self.assertEqual(saved, self.rags / "tema" / "ley 100 (2024)_.txt")
+        self.assertEqual(saved.read_bytes(), b"ARTICULO 1.")
+
+    def test_unsupported_extension_is_rejected(self):
+        with self.assertRaises(UploadError) as ctx:
+            save_upload("tema", SimpleUploadedFile("programa.exe", b"MZ"))
+        self.assertEqual(ctx.exception.status, 400)
+
+    def test_pdf_without_magic_bytes_is_rejected_and_not_kept(self):
+        with self.assertRaises(UploadError):
+            save_upload("tema", SimpleUploadedFile("ley.pdf", b"<html>no es un pdf</html>"))
+        self.assertEqual(self._files(), [])
+        save_upload("tema", SimpleUploadedFile("ley.pdf", b"%PDF-1.7\n..."))
+        self.assertEqual(self._files(), ["ley.pdf"])
+
+    def test_size_limit(self):
+        with mock.patch("api.indexing_jobs.UPLOAD_MAX_MB", 0.001):
+            with self.assertRaises(UploadError) as ctx:
+                save_upload("tema", SimpleUploadedFile("grande.txt", b"x" * 2048))
+        self.assertEqual(ctx.exception.status, 413)
+        self.assertFalse((self.rags / "tema").exists())
+
+    def test_only_admins_can_upload(self):
+        data = {"folder": "tema", "files": SimpleUploadedFile("ley.txt", b"ARTICULO 1.")}
+        self.assertEqual(APIClient().post("/api/documents/upload/", data).status_code, 403)
+
+        client = APIClient()
+        client.force_authenticate(user=User(username="usuario", is_staff=False))
+        data["files"].seek(0)
+        self.assertEqual(client.post("/api/documents/upload/", data).status_code, 403)
+        self.assertFalse((self.rags / "tema").exists())
+
+        client.force_authenticate(user=User(username="admin", is_staff=True))
+        data["files"].seek(0)
+        with mock.patch("api.views.indexing_jobs") as jobs:
+            jobs.submit.return_value.to_dict.return_value = {"id": "trabajo"}
+            response = client.post("/api/documents/upload/", data)
+        self.assertEqual(response.status_code, 202)
+        jobs.submit.assert_called_once_with("tema", ["ley.txt"], full=False, splitter=None)
+        self.assertEqual(self._files(), ["ley.txt"])
+
+
+class TracingTests(SimpleTestCase):
+
+    def setUp(self):
+        self.metrics = MetricsRegistry()
+        patch = mock.patch.object(tracing, "metrics", self.metrics)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_prometheus_rendering(self):
+        self.metrics.inc("assistleg_route_total", {"reason": 'dijo "eso"', "decision": "reuse"})
+        self.metrics.inc("assistleg_route_total", {"decision": "reuse", "reason": 'dijo "eso"'})
+        self.metrics.observe("assistleg_stage_duration_seconds", {"stage": "embed"}, 0.03)
+        self.metrics.observe("assistleg_stage_duration_seconds", {"stage": "embed"}, 0.2)
+        self.metrics.inc("assistleg_otra", {})
+        lines = self.metrics.render().splitlines()
+
+        self.assertIn("# TYPE assistleg_route_total counter", lines)
+        self.assertIn('assistleg_route_total{decision="reuse",reason="dijo \\"eso\\""} 2', lines)
+        self.assertIn("# TYPE assistleg_stage_duration_seconds histogram", lines)
+        self.assertIn('assistleg_stage_duration_seconds_bucket{stage="embed",le="0.025"} 0', lines)
+        self.assertIn('assistleg_stage_duration_seconds_bucket{stage="embed",le="0.05"} 1', lines)
+        self.assertIn('assistleg_stage_duration_seconds_bucket{stage="embed",le="0.25"} 2', lines)
+        self.assertIn('assistleg_stage_duration_seconds_bucket{stage="embed",le="+Inf"} 2', lines)
+        self.assertIn('assistleg_stage_duration_seconds_sum{stage="embed"} 0.230000', lines)
+        self.assertIn('assistleg_stage_duration_seconds_count{stage="embed"} 2', lines)
+        self.assertIn("# TYPE assistleg_otra untyped", lines)
+        self.assertIn("assistleg_otra 1", lines)
+
+    def test_nested_spans_join_the_active_trace_across_threads(self):
+        def rerank():
+            with span("rerank"):
+                pass
+
+        with trace_request("ask", topic="tema_vs") as trace:
+            with span("search"):
+                with span("embed", cache_hit=False):
+                    pass
+            # Un hilo con el contexto copiado sigue en la misma traza
+            worker = threading.Thread(target=contextvars.copy_context().run, args=(rerank,))
+            worker.start()
+            worker.join()
+        with span("fuera"):
+            pass
+
+        self.assertIsNone(current_trace())
+        self.assertEqual([s.name for s in trace.spans], ["embed", "search", "rerank"])
+        self.assertGreaterEqual(trace.stage_totals()["search"], trace.stage_totals()["embed"])
+        self.assertIn('assistleg_cache_requests_total{result="miss",stage="embed"} 1', self.metrics.render())
+        self.assertIn('assistleg_requests_total{endpoint="ask",status="ok"} 1', self.metrics.render())
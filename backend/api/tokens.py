@@ -0,0 +1,23 @@
+# backend/api/tokens.py
+
+# Conteo APROXIMADO de tokens. No necesitamos exactitud (Groq no expone su
+# tokenizer localmente): para presupuestar prompts basta una estimación
+# estable y barata. En español, ~4 caracteres por token es conservador.
+CHARS_PER_TOKEN = 4
+
+
+def count_tokens(text: str) -> int:
+    """Estimación del número de tokens de un texto."""
+    if not text:
+        return 0
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Recorta un texto para que no supere max_tokens (aprox.)."""
+    if max_tokens <= 0:
+        return ""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rstrip() + "…"
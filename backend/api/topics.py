@@ -0,0 +1,29 @@
+# backend/api/topics.py
+
+from typing import Iterable, List
+
+# CLAVES DE TEMA
+# Una pregunta se hace sobre un tema ("constitucion_vs"), sobre varios
+# ("codigo_trabajo_vs+constitucion_vs") o sobre todos ("all"). La clave
+# identifica el agente, las cachés y las métricas de esa combinación.
+
+ALL_TOPICS = "all"
+TOPIC_SEPARATOR = "+"
+
+
+def make_topic_key(topics: Iterable[str]) -> str:
+    """Clave canónica (ordenada y sin repetidos) de una lista de temas."""
+    return TOPIC_SEPARATOR.join(sorted(set(topics)))
+
+
+def split_topic_key(topic_key: str) -> List[str]:
+    return [t for t in (topic_key or "").split(TOPIC_SEPARATOR) if t]
+
+
+def is_multi_topic(topic_key: str) -> bool:
+    return topic_key == ALL_TOPICS or TOPIC_SEPARATOR in (topic_key or "")
+
+
+def key_includes(topic_key: str, topic_name: str) -> bool:
+    """¿La clave (simple, compuesta o "all") abarca ese tema?"""
+    return topic_key == ALL_TOPICS or topic_name in split_topic_key(topic_key)
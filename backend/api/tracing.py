@@ -0,0 +1,280 @@
+# backend/api/tracing.py
+
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# TRAZAS POR PETICIÓN Y MÉTRICAS POR ETAPA
+# Cada etapa del camino de una pregunta se mide con `with span("etapa"):`
+#   vectorstore_load, embed, route, search, rerank, answer_cache,
+#   prompt_build, llm, memory_write
+# La duración y los atributos (tokens, acierto de caché) van:
+#   - a la traza de la petición en curso, si la hay (trace_request), que se
+#     registra en una línea JSON al terminar y alimenta la cabecera X-Timing;
+#   - a las métricas del proceso, expuestas en /metrics (formato Prometheus).
+# Las etapas se anidan: "search" incluye su "embed".
+# Con ASSISTLEG_TRACING=0, span() devuelve un objeto vacío compartido y las
+# peticiones no crean trazas: el coste es una llamada a función.
+
+ENABLED = os.getenv("ASSISTLEG_TRACING", "1") != "0"
+# Cabecera X-Timing (ms por etapa) en las respuestas de /api/ask/
+TIMING_HEADER = os.getenv("ASSISTLEG_TIMING_HEADER", "0") == "1"
+
+# Límites (segundos) de los histogramas de duración
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRICS_HELP = {
+    "assistleg_requests_total": ("counter", "Peticiones trazadas por endpoint y resultado."),
+    "assistleg_request_duration_seconds": ("histogram", "Duración total de las peticiones trazadas."),
+    "assistleg_stage_duration_seconds": ("histogram", "Duración de cada etapa del camino de una pregunta."),
+    "assistleg_stage_errors_total": ("counter", "Etapas que terminaron con una excepción."),
+    "assistleg_cache_requests_total": ("counter", "Consultas a las cachés por etapa y resultado (hit/miss)."),
+    "assistleg_tokens_total": ("counter", "Tokens por etapa y tipo (prompt, context, history, input, output)."),
+    "assistleg_route_total": ("counter", "Decisiones del router de recuperación (retrieve, reuse, history) por motivo."),
+    "assistleg_batch_items_total": ("counter", "Preguntas procesadas en lotes (/api/ask/batch/) por estado."),
+    "assistleg_llm_events_total": ("counter", "Eventos de la pasarela del LLM por modelo (retry, throttle, fallback, ...)."),
+    "assistleg_indexing_jobs_total": ("counter", "Trabajos de indexación (/api/documents/upload/) por estado."),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class MetricsRegistry:
+    """Contadores e histogramas en memoria del proceso, seguros entre hilos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, _Histogram]] = {}
+
+    def inc(self, name: str, labels: Dict[str, Any], amount: float = 1):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name: str, labels: Dict[str, Any], seconds: float):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram()
+            histogram.observe(seconds)
+
+    def render(self) -> str:
+        """Texto en el formato de exposición de Prometheus (0.0.4)."""
+        lines = []
+        with self._lock:
+            for name in sorted(set(self._counters) | set(self._histograms)):
+                kind, help_text = METRICS_HELP.get(name, ("untyped", name))
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in sorted(self._counters.get(name, {}).items()):
+                    lines.append(f"{name}{_format_labels(labels)} {value:g}")
+                for labels, histogram in sorted(self._histograms.get(name, {}).items()):
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(labels, ('le', f'{bound:g}'))} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {histogram.total:.6f}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+# SPANS
+
+class Span:
+    """Una etapa medida. Se usa como context manager; set() añade atributos."""
+
+    __slots__ = ("name", "attrs", "trace", "duration_ms", "error", "_start")
+
+    def __init__(self, name: str, attrs: Dict[str, Any], trace: Optional["Trace"]):
+        self.name = name
+        self.attrs = attrs
+        self.trace = trace
+        self.duration_ms = 0.0
+        self.error = None
+        self._start = 0.0
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration_ms = (time.perf_counter() - self._start) * 1000
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        _record(self)
+        return False
+
+    def as_dict(self) -> Dict[str, Any]:
+        data = {"name": self.name, "ms": round(self.duration_ms, 2), **self.attrs}
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
+class _NullSpan:
+    """Lo que devuelve span() con el trazado desactivado: no mide nada."""
+
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def _record(span: Span):
+    metrics.observe("assistleg_stage_duration_seconds", {"stage": span.name}, span.duration_ms / 1000)
+    if span.error:
+        metrics.inc("assistleg_stage_errors_total", {"stage": span.name})
+    hit = span.attrs.get("cache_hit")
+    if hit is not None:
+        metrics.inc("assistleg_cache_requests_total", {"stage": span.name, "result": "hit" if hit else "miss"})
+    for key, value in span.attrs.items():
+        if key.endswith("_tokens") and isinstance(value, (int, float)):
+            metrics.inc("assistleg_tokens_total", {"stage": span.name, "kind": key[:-len("_tokens")]}, value)
+    if span.trace is not None:
+        span.trace.spans.append(span)
+
+
+# TRAZAS
+
+class Trace:
+    """Spans de una petición, en el orden en que terminaron."""
+
+    def __init__(self, name: str, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self.spans: List[Span] = []
+        self.duration_ms = 0.0
+        self.error = None
+        self._start = time.perf_counter()
+
+    def span(self, name: str, **attrs):
+        """Span ligado a esta traza (para código que no corre bajo activate, p. ej. generadores)."""
+        return Span(name, attrs, self) if ENABLED else _NULL_SPAN
+
+    def stage_totals(self) -> Dict[str, float]:
+        """ms por etapa (una etapa puede repetirse, p. ej. varios embed)."""
+        totals: Dict[str, float] = {}
+        for span in list(self.spans):
+            totals[span.name] = totals.get(span.name, 0.0) + span.duration_ms
+        return {name: round(ms, 1) for name, ms in totals.items()}
+
+    def timing_header(self) -> str:
+        """'embed=12.3, search=40.1, llm=812.0, total=870.5' (ms)."""
+        parts = [f"{name}={ms}" for name, ms in self.stage_totals().items()]
+        parts.append(f"total={round(self.duration_ms, 1)}")
+        return ", ".join(parts)
+
+    def as_dict(self) -> Dict[str, Any]:
+        data = {"trace": self.name, "ms": round(self.duration_ms, 2), **self.attrs,
+                "spans": [s.as_dict() for s in list(self.spans)]}
+        if self.error:
+            data["error"] = self.error
+        return data
+
+    def finish(self, error: Optional[str] = None):
+        if not ENABLED:
+            return
+        self.duration_ms = (time.perf_counter() - self._start) * 1000
+        self.error = error
+        metrics.observe("assistleg_request_duration_seconds", {"endpoint": self.name}, self.duration_ms / 1000)
+        metrics.inc("assistleg_requests_total", {"endpoint": self.name, "status": "error" if error else "ok"})
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("%s", json.dumps(self.as_dict(), ensure_ascii=False, default=str))
+
+
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("assistleg_trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+def span(name: str, **attrs):
+    """Mide una etapa; se asocia a la traza de la petición en curso, si la hay."""
+    if not ENABLED:
+        return _NULL_SPAN
+    return Span(name, attrs, _current.get())
+
+
+@contextmanager
+def activate(trace: Trace):
+    """Hace de `trace` la traza en curso dentro del bloque (hilos y tareas la heredan)."""
+    if not ENABLED:
+        yield trace
+        return
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def trace_request(name: str, **attrs):
+    """Traza una petición completa: la crea, la activa y la cierra al salir."""
+    trace = Trace(name, **attrs)
+    error = None
+    try:
+        with activate(trace):
+            yield trace
+    except BaseException as exc:
+        error = type(exc).__name__
+        raise
+    finally:
+        trace.finish(error)
@@ -1,6 +1,20 @@
 from django.urls import path
-from .views import ask_question
+from .views import (
+    ask_question, ask_question_async, ask_question_stream, ask_batch, registry_stats, registry_invalidate, llm_health, memory_stats_view, cache_stats_view,
+    upload_documents, indexing_jobs_list, indexing_job_detail,
+)
 
 urlpatterns = [
     path("ask/", ask_question),
+    path("ask/async/", ask_question_async),
+    path("ask/stream/", ask_question_stream),
+    path("ask/batch/", ask_batch),
+    path("registry/stats/", registry_stats),
+    path("registry/invalidate/", registry_invalidate),
+    path("health/llm/", llm_health),
+    path("memory/stats/", memory_stats_view),
+    path("cache/stats/", cache_stats_view),
+    path("documents/upload/", upload_documents),
+    path("documents/jobs/", indexing_jobs_list),
+    path("documents/jobs/<str:job_id>/", indexing_job_detail),
 ]
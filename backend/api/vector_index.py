@@ -0,0 +1,344 @@
+# backend/api/vector_index.py
+
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+
+logger = logging.getLogger(__name__)
+
+
+# ÍNDICE VECTORIAL EN MEMORIA (SOLO LECTURA)
+# Con ASSISTLEG_VECTOR_ENGINE=numpy cada colección Chroma se lee una vez y
+# las búsquedas no vuelven a pasar por el cliente Chroma (ni por sus locks):
+#   - una matriz float32 contigua con los embeddings normalizados, más sus
+#     normas, ids, textos y metadatos en arrays paralelos;
+#   - top-k con un solo producto matriz-vector y argpartition, ordenando con
+#     la misma métrica de la colección ("hnsw:space": l2 por defecto);
+#   - MMR vectorizado con la semántica de LangChain (fetch_k candidatos por
+#     distancia, selección por coseno con lambda_mult, resultado en el orden
+#     de los candidatos), así que devuelve lo mismo que el camino Chroma;
+#   - opcional (ASSISTLEG_VECTOR_ANN=ivf, corpus grandes): índice IVF con
+#     centroides k-means; cada búsqueda puntúa solo las nprobe listas más
+#     cercanas a la consulta.
+# La ingestión sigue escribiendo en Chroma; al invalidar el tema el índice
+# se vuelve a leer. La matriz también puede venir de una instantánea
+# mapeada en memoria (api/vector_snapshot.py) en float16 o int8: se
+# convierte a float32 por bloques en cada consulta.
+
+VECTOR_ENGINE = os.getenv("ASSISTLEG_VECTOR_ENGINE", "chroma").strip().lower()
+VECTOR_ENGINES = ("chroma", "numpy")
+if VECTOR_ENGINE not in VECTOR_ENGINES:
+    logger.warning("ASSISTLEG_VECTOR_ENGINE desconocido (%s): se usa chroma", VECTOR_ENGINE)
+    VECTOR_ENGINE = "chroma"
+
+# Búsqueda aproximada: "" (exacta) o "ivf"
+VECTOR_ANN = os.getenv("ASSISTLEG_VECTOR_ANN", "").strip().lower()
+# Por debajo de este tamaño la búsqueda exacta ya es más rápida que IVF
+IVF_MIN_DOCS = int(os.getenv("ASSISTLEG_VECTOR_IVF_MIN_DOCS", "5000"))
+# Listas del IVF (0 = √n) y listas que se revisan por consulta
+IVF_LISTS = int(os.getenv("ASSISTLEG_VECTOR_IVF_LISTS", "0"))
+IVF_NPROBE = int(os.getenv("ASSISTLEG_VECTOR_IVF_NPROBE", "8"))
+IVF_ITERATIONS = 10
+# Filas por bloque al convertir a float32 una matriz float16/int8
+DOT_BLOCK_ROWS = 8192
+
+SPACES = ("l2", "cosine", "ip")
+
+
+def _normalize_rows(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    norms = np.linalg.norm(matrix, axis=1).astype(np.float32)
+    safe = np.where(norms == 0, 1.0, norms)
+    return np.ascontiguousarray(matrix / safe[:, None], dtype=np.float32), norms
+
+
+def matches_where(metadata: Optional[Dict], where: Dict) -> bool:
+    """Filtro de metadatos al estilo Chroma: igualdad, {"$eq"}, {"$in"}, "$and" y "$or"."""
+    metadata = metadata or {}
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, sub) for sub in condition):
+                return False
+        elif isinstance(condition, dict):
+            if "$eq" in condition and metadata.get(key) != condition["$eq"]:
+                return False
+            if "$ne" in condition and metadata.get(key) == condition["$ne"]:
+                return False
+            if "$in" in condition and metadata.get(key) not in condition["$in"]:
+                return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+class NumPyVectorIndex:
+    """
+    Embeddings de una colección en memoria. Seguro entre hilos: después de
+    construirlo solo se lee (NumPy libera el GIL en los productos).
+
+    `matrix` son las filas normalizadas (float32, float16 o int8 con
+    `scales` por fila) y `norms` las normas originales. ids, textos y
+    metadatos pueden ser listas o secuencias perezosas (instantáneas).
+    """
+
+    def __init__(self, ids: Sequence[str], texts: Sequence[str], metadatas: Sequence[Optional[Dict]],
+                 matrix: np.ndarray, norms: np.ndarray, space: str = "l2", scales: Optional[np.ndarray] = None,
+                 ann: str = VECTOR_ANN, ivf_lists: int = IVF_LISTS, nprobe: int = IVF_NPROBE,
+                 ivf_min_docs: int = IVF_MIN_DOCS):
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self.matrix = matrix
+        self.norms = np.asarray(norms, dtype=np.float32)
+        self.scales = scales
+        self.space = space if space in SPACES else "l2"
+        self._positions: Optional[Dict[str, int]] = None
+        self._masks: Dict[str, np.ndarray] = {}
+        self._masks_lock = threading.Lock()
+
+        self.nprobe = nprobe
+        self.centroids: Optional[np.ndarray] = None
+        self.lists: List[np.ndarray] = []
+        if ann == "ivf" and len(self.ids) >= max(ivf_min_docs, 2):
+            self._build_ivf(ivf_lists or int(math.sqrt(len(self.ids))))
+
+    @classmethod
+    def from_embeddings(cls, ids: Sequence[str], texts: Sequence[str], metadatas: Sequence[Optional[Dict]],
+                        embeddings: Any, space: str = "l2", **kwargs) -> "NumPyVectorIndex":
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim != 2:
+            matrix = matrix.reshape(len(ids), -1)
+        matrix, norms = _normalize_rows(matrix)
+        return cls(list(ids), list(texts), [metadata or {} for metadata in metadatas],
+                   matrix, norms, space=space, **kwargs)
+
+    @classmethod
+    def from_collection(cls, collection, **kwargs) -> "NumPyVectorIndex":
+        """Lee todos los fragmentos de una colección Chroma (sin calcular embeddings)."""
+        data = collection.get(include=["embeddings", "documents", "metadatas"])
+        space = (getattr(collection, "metadata", None) or {}).get("hnsw:space", "l2")
+        embeddings = data["embeddings"]
+        if embeddings is None or not len(embeddings):
+            embeddings = np.zeros((0, 0), dtype=np.float32)
+        return cls.from_embeddings(data["ids"], data["documents"], data["metadatas"], embeddings,
+                                   space=space, **kwargs)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def mode(self) -> str:
+        return "ivf" if self.centroids is not None else "exact"
+
+    # Filas
+
+    def rows(self, positions: Any = None) -> np.ndarray:
+        """Filas normalizadas como float32 (las float16/int8 se convierten)."""
+        rows = self.matrix if positions is None else self.matrix[positions]
+        if rows.dtype == np.float32:
+            return rows
+        rows = rows.astype(np.float32)
+        if self.scales is not None:
+            rows *= (self.scales if positions is None else self.scales[positions])[:, None]
+        return rows
+
+    def _dot(self, vector: np.ndarray, positions: Optional[np.ndarray] = None) -> np.ndarray:
+        if positions is not None or self.matrix.dtype == np.float32:
+            return self.rows(positions) @ vector
+        # Por bloques: sin copiar la matriz mapeada entera en cada consulta
+        out = np.empty(len(self.matrix), dtype=np.float32)
+        for start in range(0, len(self.matrix), DOT_BLOCK_ROWS):
+            block = slice(start, start + DOT_BLOCK_ROWS)
+            out[block] = self.rows(block) @ vector
+        return out
+
+    # IVF
+
+    def _build_ivf(self, n_lists: int):
+        """k-means esférico sobre las filas normalizadas (semilla fija: índice reproducible)."""
+        start = time.perf_counter()
+        n_lists = max(1, min(n_lists, len(self.ids)))
+        rng = np.random.default_rng(0)
+        matrix = self.rows()
+        centroids = matrix[rng.choice(len(self.ids), n_lists, replace=False)].copy()
+        assignments = np.zeros(len(self.ids), dtype=np.int64)
+        for _ in range(IVF_ITERATIONS):
+            assignments = np.argmax(matrix @ centroids.T, axis=1)
+            for list_id in range(n_lists):
+                members = matrix[assignments == list_id]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[list_id] = centroid / (np.linalg.norm(centroid) or 1.0)
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.lists = [np.flatnonzero(assignments == list_id) for list_id in range(n_lists)]
+        logger.info("IVF construido: %d fragmentos, %d listas (%.2fs)",
+                    len(self.ids), n_lists, time.perf_counter() - start)
+
+    def _ivf_candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        nearest = np.argsort(-(self.centroids @ query))[:nprobe]
+        return np.concatenate([self.lists[list_id] for list_id in nearest])
+
+    # Filtros
+
+    def positions_where(self, where: Optional[Dict]) -> Optional[np.ndarray]:
+        """Máscara booleana de los fragmentos que cumplen where (None = todos)."""
+        if not where:
+            return None
+        key = json.dumps(where, sort_keys=True, default=str)
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = np.fromiter((matches_where(m, where) for m in self.metadatas), dtype=bool, count=len(self.ids))
+            with self._masks_lock:
+                if len(self._masks) >= 256:
+                    self._masks.clear()
+                self._masks[key] = mask
+        return mask
+
+    def position(self, doc_id: str) -> Optional[int]:
+        if self._positions is None:
+            self._positions = {doc_id: position for position, doc_id in enumerate(self.ids)}
+        return self._positions.get(doc_id)
+
+    # Búsqueda
+
+    def _rank_scores(self, vector: np.ndarray, positions: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (puntaje de orden, coseno) de cada fragmento: mayor es mejor. El orden
+        sigue la métrica de la colección para coincidir con Chroma.
+        """
+        norms = self.norms if positions is None else self.norms[positions]
+        dots = self._dot(vector, positions)
+        query_norm = float(np.linalg.norm(vector)) or 1.0
+        cosine = dots / query_norm
+        if self.space == "cosine":
+            return cosine, cosine
+        if self.space == "ip":
+            return norms * dots, cosine
+        # l2: -‖x - q‖² sin el término constante ‖q‖²
+        return 2 * norms * dots - norms * norms, cosine
+
+    def search(self, vector: Any, k: int, where: Optional[Dict] = None,
+               nprobe: Optional[int] = None) -> List[Tuple[int, float]]:
+        """[(posición, coseno)] de los k fragmentos más cercanos, del más cercano al más lejano."""
+        if k <= 0 or not len(self.ids):
+            return []
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        mask = self.positions_where(where)
+
+        positions = None
+        if self.centroids is not None:
+            query = vector / (np.linalg.norm(vector) or 1.0)
+            positions = self._ivf_candidates(query, nprobe or self.nprobe)
+            if mask is not None:
+                positions = positions[mask[positions]]
+            if len(positions) < k:
+                # Pocas coincidencias en las listas revisadas: búsqueda exacta
+                positions = None
+        if positions is None and mask is not None:
+            positions = np.flatnonzero(mask)
+
+        rank, cosine = self._rank_scores(vector, positions)
+        k = min(k, len(rank))
+        if k == 0:
+            return []
+        top = np.argpartition(-rank, k - 1)[:k] if k < len(rank) else np.arange(len(rank))
+        top = top[np.argsort(-rank[top], kind="stable")]
+        chosen = top if positions is None else positions[top]
+        return [(int(p), float(s)) for p, s in zip(chosen, cosine[top])]
+
+    def mmr(self, vector: Any, k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5,
+            where: Optional[Dict] = None) -> List[int]:
+        """
+        Posiciones elegidas por máxima relevancia marginal, como
+        Chroma.max_marginal_relevance_search_by_vector: los fetch_k más
+        cercanos, selección greedy y resultado en el orden de cercanía.
+        """
+        candidates = np.asarray([p for p, _ in self.search(vector, fetch_k, where)], dtype=np.int64)
+        k = min(k, len(candidates))
+        if k <= 0:
+            return []
+
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        embeddings = self.rows(candidates)
+        to_query = embeddings @ (vector / (np.linalg.norm(vector) or 1.0))
+        to_each_other = embeddings @ embeddings.T
+
+        selected = [int(np.argmax(to_query))]
+        redundancy = to_each_other[selected[0]].copy()
+        taken = np.zeros(len(candidates), dtype=bool)
+        taken[selected[0]] = True
+        while len(selected) < k:
+            scores = lambda_mult * to_query - (1 - lambda_mult) * redundancy
+            scores[taken] = -np.inf
+            best = int(np.argmax(scores))
+            selected.append(best)
+            taken[best] = True
+            np.maximum(redundancy, to_each_other[best], out=redundancy)
+        return [int(candidates[i]) for i in sorted(selected)]
+
+    def cosine(self, vector: Any, positions: Sequence[int]) -> np.ndarray:
+        """Coseno entre la consulta y los fragmentos dados."""
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        return self.rows(np.asarray(positions, dtype=np.int64)) @ (vector / (np.linalg.norm(vector) or 1.0))
+
+    def document(self, position: int) -> Document:
+        return Document(page_content=self.texts[position], metadata=dict(self.metadatas[position]))
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            "documents": len(self.ids),
+            "dim": int(self.matrix.shape[1]) if self.matrix.ndim == 2 else 0,
+            "space": self.space,
+            "mode": self.mode,
+            "dtype": str(self.matrix.dtype),
+            "mapped": isinstance(self.matrix, np.memmap),
+            "matrix_bytes": int(self.matrix.nbytes),
+        }
+        if self.centroids is not None:
+            stats.update(lists=len(self.lists), nprobe=self.nprobe)
+        return stats
+
+
+class NumPyRetriever(BaseRetriever):
+    """
+    Equivalente a vectorstore.as_retriever() sobre un NumPyVectorIndex:
+    search_type "similarity" o "mmr", mismos search_kwargs (k, fetch_k,
+    lambda_mult, filter).
+    """
+
+    index: NumPyVectorIndex
+    embeddings: Embeddings
+    search_type: str = "similarity"
+    search_kwargs: Dict[str, Any] = {}
+
+    def search(self, query: str, where: Optional[Dict] = None) -> List[Document]:
+        kwargs = self.search_kwargs
+        where = where if where is not None else kwargs.get("filter")
+        vector = self.embeddings.embed_query(query)
+        if self.search_type == "mmr":
+            positions = self.index.mmr(
+                vector, k=kwargs.get("k", 4), fetch_k=kwargs.get("fetch_k", 20),
+                lambda_mult=kwargs.get("lambda_mult", 0.5), where=where,
+            )
+        elif self.search_type == "similarity":
+            positions = [p for p, _ in self.index.search(vector, kwargs.get("k", 4), where)]
+        else:
+            raise ValueError(f"search_type no soportado por el índice NumPy: {self.search_type}")
+        return [self.index.document(p) for p in positions]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: Optional[CallbackManagerForRetrieverRun] = None
+    ) -> List[Document]:
+        return self.search(query)
@@ -0,0 +1,183 @@
+# backend/api/vector_snapshot.py
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+import shutil
+import time
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from api.vector_index import NumPyVectorIndex
+
+logger = logging.getLogger(__name__)
+
+
+# INSTANTÁNEAS DEL ÍNDICE VECTORIAL, MAPEADAS EN MEMORIA
+# Después de la ingestión cada tema se exporta a <tema>_vs/snapshot/:
+#   snapshot.json            formato, dimensiones, métrica y huella del
+#                            ingest_manifest.json del que salió
+#   vectors.npy              filas normalizadas en float32, float16 o int8
+#   norms.npy / scales.npy   normas originales y escala por fila (int8)
+#   <campo>.bin + .offsets.npy   ids, textos y metadatos (JSON) uno tras
+#                            otro, con el desplazamiento de cada registro
+# Los workers abren los archivos con mmap: la carga es casi instantánea, las
+# páginas viven en la caché del sistema operativo y N procesos comparten las
+# mismas en lugar de tener cada uno su copia (ni siquiera abren Chroma).
+# Los textos y metadatos se decodifican solo cuando se piden.
+# Una instantánea cuyo ingest_manifest.json ya no coincide se ignora y el
+# índice se lee de Chroma como antes.
+
+SNAPSHOT_DIR = "snapshot"
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_FORMATS = ("float32", "float16", "int8")
+# Formato que escribe la ingestión ("none" = no exportar)
+DEFAULT_SNAPSHOT_FORMAT = os.getenv("ASSISTLEG_VECTOR_SNAPSHOT_FORMAT", "float16")
+# ASSISTLEG_VECTOR_SNAPSHOT=0: leer siempre de Chroma
+SNAPSHOTS_ENABLED = os.getenv("ASSISTLEG_VECTOR_SNAPSHOT", "1") != "0"
+
+_FIELDS = ("ids", "texts", "metadatas")
+_INGEST_MANIFEST = "ingest_manifest.json"
+
+
+def _manifest_fingerprint(persist_path: Path) -> Optional[str]:
+    """Huella del ingest_manifest.json: cambia con cada ingestión que toca el índice."""
+    path = Path(persist_path) / _INGEST_MANIFEST
+    if not path.exists():
+        return None
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def _quantize(matrix: np.ndarray, fmt: str):
+    """(filas en el formato pedido, escalas por fila o None)."""
+    if fmt == "float32":
+        return matrix.astype(np.float32), None
+    if fmt == "float16":
+        return matrix.astype(np.float16), None
+    # int8 simétrico por fila: fila ≈ q * escala
+    scales = np.abs(matrix).max(axis=1) / 127.0 if len(matrix) else np.zeros(0, dtype=np.float32)
+    scales = np.where(scales == 0, 1.0, scales).astype(np.float32)
+    return np.round(matrix / scales[:, None]).astype(np.int8), scales
+
+
+def _write_blob(directory: Path, field: str, values) -> int:
+    offsets = [0]
+    with open(directory / f"{field}.bin", "wb") as f:
+        for value in values:
+            raw = (value if field == "texts" else json.dumps(value, ensure_ascii=False)).encode("utf-8")
+            f.write(raw)
+            offsets.append(offsets[-1] + len(raw))
+    np.save(directory / f"{field}.offsets.npy", np.asarray(offsets, dtype=np.uint64))
+    return offsets[-1]
+
+
+def export_snapshot(index: NumPyVectorIndex, persist_path: Path, fmt: str = DEFAULT_SNAPSHOT_FORMAT,
+                    dest: Optional[Path] = None) -> Dict[str, Any]:
+    """
+    Escribe la instantánea de `index` (por defecto en <persist_path>/snapshot)
+    y la reemplaza de forma atómica. Devuelve su snapshot.json.
+    """
+    if fmt not in SNAPSHOT_FORMATS:
+        raise ValueError(f"Formato de instantánea desconocido: {fmt} (opciones: {', '.join(SNAPSHOT_FORMATS)})")
+    dest = Path(dest) if dest is not None else Path(persist_path) / SNAPSHOT_DIR
+    tmp = dest.with_name(f"{dest.name}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    vectors, scales = _quantize(index.rows(), fmt)
+    np.save(tmp / "vectors.npy", vectors)
+    np.save(tmp / "norms.npy", index.norms.astype(np.float32))
+    if scales is not None:
+        np.save(tmp / "scales.npy", scales)
+    blob_bytes = {field: _write_blob(tmp, field, getattr(index, field)) for field in _FIELDS}
+
+    header = {
+        "version": SNAPSHOT_FORMAT_VERSION,
+        "format": fmt,
+        "documents": len(index),
+        "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+        "space": index.space,
+        "vector_bytes": int(vectors.nbytes),
+        "blob_bytes": blob_bytes,
+        "ingest_manifest": _manifest_fingerprint(persist_path),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    with open(tmp / "snapshot.json", "w", encoding="utf-8") as f:
+        json.dump(header, f, indent=2)
+
+    # Cambio atómico de directorio: un worker nunca ve una instantánea a medias
+    old = dest.with_name(f"{dest.name}.old-{os.getpid()}")
+    if dest.exists():
+        os.replace(dest, old)
+    os.replace(tmp, dest)
+    shutil.rmtree(old, ignore_errors=True)
+    logger.info("Instantánea %s de %s: %d fragmentos, %.1f KiB de vectores",
+                fmt, persist_path, header["documents"], header["vector_bytes"] / 1024)
+    return header
+
+
+class MappedRecords(Sequence):
+    """Registros de un campo (ids, textos o metadatos) leídos bajo demanda del blob mapeado."""
+
+    def __init__(self, directory: Path, field: str):
+        self.field = field
+        self._offsets = np.load(directory / f"{field}.offsets.npy", mmap_mode="r")
+        with open(directory / f"{field}.bin", "rb") as f:
+            # mmap no admite archivos vacíos
+            self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self._offsets[-1] else b""
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError(position)
+        raw = self._blob[int(self._offsets[position]):int(self._offsets[position + 1])]
+        text = raw.decode("utf-8") if isinstance(raw, bytes) else bytes(raw).decode("utf-8")
+        return text if self.field == "texts" else json.loads(text)
+
+
+def read_header(directory: Path) -> Optional[Dict[str, Any]]:
+    path = Path(directory) / "snapshot.json"
+    if not path.exists():
+        return None
+    with open(path, encoding="utf-8") as f:
+        header = json.load(f)
+    return header if header.get("version") == SNAPSHOT_FORMAT_VERSION else None
+
+
+def load_snapshot(persist_path: Path, directory: Optional[Path] = None, check_fresh: bool = True,
+                  **kwargs) -> Optional[NumPyVectorIndex]:
+    """
+    Índice mapeado desde la instantánea del tema, o None si no hay, es de
+    otra versión o quedó vieja respecto a la última ingestión.
+    """
+    directory = Path(directory) if directory is not None else Path(persist_path) / SNAPSHOT_DIR
+    header = read_header(directory)
+    if header is None or not header.get("documents"):
+        return None
+    if check_fresh and header.get("ingest_manifest") != _manifest_fingerprint(persist_path):
+        logger.warning("Instantánea de %s desactualizada (reindexado después de exportar): se ignora. "
+                       "Ejecuta manage.py vector_snapshot.", persist_path)
+        return None
+
+    scales_path = directory / "scales.npy"
+    return NumPyVectorIndex(
+        MappedRecords(directory, "ids"),
+        MappedRecords(directory, "texts"),
+        MappedRecords(directory, "metadatas"),
+        np.load(directory / "vectors.npy", mmap_mode="r"),
+        np.load(directory / "norms.npy", mmap_mode="r"),
+        space=header["space"],
+        scales=np.load(scales_path, mmap_mode="r") if scales_path.exists() else None,
+        **kwargs,
+    )
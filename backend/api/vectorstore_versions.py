@@ -0,0 +1,270 @@
+# backend/api/vectorstore_versions.py
+
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+
+# VERSIONES DEL VECTORSTORE DE CADA TEMA
+# La ingestión ya no escribe en el directorio que está leyendo el servidor:
+#   <tema>_vs/current.json          puntero a la versión vigente (y las
+#                                   últimas publicadas, con su fecha)
+#   <tema>_vs/versions/<id>/        Chroma, ingest_manifest.json, índice
+#                                   BM25 e instantánea de esa versión
+#   (una versión con el archivo .building está en construcción: nadie la lee)
+# Una ingestión copia la versión vigente (o parte de cero con --full),
+# aplica los cambios en la copia y la publica reemplazando current.json de
+# forma atómica. Las peticiones en vuelo terminan con los objetos de la
+# versión anterior; las siguientes ven el id nuevo y cargan la nueva.
+# Un <tema>_vs con chroma.sqlite3 en la raíz (anterior a las versiones) se
+# lee como la versión "legacy" hasta la primera ingestión.
+# Dos ingestiones del mismo tema (en procesos distintos) no se solapan:
+# cada una toma <tema>_vs/.lock antes de copiar la vigente y lo suelta al
+# publicar; si no, la segunda en publicar perdería los cambios de la primera.
+
+VERSIONS_DIR = "versions"
+CURRENT_FILE = "current.json"
+LEGACY_VERSION = "legacy"
+BUILDING_MARKER = ".building"
+LOCK_FILE = ".lock"
+_HISTORY_SIZE = 20
+
+# Versiones que se conservan (la vigente y la anterior, por si algún worker
+# todavía responde con ella)
+KEEP_VERSIONS = max(1, int(os.getenv("ASSISTLEG_VECTORSTORE_KEEP_VERSIONS", "2")))
+# Una versión reemplazada no se borra hasta pasados estos segundos
+GC_GRACE_SECONDS = float(os.getenv("ASSISTLEG_VECTORSTORE_GC_GRACE", "600"))
+# Construcciones abandonadas (con .building) que se borran pasado este tiempo
+STALE_BUILD_SECONDS = 24 * 3600
+
+
+def read_pointer(topic_dir: Path) -> Optional[Dict[str, Any]]:
+    path = Path(topic_dir) / CURRENT_FILE
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as exc:
+        logger.warning("Puntero de versión ilegible en %s: %r", path, exc)
+        return None
+
+
+def current_version(topic_dir: Path) -> Optional[str]:
+    """Id de la versión vigente del tema, "legacy" o None si no tiene índice."""
+    pointer = read_pointer(topic_dir)
+    if pointer is not None:
+        return pointer["version"]
+    if (Path(topic_dir) / "chroma.sqlite3").exists():
+        return LEGACY_VERSION
+    return None
+
+
+def has_index(topic_dir: Path) -> bool:
+    """Si el tema tiene una versión publicada (o un índice legacy) que leer."""
+    return (Path(topic_dir) / CURRENT_FILE).exists() or (Path(topic_dir) / "chroma.sqlite3").exists()
+
+
+def version_path(topic_dir: Path, version: Optional[str] = None) -> Optional[Path]:
+    """Directorio de una versión (por defecto la vigente), o None si no hay índice."""
+    version = version or current_version(topic_dir)
+    if version is None:
+        return None
+    if version == LEGACY_VERSION:
+        return Path(topic_dir)
+    return Path(topic_dir) / VERSIONS_DIR / version
+
+
+def _lock_file(f, blocking: bool) -> bool:
+    if fcntl is not None:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            return True
+        except BlockingIOError:
+            return False
+    f.seek(0)
+    while True:
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if not blocking:
+                return False
+            time.sleep(0.5)
+
+
+def _unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def topic_lock(topic_dir: Path):
+    """
+    Exclusión entre procesos para construir y publicar una versión del tema:
+    espera a que termine la ingestión que lo tenga tomado.
+    """
+    topic_dir = Path(topic_dir)
+    topic_dir.mkdir(parents=True, exist_ok=True)
+    with open(topic_dir / LOCK_FILE, "a+b") as f:
+        if not _lock_file(f, blocking=False):
+            logger.info("%s: esperando a que termine otra ingestión del tema", topic_dir.name)
+            _lock_file(f, blocking=True)
+        try:
+            yield
+        finally:
+            _unlock_file(f)
+
+
+def _new_version_id() -> str:
+    # Ordenable por fecha (hasta el nanosegundo); el sufijo evita choques entre procesos
+    now = time.time_ns()
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now // 10**9))
+    return f"{stamp}.{now % 10**9:09d}-{uuid.uuid4().hex[:4]}"
+
+
+def _legacy_entries(topic_dir: Path) -> List[Path]:
+    return [p for p in topic_dir.iterdir()
+            if p.name not in (VERSIONS_DIR, CURRENT_FILE) and not p.name.startswith(".")]
+
+
+def begin_version(topic_dir: Path, copy_current: bool = True) -> Tuple[str, Path]:
+    """
+    Crea el directorio de construcción de una versión nueva: una copia de la
+    vigente (ingestión incremental) o vacío. Devuelve (id, directorio).
+    """
+    topic_dir = Path(topic_dir)
+    version = _new_version_id()
+    # Se construye en su lugar definitivo (Chroma no cambia de ruta al
+    # publicar); la marca la oculta hasta entonces
+    build_dir = topic_dir / VERSIONS_DIR / version
+    build_dir.mkdir(parents=True)
+    (build_dir / BUILDING_MARKER).touch()
+
+    source = version_path(topic_dir) if copy_current else None
+    if source == topic_dir:
+        for entry in _legacy_entries(topic_dir):
+            if entry.is_dir():
+                shutil.copytree(entry, build_dir / entry.name)
+            else:
+                shutil.copy2(entry, build_dir / entry.name)
+    elif source is not None:
+        # La instantánea se vuelve a exportar al final: no hace falta copiarla
+        shutil.copytree(source, build_dir, dirs_exist_ok=True,
+                        ignore=shutil.ignore_patterns("snapshot", "snapshot.*"))
+    return version, build_dir
+
+
+def discard_version(build_dir: Path):
+    shutil.rmtree(build_dir, ignore_errors=True)
+
+
+def publish_version(topic_dir: Path, version: str, build_dir: Path, **info) -> Dict[str, Any]:
+    """
+    Publica una versión construida: le quita la marca y reemplaza
+    current.json de forma atómica. Después recoge las versiones viejas.
+    """
+    topic_dir = Path(topic_dir)
+    (Path(build_dir) / BUILDING_MARKER).unlink()
+
+    previous = read_pointer(topic_dir) or {}
+    history = previous.get("history") or []
+    if not history and current_version(topic_dir) == LEGACY_VERSION:
+        history = [{"version": LEGACY_VERSION, "published": None}]
+    now = time.time()
+    pointer = {
+        "version": version,
+        "previous": history[-1]["version"] if history else None,
+        "published": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(now)),
+        **info,
+        "history": (history + [{"version": version, "published": now}])[-_HISTORY_SIZE:],
+    }
+    tmp_path = topic_dir / f".{CURRENT_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(pointer, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, topic_dir / CURRENT_FILE)
+    logger.info("%s: publicada la versión %s (anterior: %s)", topic_dir.name, version, pointer["previous"])
+
+    collect_garbage(topic_dir)
+    return pointer
+
+
+def list_versions(topic_dir: Path) -> List[str]:
+    """Versiones publicadas en disco, de la más antigua a la más nueva."""
+    topic_dir = Path(topic_dir)
+    versions_dir = topic_dir / VERSIONS_DIR
+    versions = sorted(
+        p.name for p in versions_dir.iterdir()
+        if p.is_dir() and not (p / BUILDING_MARKER).exists()
+    ) if versions_dir.is_dir() else []
+    if (topic_dir / "chroma.sqlite3").exists():
+        versions.insert(0, LEGACY_VERSION)
+    return versions
+
+
+def collect_garbage(topic_dir: Path, keep: int = KEEP_VERSIONS,
+                    grace_seconds: float = GC_GRACE_SECONDS) -> List[str]:
+    """
+    Borra las versiones que ya no son de las `keep` más recientes y fueron
+    reemplazadas hace más de `grace_seconds`, y las construcciones
+    abandonadas. Nunca toca la vigente ni las que se publiquen después.
+    """
+    topic_dir = Path(topic_dir)
+    pointer = read_pointer(topic_dir)
+    if pointer is None:
+        return []
+    current = pointer["version"]
+    history = pointer.get("history") or []
+    # Momento en que cada versión dejó de ser la vigente
+    superseded = {older["version"]: newer["published"] for older, newer in zip(history, history[1:])}
+
+    versions = list_versions(topic_dir)
+    if current not in versions:
+        return []
+    # Las posteriores a la vigente son de otra ingestión a punto de publicarse
+    candidates = versions[:versions.index(current)]
+    now = time.time()
+    removed = []
+    for version in candidates[:max(0, len(candidates) - (keep - 1))]:
+        since = superseded.get(version)
+        if since is not None and now - since < grace_seconds:
+            continue
+        try:
+            if version == LEGACY_VERSION:
+                for entry in _legacy_entries(topic_dir):
+                    if entry.is_dir():
+                        shutil.rmtree(entry)
+                    else:
+                        entry.unlink()
+            else:
+                shutil.rmtree(topic_dir / VERSIONS_DIR / version)
+        except OSError as exc:
+            # Archivos abiertos (Windows): se reintenta en la próxima publicación
+            logger.warning("No se pudo borrar la versión %s de %s: %r", version, topic_dir.name, exc)
+            continue
+        removed.append(version)
+
+    for marker in (topic_dir / VERSIONS_DIR).glob(f"*/{BUILDING_MARKER}"):
+        if now - marker.stat().st_mtime > STALE_BUILD_SECONDS:
+            discard_version(marker.parent)
+
+    if removed:
+        logger.info("%s: versiones borradas: %s", topic_dir.name, ", ".join(removed))
+    return removed
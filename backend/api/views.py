@@ -1,21 +1,232 @@
-from rest_framework.decorators import api_view
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 
-from .react_agent import build_legal_agent   
+from .answer_cache import answer_cache
+from .batch import BatchError, run_batch
+from .config_llm import llm_provider
+from .create_vectorstores import SPLITTERS
+from .indexing_jobs import UploadError, indexing_jobs, save_upload, validate_folder
+from .memory import DEFAULT_SESSION_ID, memory_stats
+from .rag_loader import (
+    cache_stats as rag_cache_stats, request_topic_key as _topic_key, unknown_topic_message as _unknown_topic,
+)
+from .react_agent import stream_legal_answer
+from .reranker import reranker
+from .retrieval_router import retrieval_router
+from .registry import agent_registry, get_legal_agent
+from .tracing import ENABLED as TRACING_ENABLED, TIMING_HEADER, metrics, trace_request
+
+
+def _session_id(data) -> str:
+    session_id = data.get("session_id")
+    if not session_id:
+        return DEFAULT_SESSION_ID
+    return str(session_id)[:128]
 
 
 @api_view(["POST"])
 def ask_question(request):
-    topic = request.data.get("topic")
+    topic = _topic_key(request.data)
     question = request.data.get("question")
 
-    # Crear agente con RAG + memoria + herramientas
-    agent = build_legal_agent(topic)
+    if topic is None:
+        return Response({"error": _unknown_topic(request.data)}, status=400)
+
+    with trace_request("ask", topic=topic) as trace:
+        # Agente con RAG + memoria + herramientas (construido una sola vez por tema)
+        agent = get_legal_agent(topic)
+
+        # Memoria independiente por chat (el frontend envía su session_id)
+        config = {"configurable": {"session_id": _session_id(request.data)}}
+
+        # Ejecutar el agente
+        answer = agent.invoke({"input": question}, config)
+
+    return _with_timing(Response({"answer": answer}), trace)
+
+
+@csrf_exempt
+@require_POST
+async def ask_question_async(request):
+    """
+    Igual que ask_question, pero asíncrona (servir con ASGI: backend.asgi).
+    Mientras una pregunta espera al LLM, el mismo proceso atiende otras.
+    """
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return JsonResponse({"error": "JSON inválido"}, status=400)
+
+    topic = _topic_key(data)
+    question = data.get("question")
+
+    if topic is None:
+        return JsonResponse({"error": _unknown_topic(data)}, status=400)
+
+    with trace_request("ask_async", topic=topic) as trace:
+        # La primera construcción del agente carga modelos: fuera del event loop
+        agent = await sync_to_async(get_legal_agent, thread_sensitive=False)(topic)
+
+        config = {"configurable": {"session_id": _session_id(data)}}
+
+        answer = await agent.ainvoke({"input": question}, config)
+
+    return _with_timing(JsonResponse({"answer": answer}), trace)
+
+
+def _with_timing(response, trace):
+    # Desglose por etapa en ms (ASSISTLEG_TIMING_HEADER=1), ver tracing
+    if TRACING_ENABLED and TIMING_HEADER:
+        response["X-Timing"] = trace.timing_header()
+    return response
+
+
+def _sse(event: dict) -> str:
+    # Formato Server-Sent Events: "event: <tipo>\ndata: <json>\n\n"
+    payload = {k: v for k, v in event.items() if k != "event"}
+    return f"event: {event['event']}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+@csrf_exempt
+@require_POST
+def ask_question_stream(request):
+    """
+    Igual que ask_question, pero responde con Server-Sent Events: primero un
+    evento "retrieval", luego un evento "token" por fragmento del LLM y al
+    final "done" con la respuesta completa.
+    """
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return JsonResponse({"error": "JSON inválido"}, status=400)
+
+    topic = _topic_key(data)
+    question = data.get("question")
+
+    if topic is None:
+        return JsonResponse({"error": _unknown_topic(data)}, status=400)
+
+    events = stream_legal_answer(topic, question, _session_id(data))
+
+    response = StreamingHttpResponse(
+        (_sse(event) for event in events),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    # Evitar que un proxy (nginx) acumule la respuesta antes de enviarla
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@api_view(["POST"])
+@permission_classes([IsAdminUser])
+def ask_batch(request):
+    """
+    Lote de preguntas: {"items": [{"id", "topic" | "topics", "question"}, ...]}
+    (o la lista directamente). Responde JSONL a medida que terminan: una
+    línea por pregunta con su "status" y al final {"summary": ...}.
+    Sin memoria de sesión (ver api/batch.py). Solo administradores: un lote
+    son cientos de llamadas al LLM con la cuota de todos.
+    """
+    data = request.data
+    raw_items = data.get("items") if isinstance(data, dict) else data
+    try:
+        results = run_batch(raw_items)
+    except BatchError as exc:
+        return Response({"error": str(exc)}, status=400)
+
+    response = StreamingHttpResponse(
+        (json.dumps(result, ensure_ascii=False) + "\n" for result in results),
+        content_type="application/x-ndjson",
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def metrics_view(request):
+    """Métricas por etapa en formato de texto de Prometheus (ver tracing)."""
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@api_view(["GET"])
+def registry_stats(request):
+    return Response(agent_registry.stats())
+
+
+@api_view(["GET"])
+def memory_stats_view(request):
+    return Response(memory_stats())
+
+
+@api_view(["GET"])
+def cache_stats_view(request):
+    return Response({
+        "answers": answer_cache.stats(),
+        **rag_cache_stats(),
+        "rerank": reranker.stats(),
+        "llm": llm_provider.stats(),
+        "router": retrieval_router.stats(),
+    })
+
+
+@api_view(["POST"])
+@permission_classes([IsAdminUser])
+def registry_invalidate(request):
+    # Las versiones nuevas se detectan solas; esto fuerza releerlas ya (o tras
+    # exportar una instantánea con manage.py vector_snapshot)
+    topic = request.data.get("topic") or None
+    agent_registry.invalidate(topic)
+    return Response({"invalidated": topic or "all"})
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def llm_health(request):
+    # Llamada real a Groq: solo bajo demanda, nunca al importar el módulo
+    result = llm_provider.health_check()
+    return Response(result, status=200 if result["ok"] else 503)
+
+
+@api_view(["POST"])
+@permission_classes([IsAdminUser])
+def upload_documents(request):
+    # multipart: folder=<carpeta de backend/rags/>, files=<uno o más PDF/TXT>
+    # Responde 202 enseguida; el avance se consulta en /api/documents/jobs/<id>/
+    files = request.FILES.getlist("files") or request.FILES.getlist("file")
+    splitter = request.data.get("splitter") or None
+    try:
+        folder = validate_folder(request.data.get("folder"))
+        if not files:
+            raise UploadError("No se envió ningún archivo ('files').")
+        if splitter is not None and splitter not in SPLITTERS:
+            raise UploadError(f"'splitter' debe ser uno de: {', '.join(SPLITTERS)}.")
+        saved = [save_upload(folder, uploaded) for uploaded in files]
+    except UploadError as exc:
+        return Response({"error": str(exc)}, status=exc.status)
+
+    full = str(request.data.get("full", "")).lower() in ("1", "true", "yes")
+    job = indexing_jobs.submit(folder, [p.name for p in saved], full=full, splitter=splitter)
+    return Response(job.to_dict(), status=202)
+
 
-    # Agregar session_id obligatorio
-    config = {"configurable": {"session_id": "web_user_1"}}
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def indexing_jobs_list(request):
+    return Response({"jobs": [job.to_dict() for job in indexing_jobs.list()]})
 
-    # Ejecutar el agente
-    answer = agent.invoke({"input": question}, config)
 
-    return Response({"answer": answer})
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def indexing_job_detail(request, job_id):
+    job = indexing_jobs.get(job_id)
+    if job is None:
+        return Response({"error": "Trabajo desconocido."}, status=404)
+    return Response(job.to_dict())
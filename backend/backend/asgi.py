@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_asgi_application()
+
+# Precargar vectorstores y agentes de todos los temas (ver api/registry.py)
+from api.registry import warm_up_in_background  # noqa: E402
+
+warm_up_in_background()
@@ -138,3 +138,24 @@ from dotenv import load_dotenv
 load_dotenv()
 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+
+# Logging de la app (api.*): una línea por evento y, con el trazado activo,
+# una línea JSON por petición (logger api.tracing). ASSISTLEG_LOG_LEVEL=WARNING
+# deja solo los problemas.
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "simple": {"format": "%(asctime)s %(levelname)s %(name)s: %(message)s"},
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler", "formatter": "simple"},
+    },
+    "loggers": {
+        "api": {
+            "handlers": ["console"],
+            "level": os.getenv("ASSISTLEG_LOG_LEVEL", "INFO"),
+            "propagate": False,
+        },
+    },
+}
@@ -0,0 +1,115 @@
+# backend/benchmarks/chunking_report.py
+#
+# Compara la división por tamaño fijo (RecursiveCharacterTextSplitter
+# 1000/200) con la división por artículos sobre los documentos de rags/:
+#   - fragmentos, caracteres indexados y tamaño estimado de los embeddings,
+#   - tokens medios del prompt para preguntas de ejemplo (contexto = los
+#     k mejores fragmentos según BM25, presupuestado con build_prompt_parts).
+# No calcula embeddings ni llama al LLM.
+#
+# Uso (desde backend/):
+#     python benchmarks/chunking_report.py
+#     python benchmarks/chunking_report.py constitucion --k 5 --json chunking.json
+
+import argparse
+import json
+import statistics
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from api.create_vectorstores import (  # noqa: E402
+    RAGS_PATH, SPLITTERS, _parse_pdf_range, _parse_txt, list_documents, list_folders, split_document,
+)
+from api.lexical_index import BM25Index  # noqa: E402
+from api.prompt_builder import build_prompt_parts  # noqa: E402
+
+EMBEDDING_DIM = 384   # all-MiniLM-L6-v2, float32
+
+QUESTIONS = {
+    "constitucion": [
+        "¿Qué es la acción de tutela?",
+        "¿Cuáles son los derechos fundamentales de los niños?",
+        "¿Quién elige al Presidente de la República?",
+        "¿Qué dice la Constitución sobre la libertad de cultos?",
+    ],
+    "codigo_trabajo": [
+        "¿Cuál es la duración máxima de la jornada de trabajo?",
+        "¿Cuándo se termina el contrato con justa causa?",
+        "¿Cuántos días de vacaciones remuneradas tiene un trabajador?",
+        "¿Qué es el periodo de prueba?",
+    ],
+    "reglamentos": [
+        "¿Cuántas faltas de asistencia se permiten?",
+        "¿Cómo se hace una homologación?",
+        "¿Cuándo se pierde la calidad de estudiante?",
+        "¿Qué es un curso teórico práctico?",
+    ],
+}
+
+
+def load_pages(path: Path):
+    if path.suffix.lower() == ".pdf":
+        return _parse_pdf_range(str(path), 0, 10 ** 6)
+    return _parse_txt(str(path))
+
+
+def measure(folder: str, splitter: str, k: int) -> dict:
+    chunks = []
+    source_chars = 0
+    for path in list_documents(RAGS_PATH / folder):
+        pages = load_pages(path)
+        source_chars += sum(len(text) for _, text in pages)
+        chunks.extend(split_document(pages, {"source": path.name}, splitter))
+
+    lengths = [len(text) for text, _ in chunks]
+    index = BM25Index.build([str(i) for i in range(len(chunks))],
+                            [text for text, _ in chunks], [m for _, m in chunks])
+
+    prompt_tokens, context_tokens = [], []
+    for question in QUESTIONS.get(folder, []):
+        docs = [index.document(p) for p, _ in index.search(question, k)]
+        parts = build_prompt_parts(question, [], docs)
+        prompt_tokens.append(parts["tokens"]["total_tokens"])
+        context_tokens.append(parts["tokens"]["context_tokens"])
+
+    return {
+        "splitter": splitter,
+        "chunks": len(chunks),
+        "indexed_chars": sum(lengths),
+        "duplication": round(sum(lengths) / source_chars - 1, 3) if source_chars else 0.0,
+        "avg_chunk_chars": round(statistics.mean(lengths)) if lengths else 0,
+        "embeddings_mb": round(len(chunks) * EMBEDDING_DIM * 4 / 1e6, 2),
+        "with_article": sum(1 for _, m in chunks if "articulo" in m),
+        "avg_prompt_tokens": round(statistics.mean(prompt_tokens)) if prompt_tokens else None,
+        "avg_context_tokens": round(statistics.mean(context_tokens)) if context_tokens else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tamaño del índice y del prompt: división por tamaño vs por artículos.")
+    parser.add_argument("folders", nargs="*", help="Carpetas de backend/rags/ (por defecto, todas)")
+    parser.add_argument("--k", type=int, default=5, help="Fragmentos de contexto por pregunta")
+    parser.add_argument("--json", help="Guardar los resultados en este archivo")
+    args = parser.parse_args()
+
+    results = {}
+    header = f"{'carpeta':<16}{'división':<11}{'chunks':>8}{'chars':>10}{'dup.':>7}{'emb MB':>8}{'prompt':>8}{'contexto':>10}"
+    print(header)
+    print("-" * len(header))
+    for folder in args.folders or list_folders():
+        results[folder] = [measure(folder, splitter, args.k) for splitter in reversed(SPLITTERS)]
+        for r in results[folder]:
+            print(f"{folder:<16}{r['splitter']:<11}{r['chunks']:>8}{r['indexed_chars']:>10}"
+                  f"{r['duplication']:>7.0%}{r['embeddings_mb']:>8}{str(r['avg_prompt_tokens']):>8}"
+                  f"{str(r['avg_context_tokens']):>10}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# backend/benchmarks/cold_start.py
+#
+# Mide el arranque en frío de un worker: cuánto tarda un proceso nuevo en
+# configurar Django e importar api.views. Falla (exit 1) si la mediana supera
+# el presupuesto, para detectar regresiones como llamadas de red al importar.
+#
+# Uso (desde backend/):
+#     python benchmarks/cold_start.py --runs 5 --budget-ms 4000
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+# Presupuesto por defecto para `import api.views` (sin contar django.setup()).
+DEFAULT_BUDGET_MS = 4000
+
+_PROBE = """
+import json, os, time
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+t0 = time.perf_counter()
+import django
+django.setup()
+t1 = time.perf_counter()
+import api.views
+t2 = time.perf_counter()
+print(json.dumps({"django_setup_ms": (t1 - t0) * 1000, "import_views_ms": (t2 - t1) * 1000}))
+"""
+
+
+def measure_once() -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = str(BACKEND_DIR)
+    # Un worker no debe necesitar red para arrancar
+    env.setdefault("ASSISTLEG_WARMUP", "0")
+
+    out = subprocess.run(
+        [sys.executable, "-c", _PROBE],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # La última línea es el JSON; lo demás son prints de los módulos
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Presupuesto de arranque en frío de api.views")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    args = parser.parse_args()
+
+    samples = [measure_once() for _ in range(args.runs)]
+    views_ms = [s["import_views_ms"] for s in samples]
+    setup_ms = [s["django_setup_ms"] for s in samples]
+
+    report = {
+        "runs": args.runs,
+        "budget_ms": args.budget_ms,
+        "import_views_ms": {
+            "median": round(statistics.median(views_ms), 1),
+            "min": round(min(views_ms), 1),
+            "max": round(max(views_ms), 1),
+        },
+        "django_setup_ms_median": round(statistics.median(setup_ms), 1),
+    }
+    report["within_budget"] = report["import_views_ms"]["median"] <= args.budget_ms
+    print(json.dumps(report, indent=2))
+
+    sys.exit(0 if report["within_budget"] else 1)
+
+
+if __name__ == "__main__":
+    main()
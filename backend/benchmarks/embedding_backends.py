@@ -0,0 +1,165 @@
+# backend/benchmarks/embedding_backends.py
+#
+# Compara los backends de embeddings (torch, onnx, onnx-int8) sobre los
+# fragmentos de nuestros vectorstores:
+#   - docs/s al embeber fragmentos por lotes (ingestión),
+#   - consultas/s con varios hilos concurrentes, con y sin micro-batching,
+#   - recall@k de la búsqueda exacta respecto al backend de referencia
+#     (los k vecinos que encuentra cada backend vs los de "torch").
+#
+# Uso (desde backend/):
+#     python benchmarks/embedding_backends.py --backends torch onnx onnx-int8 --k 5
+#     python benchmarks/embedding_backends.py --json resultados.json
+
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from api.embeddings import BACKENDS, MicroBatchingEmbeddings, build_base_embeddings  # noqa: E402
+from api.vectorstore_versions import version_path  # noqa: E402
+
+VECTORSTORES_PATH = BACKEND_DIR / "vectorstores"
+
+QUESTIONS = [
+    "¿Cuáles son los derechos fundamentales?",
+    "¿Qué es la acción de tutela?",
+    "¿Cuál es la duración máxima de la jornada laboral?",
+    "¿Cuándo procede el despido con justa causa?",
+    "¿Cómo se liquidan las vacaciones?",
+    "¿Qué es el periodo de prueba?",
+    "¿Cuáles son las obligaciones del empleador?",
+    "¿Cuántas faltas de asistencia se permiten en un curso?",
+    "¿Cómo se cancela una asignatura?",
+    "¿Qué sanciones disciplinarias tiene un estudiante?",
+]
+
+
+def load_corpus(max_docs_per_topic: int):
+    """Fragmentos de cada vectorstore (sin cargar el modelo de embeddings)."""
+    import chromadb
+
+    corpus = {}
+    for topic_dir in sorted(VECTORSTORES_PATH.glob("*_vs")):
+        # Versión vigente; sin chroma.sqlite3 el cliente crearía un índice vacío
+        persist_dir = version_path(topic_dir)
+        if persist_dir is None or not (persist_dir / "chroma.sqlite3").exists():
+            print(f"  (omitido {topic_dir.name}: sin chroma.sqlite3)")
+            continue
+        client = chromadb.PersistentClient(path=str(persist_dir))
+        for collection in client.list_collections():
+            name = getattr(collection, "name", collection)
+            docs = client.get_collection(name).get(include=["documents"])["documents"]
+            corpus.setdefault(topic_dir.name, []).extend(d for d in docs if d)
+        corpus[topic_dir.name] = corpus.get(topic_dir.name, [])[:max_docs_per_topic]
+    return {topic: docs for topic, docs in corpus.items() if docs}
+
+
+def _normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def top_k(doc_matrix, query_matrix, k):
+    scores = query_matrix @ doc_matrix.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def measure_queries(embeddings, queries, threads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(embeddings.embed_query, queries))
+    return len(queries) / (time.perf_counter() - start)
+
+
+def bench_backend(backend, corpus, queries, args):
+    start = time.perf_counter()
+    model = build_base_embeddings(backend, batch_size=args.batch_size)
+    model.embed_query("calentamiento")
+    result = {"backend": backend, "load_s": round(time.perf_counter() - start, 2), "topics": {}}
+
+    neighbours = {}
+    total_docs, total_seconds = 0, 0.0
+    for topic, docs in corpus.items():
+        start = time.perf_counter()
+        doc_matrix = _normalize(model.embed_documents(docs))
+        elapsed = time.perf_counter() - start
+        total_docs += len(docs)
+        total_seconds += elapsed
+
+        query_matrix = _normalize(model.embed_documents(queries))
+        neighbours[topic] = top_k(doc_matrix, query_matrix, args.k)
+        result["topics"][topic] = {"docs": len(docs), "docs_per_s": round(len(docs) / elapsed, 1)}
+
+    result["docs_per_s"] = round(total_docs / total_seconds, 1) if total_seconds else 0.0
+
+    # Consultas concurrentes: una llamada al modelo por consulta vs lotes
+    repeated = (queries * (args.concurrent_queries // len(queries) + 1))[:args.concurrent_queries]
+    result["queries_per_s"] = round(measure_queries(model, repeated, args.threads), 1)
+    batcher = MicroBatchingEmbeddings(model, max_batch=args.batch_size, max_wait_ms=args.wait_ms, backend=backend)
+    result["queries_per_s_batched"] = round(measure_queries(batcher, repeated, args.threads), 1)
+    result["batching"] = batcher.stats()
+    return result, neighbours
+
+
+def recall_at_k(reference, candidate, k):
+    hits = sum(len(set(r) & set(c)) for r, c in zip(reference, candidate))
+    return hits / (len(reference) * k)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--max-docs", type=int, default=500, help="Fragmentos por tema")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--concurrent-queries", type=int, default=200)
+    parser.add_argument("--wait-ms", type=float, default=2.0)
+    parser.add_argument("--json", help="Guardar los resultados en este archivo")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.max_docs)
+    if not corpus:
+        sys.exit("No hay vectorstores con fragmentos en backend/vectorstores/ (ejecuta manage.py ingest).")
+
+    # Consultas: preguntas típicas + el inicio de algunos fragmentos
+    queries = list(QUESTIONS)
+    for docs in corpus.values():
+        queries.extend(doc[:200] for doc in docs[::max(1, len(docs) // 10)][:10])
+
+    results, neighbours = [], {}
+    for backend in args.backends:
+        print(f"== {backend}")
+        try:
+            result, neighbours[backend] = bench_backend(backend, corpus, queries, args)
+        except Exception as exc:
+            print(f"   no disponible: {exc!r}")
+            continue
+        results.append(result)
+
+    reference = args.backends[0]
+    for result in results:
+        if reference in neighbours:
+            result[f"recall@{args.k}_vs_{reference}"] = {
+                topic: round(recall_at_k(neighbours[reference][topic],
+                                         neighbours[result["backend"]][topic], args.k), 3)
+                for topic in corpus
+            }
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
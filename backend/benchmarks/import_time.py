@@ -0,0 +1,138 @@
+# backend/benchmarks/import_time.py
+#
+# Perfil de importación de un worker (`python -X importtime`): después de
+# django.setup() importa api.views en un proceso nuevo y reporta
+#   - el tiempo acumulado de api.views (mediana de varias ejecuciones),
+#   - los módulos más caros por tiempo propio y los módulos api.* con su
+#     tiempo acumulado,
+#   - los módulos de ingestión o de modelos que NO deben cargarse al
+#     arrancar (loaders, Chroma, SDK de Groq, torch...), con la cadena de
+#     imports que los trajo.
+# Sale con código 1 si se carga alguno de esos módulos o si se pasa
+# --budget-ms y la mediana lo supera: así se detectan regresiones del
+# arranque en frío.
+#
+# Uso (desde backend/):
+#     python benchmarks/import_time.py
+#     python benchmarks/import_time.py --runs 5 --budget-ms 1500 --json import_time.json
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+# Solo se necesitan en la ingestión o al crear el modelo/cliente (primer uso)
+SERVING_FORBIDDEN = (
+    "langchain_community", "pypdf", "bs4", "aiohttp",
+    "chromadb", "langchain_groq", "groq", "langchain_huggingface",
+    "sentence_transformers", "transformers", "torch", "onnxruntime", "optimum",
+)
+
+_PROBE = """
+import os
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+import django
+django.setup()
+import sys
+# __import__ (no importlib.import_module) para que -X importtime lo mida
+__import__(sys.argv[1])
+"""
+
+
+def parse_importtime(stderr: str):
+    """[(módulo, propio_us, acumulado_us, profundidad, padre)] en el orden de -X importtime."""
+    records = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        records.append([name.strip(), int(self_us), int(cumulative_us), depth, None])
+
+    # Un módulo aparece después de los que importa: su padre es el siguiente
+    # registro con menor profundidad
+    pending = []
+    for record in records:
+        while pending and pending[-1][3] > record[3]:
+            pending.pop()[4] = record[0]
+        pending.append(record)
+    return [tuple(record) for record in records]
+
+
+def import_chain(records, module: str):
+    parents = {name: parent for name, _, _, _, parent in records}
+    chain = [module]
+    while parents.get(chain[-1]):
+        chain.append(parents[chain[-1]])
+    return " <- ".join(chain)
+
+
+def measure_once(module: str):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = str(BACKEND_DIR)
+    env.setdefault("ASSISTLEG_WARMUP", "0")
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE, module],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    return parse_importtime(out.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Perfil -X importtime del arranque de un worker.")
+    parser.add_argument("--module", default="api.views", help="Módulo a importar tras django.setup()")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15, help="Módulos más caros a mostrar")
+    parser.add_argument("--budget-ms", type=float, help="Falla si la mediana lo supera")
+    parser.add_argument("--json", help="Guardar el reporte en este archivo")
+    args = parser.parse_args()
+
+    runs = [measure_once(args.module) for _ in range(args.runs)]
+    totals = []
+    for records in runs:
+        cumulative = [r[2] for r in records if r[0] == args.module]
+        totals.append(cumulative[0] / 1000 if cumulative else 0.0)
+    # Detalle de la ejecución mediana
+    records = runs[sorted(range(len(runs)), key=totals.__getitem__)[len(runs) // 2]]
+
+    loaded = {name.split(".")[0] for name, *_ in records}
+    forbidden = {
+        package: import_chain(records, next(name for name, *_ in records if name.split(".")[0] == package))
+        for package in SERVING_FORBIDDEN if package in loaded
+    }
+    report = {
+        "module": args.module,
+        "runs": args.runs,
+        "import_ms": {
+            "median": round(statistics.median(totals), 1),
+            "min": round(min(totals), 1),
+            "max": round(max(totals), 1),
+        },
+        "modules_imported": len(records),
+        "top_self_ms": [
+            {"module": name, "self_ms": round(self_us / 1000, 1), "imported_by": parent}
+            for name, self_us, _, _, parent in sorted(records, key=lambda r: -r[1])[:args.top]
+        ],
+        "api_modules_ms": {
+            name: round(cumulative_us / 1000, 1)
+            for name, _, cumulative_us, _, _ in sorted(records, key=lambda r: -r[2])
+            if name.startswith("api.")
+        },
+        "forbidden_loaded": forbidden,
+    }
+    report["ok"] = not forbidden and (args.budget_ms is None or report["import_ms"]["median"] <= args.budget_ms)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    sys.exit(0 if report["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+# backend/benchmarks/load_ask.py
+#
+# Generador de carga HTTP contra un servidor en marcha: mantiene una
+# concurrencia fija de peticiones a /api/ask/ (o al endpoint indicado)
+# durante N peticiones o N segundos e informa throughput, latencias
+# p50/p90/p95/p99/máx, errores por código y, si el servidor manda X-Timing,
+# el tiempo medio de cada etapa.
+#
+# Para no depender de Groq, arrancar el servidor con el LLM falso o con
+# respuestas grabadas:
+#     ASSISTLEG_LLM_PROVIDER=fake ASSISTLEG_FAKE_LLM_LATENCY_DIST=lognormal \
+#         ASSISTLEG_TIMING_HEADER=1 python manage.py runserver --noreload
+#     ASSISTLEG_LLM_PROVIDER=replay uvicorn backend.asgi:application
+#
+# Uso (desde backend/):
+#     python benchmarks/load_ask.py --concurrency 16 --requests 400
+#     python benchmarks/load_ask.py --endpoint /api/ask/async/ --duration 60 --json carga.json
+
+import argparse
+import http.client
+import json
+import statistics
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from urllib.parse import urlparse
+
+QUESTIONS_PATH = Path(__file__).resolve().parent / "retrieval_questions.json"
+
+
+def load_questions(path, topic):
+    """(tema, pregunta) del conjunto etiquetado; con --topic, todas contra ese tema."""
+    with open(path, encoding="utf-8") as f:
+        dataset = json.load(f)
+    return [(topic or f"{name}_vs", item["question"]) for name, items in sorted(dataset.items()) for item in items]
+
+
+def parse_timing(header):
+    """'embed=12.3, search=40.1, total=90.0' → {"embed": 12.3, ...}."""
+    timing = {}
+    for part in (header or "").split(","):
+        name, _, value = part.strip().partition("=")
+        try:
+            timing[name] = float(value)
+        except ValueError:
+            continue
+    return timing
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values))) - 1))
+    return round(sorted_values[index] * 1000, 1)
+
+
+class LoadGenerator:
+
+    def __init__(self, url, endpoint, questions, concurrency, total_requests, duration_s, timeout_s,
+                 session_mode):
+        parsed = urlparse(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        self.https = parsed.scheme == "https"
+        self.endpoint = endpoint
+        self.questions = questions
+        self.concurrency = concurrency
+        self.total_requests = total_requests
+        self.duration_s = duration_s
+        self.timeout_s = timeout_s
+        self.session_mode = session_mode
+
+        self._lock = threading.Lock()
+        self._issued = 0
+        self._deadline = None
+        self.latencies = []
+        self.statuses = Counter()
+        self.stage_ms = defaultdict(list)
+
+    def _next(self):
+        """Índice de la próxima petición, o None si ya se emitieron todas."""
+        with self._lock:
+            if self.total_requests is not None and self._issued >= self.total_requests:
+                return None
+            if self._deadline is not None and time.perf_counter() >= self._deadline:
+                return None
+            self._issued += 1
+            return self._issued - 1
+
+    def _connect(self):
+        cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=self.timeout_s)
+
+    def _worker(self, worker_id):
+        # Una conexión keep-alive por worker, como un cliente real
+        conn = self._connect()
+        while True:
+            i = self._next()
+            if i is None:
+                break
+            topic, question = self.questions[i % len(self.questions)]
+            session = f"load-{worker_id}" if self.session_mode == "worker" else f"load-{i}"
+            body = json.dumps({"topic": topic, "question": question, "session_id": session})
+
+            start = time.perf_counter()
+            try:
+                conn.request("POST", self.endpoint, body=body.encode("utf-8"),
+                             headers={"Content-Type": "application/json"})
+                response = conn.getresponse()
+                response.read()
+                status, timing = str(response.status), parse_timing(response.getheader("X-Timing"))
+            except (OSError, http.client.HTTPException) as exc:
+                status, timing = type(exc).__name__, {}
+                conn.close()
+                conn = self._connect()
+            elapsed = time.perf_counter() - start
+
+            with self._lock:
+                self.statuses[status] += 1
+                if status == "200":
+                    self.latencies.append(elapsed)
+                for stage, ms in timing.items():
+                    self.stage_ms[stage].append(ms)
+        conn.close()
+
+    def run(self):
+        start = time.perf_counter()
+        if self.duration_s is not None:
+            self._deadline = start + self.duration_s
+        threads = [threading.Thread(target=self._worker, args=(w,), daemon=True) for w in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.summary(time.perf_counter() - start)
+
+    def summary(self, elapsed):
+        latencies = sorted(self.latencies)
+        total = sum(self.statuses.values())
+        return {
+            "endpoint": self.endpoint,
+            "concurrency": self.concurrency,
+            "requests": total,
+            "ok": len(latencies),
+            "errors": {k: v for k, v in self.statuses.items() if k != "200"},
+            "elapsed_s": round(elapsed, 2),
+            "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+            "latency_ms": {
+                "mean": round(statistics.mean(latencies) * 1000, 1) if latencies else None,
+                "p50": percentile(latencies, 50),
+                "p90": percentile(latencies, 90),
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99),
+                "max": round(latencies[-1] * 1000, 1) if latencies else None,
+            },
+            "stages_mean_ms": {stage: round(statistics.mean(v), 1) for stage, v in sorted(self.stage_ms.items())},
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga HTTP a concurrencia fija contra /api/ask/.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Servidor en marcha")
+    parser.add_argument("--endpoint", default="/api/ask/", help="/api/ask/ o /api/ask/async/")
+    parser.add_argument("--concurrency", type=int, default=8, help="Peticiones en vuelo")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--requests", type=int, help="Total de peticiones (por defecto 200)")
+    group.add_argument("--duration", type=float, help="Segundos de carga")
+    parser.add_argument("--warmup", type=int, default=0, help="Peticiones previas fuera de las métricas")
+    parser.add_argument("--topic", help="Mandar todas las preguntas a este tema (p. ej. all)")
+    parser.add_argument("--questions", default=str(QUESTIONS_PATH), help="JSON {tema: [{question, ...}]}")
+    parser.add_argument("--sessions", choices=["worker", "request"], default="request",
+                        help="Una sesión de chat por worker (el historial crece) o por petición")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Timeout por petición (s)")
+    parser.add_argument("--json", help="Guardar el resumen en este archivo")
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions, args.topic)
+    total = args.requests if args.requests is not None or args.duration is not None else 200
+
+    if args.warmup:
+        LoadGenerator(args.url, args.endpoint, questions, min(args.concurrency, args.warmup),
+                      args.warmup, None, args.timeout, args.sessions).run()
+
+    result = LoadGenerator(args.url, args.endpoint, questions, args.concurrency,
+                           total, args.duration, args.timeout, args.sessions).run()
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if not result["ok"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# backend/benchmarks/load_wsgi_vs_asgi.py
+#
+# Compara el throughput de /api/ask/ (vista síncrona, WSGI) contra
+# /api/ask/async/ (vista asíncrona, ASGI) usando el LLM falso local, así que
+# no se llama a Groq. La recuperación (embeddings + Chroma) sí es real.
+#
+# - WSGI: N hilos de worker (como gunicorn --threads N) atienden las peticiones.
+# - ASGI: un único event loop con todas las peticiones en vuelo a la vez.
+#
+# Uso (desde backend/):
+#     python benchmarks/load_wsgi_vs_asgi.py --requests 40 --concurrency 20 --wsgi-threads 4
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+os.environ.setdefault("ASSISTLEG_LLM_PROVIDER", "fake")
+os.environ.setdefault("ASSISTLEG_WARMUP", "0")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.test import AsyncClient, Client  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+
+from api.registry import agent_registry  # noqa: E402
+
+QUESTIONS = [
+    "¿Cuáles son las obligaciones del empleador?",
+    "¿Qué es el contrato de trabajo?",
+    "¿Cuántos días de vacaciones corresponden por año trabajado?",
+    "¿Cuándo se pierde la calidad de estudiante?",
+]
+
+
+def _payload(topic, i):
+    return json.dumps({"topic": topic, "question": QUESTIONS[i % len(QUESTIONS)]})
+
+
+def _summary(name, latencies, elapsed):
+    latencies = sorted(latencies)
+    p95 = latencies[max(0, int(round(0.95 * len(latencies))) - 1)]
+    return {
+        "mode": name,
+        "requests": len(latencies),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "latency_p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "latency_p95_ms": round(p95 * 1000, 1),
+    }
+
+
+def run_wsgi(topic, n_requests, threads):
+    client = Client()
+
+    def one(i):
+        start = time.perf_counter()
+        resp = client.post("/api/ask/", _payload(topic, i), content_type="application/json")
+        assert resp.status_code == 200, resp.content
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = list(pool.map(one, range(n_requests)))
+    return _summary(f"wsgi ({threads} hilos)", latencies, time.perf_counter() - start)
+
+
+async def run_asgi(topic, n_requests, concurrency):
+    client = AsyncClient()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            resp = await client.post("/api/ask/async/", _payload(topic, i), content_type="application/json")
+            assert resp.status_code == 200, resp.content
+            return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(one(i) for i in range(n_requests)))
+    return _summary(f"asgi ({concurrency} en vuelo)", latencies, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput WSGI (sync) vs ASGI (async) con LLM falso")
+    parser.add_argument("--topic", default="reglamentos_vs")
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--wsgi-threads", type=int, default=4)
+    args = parser.parse_args()
+
+    setup_test_environment()
+
+    # Construir el agente antes de medir (carga de modelos fuera del benchmark)
+    agent_registry.get(args.topic)
+
+    results = [
+        run_wsgi(args.topic, args.requests, args.wsgi_threads),
+        asyncio.run(run_asgi(args.topic, args.requests, args.concurrency)),
+    ]
+    print(json.dumps({
+        "llm_latency_s": float(os.environ.get("ASSISTLEG_FAKE_LLM_LATENCY", "0.5")),
+        "results": results,
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
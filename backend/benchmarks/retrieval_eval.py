@@ -0,0 +1,299 @@
+# backend/benchmarks/retrieval_eval.py
+#
+# Calidad y latencia de la recuperación sobre los vectorstores, con un
+# conjunto etiquetado pregunta → artículos esperados por tema
+# (benchmarks/retrieval_questions.json):
+#   - recall@k y MRR (un fragmento es relevante si pertenece a un artículo
+#     esperado: metadato "articulo" o encabezado "ARTÍCULO N" en el texto),
+#   - latencia de recuperación p50/p95 y tiempo de embedding de la pregunta,
+#   - tokens del prompt que se enviaría al LLM (build_prompt_parts),
+#   - con --answer, latencia de la respuesta completa con el LLM falso.
+# Las cachés de embeddings, resultados y respuestas se desactivan para medir
+# cada consulta en frío. Nunca llama a Groq (ASSISTLEG_LLM_PROVIDER=fake) y
+# guarda un JSON con la configuración usada, comparable entre ejecuciones.
+#
+# Uso (desde backend/):
+#     python benchmarks/retrieval_eval.py --json base.json
+#     python benchmarks/retrieval_eval.py --search-type similarity --k 8 --compare base.json
+#     python benchmarks/retrieval_eval.py --no-hybrid --lambda-mult 0.5 --json mmr.json
+#     python benchmarks/retrieval_eval.py --vectorstores /tmp/vs_recursive   # otra división en fragmentos
+#     ASSISTLEG_RERANK=1 python benchmarks/retrieval_eval.py --answer
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+QUESTIONS_PATH = Path(__file__).resolve().parent / "retrieval_questions.json"
+CUTOFFS = (1, 3, 5)
+
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)), 1) if values else None
+
+
+def mean(values, digits=3):
+    return round(float(np.mean(values)), digits) if values else None
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def doc_articles(doc):
+    """Artículos a los que pertenece un fragmento recuperado."""
+    from api.lexical_index import find_article_headings
+
+    article = (doc.metadata or {}).get("articulo")
+    if article is not None:
+        return {str(article)}
+    # Fragmentos por tamaño (sin metadatos): los encabezados que contienen
+    return set(find_article_headings(doc.page_content))
+
+
+def score_ranking(ranked_articles, expected, cutoffs=CUTOFFS):
+    """recall@c para cada corte y reciprocal rank del primer relevante."""
+    expected = set(expected)
+    recall = {}
+    for cutoff in cutoffs:
+        found = set().union(*ranked_articles[:cutoff]) if ranked_articles else set()
+        recall[cutoff] = len(found & expected) / len(expected)
+    rank = next((i for i, arts in enumerate(ranked_articles, start=1) if arts & expected), None)
+    return recall, (1.0 / rank if rank else 0.0), rank
+
+
+def store_info(rag_loader, topic):
+    """Fragmentos indexados y división usada en la ingestión (ingest_manifest.json)."""
+    from api.create_vectorstores import load_manifest
+    from api.vectorstore_versions import version_path
+
+    manifest = load_manifest(version_path(rag_loader.VECTORSTORES_PATH / topic))
+    return {
+        "chunks": rag_loader.get_vectorstore(topic)._collection.count(),
+        "splitters": sorted({entry.get("splitter", "recursive-1000-200") for entry in manifest.values()}),
+    }
+
+
+def evaluate_topic(topic, questions, args):
+    from api import rag_loader
+    from api.prompt_builder import build_prompt_parts
+    from api.react_agent import build_legal_agent, retrieve_documents
+
+    retriever = rag_loader.load_rag_for_topic(topic)
+    embeddings = rag_loader.get_embeddings()
+
+    # Primera consulta: carga del modelo, Chroma e índice BM25 (fuera de las métricas)
+    start = time.perf_counter()
+    retrieve_documents(retriever, questions[0]["question"])
+    warmup_ms = (time.perf_counter() - start) * 1000
+
+    rows = []
+    for item in questions:
+        question = item["question"]
+        embed_ms, retrieval_ms = [], []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            embeddings.embed_query(question)
+            embed_ms.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            docs = retrieve_documents(retriever, question)
+            retrieval_ms.append((time.perf_counter() - start) * 1000)
+
+        ranked = [doc_articles(doc) for doc in docs]
+        recall, rr, rank = score_ranking(ranked, item["articles"], args.cutoffs)
+        tokens = build_prompt_parts(question, [], docs)["tokens"]
+
+        rows.append({
+            "question": question,
+            "expected": item["articles"],
+            "retrieved": [sorted(arts) for arts in ranked],
+            "rank": rank,
+            "recall": recall,
+            "reciprocal_rank": rr,
+            "embedding_ms": min(embed_ms),
+            "retrieval_ms": retrieval_ms,
+            "prompt_tokens": tokens["total_tokens"],
+            "context_tokens": tokens["context_tokens"],
+        })
+
+    answer_ms = []
+    if args.answer:
+        agent = build_legal_agent(topic)
+        for i, item in enumerate(questions):
+            config = {"configurable": {"session_id": f"bench-{topic}-{i}"}}
+            start = time.perf_counter()
+            agent.invoke({"input": item["question"]}, config)
+            answer_ms.append((time.perf_counter() - start) * 1000)
+
+    latencies = [ms for row in rows for ms in row["retrieval_ms"]]
+    summary = {
+        **store_info(rag_loader, topic),
+        "questions": len(rows),
+        **{f"recall@{c}": mean([row["recall"][c] for row in rows]) for c in args.cutoffs},
+        "mrr": mean([row["reciprocal_rank"] for row in rows]),
+        "not_found": sum(1 for row in rows if row["rank"] is None),
+        "retrieval_p50_ms": percentile(latencies, 50),
+        "retrieval_p95_ms": percentile(latencies, 95),
+        "embedding_avg_ms": mean([row["embedding_ms"] for row in rows], 1),
+        "warmup_ms": round(warmup_ms, 1),
+        "avg_docs": mean([len(row["retrieved"]) for row in rows], 2),
+        "avg_prompt_tokens": mean([row["prompt_tokens"] for row in rows], 1),
+        "avg_context_tokens": mean([row["context_tokens"] for row in rows], 1),
+    }
+    if answer_ms:
+        summary["answer_p50_ms"] = percentile(answer_ms, 50)
+        summary["answer_p95_ms"] = percentile(answer_ms, 95)
+    return {"summary": summary, "questions": rows}
+
+
+def overall(results, cutoffs):
+    """Promedios sobre todas las preguntas de todos los temas."""
+    rows = [row for topic in results.values() for row in topic["questions"]]
+    latencies = [ms for row in rows for ms in row["retrieval_ms"]]
+    return {
+        "questions": len(rows),
+        **{f"recall@{c}": mean([row["recall"][c] for row in rows]) for c in cutoffs},
+        "mrr": mean([row["reciprocal_rank"] for row in rows]),
+        "retrieval_p50_ms": percentile(latencies, 50),
+        "retrieval_p95_ms": percentile(latencies, 95),
+        "avg_prompt_tokens": mean([row["prompt_tokens"] for row in rows], 1),
+    }
+
+
+def print_comparison(current, previous_path):
+    with open(previous_path, encoding="utf-8") as f:
+        previous = json.load(f)
+
+    print(f"\nComparación con {previous_path} ({previous['meta'].get('commit')}, {previous['meta']['date']})")
+    sections = {**{t: r["summary"] for t, r in current["topics"].items()}, "total": current["overall"]}
+    before = {**{t: r["summary"] for t, r in previous["topics"].items()}, "total": previous["overall"]}
+    for name, summary in sections.items():
+        if name not in before:
+            continue
+        deltas = []
+        for key, value in summary.items():
+            old = before[name].get(key)
+            if isinstance(value, (int, float)) and isinstance(old, (int, float)) and key != "questions":
+                deltas.append(f"{key} {old} → {value} ({value - old:+.3f})")
+        print(f"  {name}:")
+        for line in deltas:
+            print(f"    {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="recall@k, MRR y latencias de la recuperación por tema.")
+    parser.add_argument("topics", nargs="*", help="Temas del conjunto etiquetado (por defecto, todos)")
+    parser.add_argument("--questions", default=str(QUESTIONS_PATH), help="JSON {tema: [{question, articles}]}")
+    parser.add_argument("--vectorstores", help="Directorio con los <tema>_vs (por defecto backend/vectorstores)")
+    parser.add_argument("--search-type", choices=["mmr", "similarity"], help="Búsqueda vectorial")
+    parser.add_argument("--k", type=int, help="Fragmentos que devuelve el retriever")
+    parser.add_argument("--fetch-k", type=int, help="Candidatos de MMR")
+    parser.add_argument("--lambda-mult", type=float, help="Diversidad de MMR (0 = máxima)")
+    parser.add_argument("--no-hybrid", action="store_true", help="Sin BM25 ni acceso directo por artículo")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeticiones por pregunta para las latencias")
+    parser.add_argument("--cutoffs", type=int, nargs="+", default=list(CUTOFFS), help="Cortes de recall@k")
+    parser.add_argument("--answer", action="store_true", help="Medir también la respuesta completa (LLM falso)")
+    parser.add_argument("--cached", action="store_true", help="Dejar activas las cachés de la recuperación")
+    parser.add_argument("--json", help="Guardar los resultados en este archivo")
+    parser.add_argument("--compare", help="JSON de una ejecución anterior para comparar")
+    args = parser.parse_args()
+
+    # Antes de importar api.*: sin red y, salvo --cached, sin cachés
+    os.environ["ASSISTLEG_LLM_PROVIDER"] = "fake"
+    os.environ.setdefault("ASSISTLEG_FAKE_LLM_LATENCY", "0")
+    os.environ.setdefault("ASSISTLEG_WARMUP", "0")
+    os.environ.setdefault("ASSISTLEG_ANSWER_CACHE", "0")
+    if not args.cached:
+        os.environ["ASSISTLEG_EMBEDDING_CACHE_SIZE"] = "0"
+        os.environ["ASSISTLEG_RETRIEVAL_CACHE_SIZE"] = "0"
+
+    from api import rag_loader
+    from api.embeddings import EMBEDDING_BACKEND, EMBEDDING_MODEL_NAME
+    from api.reranker import ENABLED as RERANK_ENABLED, reranker
+
+    if args.vectorstores:
+        rag_loader.VECTORSTORES_PATH = Path(args.vectorstores).resolve()
+    if args.search_type:
+        rag_loader.RETRIEVER_SEARCH_TYPE = args.search_type
+    for key, value in (("k", args.k), ("fetch_k", args.fetch_k), ("lambda_mult", args.lambda_mult)):
+        if value is not None:
+            rag_loader.RETRIEVER_SEARCH_KWARGS[key] = value
+    if rag_loader.RETRIEVER_SEARCH_TYPE != "mmr":
+        # La búsqueda por similitud no acepta los parámetros de MMR
+        rag_loader.RETRIEVER_SEARCH_KWARGS = {"k": rag_loader.RETRIEVER_SEARCH_KWARGS["k"]}
+    if args.no_hybrid:
+        rag_loader.HYBRID_RETRIEVAL = False
+    if RERANK_ENABLED and not reranker.wait_until_loaded(timeout=300):
+        print(" El cross-encoder no cargó: se mide sin reranking")
+
+    with open(args.questions, encoding="utf-8") as f:
+        dataset = json.load(f)
+
+    results = {}
+    for name in args.topics or sorted(dataset):
+        topic = name if name.endswith("_vs") else f"{name}_vs"
+        # Sin chroma.sqlite3 Chroma crearía un índice vacío
+        if topic not in rag_loader.list_available_topics():
+            print(f"  (omitido {topic}: sin chroma.sqlite3 en {rag_loader.VECTORSTORES_PATH})")
+            continue
+        print(f"→ {topic}: {len(dataset[name.removesuffix('_vs')])} preguntas")
+        results[topic] = evaluate_topic(topic, dataset[name.removesuffix("_vs")], args)
+
+    if not results:
+        print("No hay vectorstores que evaluar.")
+        return
+
+    report = {
+        "meta": {
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "questions_file": Path(args.questions).name,
+            "vectorstores": str(rag_loader.VECTORSTORES_PATH),
+            "search_type": rag_loader.RETRIEVER_SEARCH_TYPE,
+            "search_kwargs": dict(rag_loader.RETRIEVER_SEARCH_KWARGS),
+            "hybrid": rag_loader.HYBRID_RETRIEVAL,
+            "rerank": RERANK_ENABLED,
+            "embedding_model": EMBEDDING_MODEL_NAME,
+            "embedding_backend": EMBEDDING_BACKEND,
+            "cached": args.cached,
+            "repeat": args.repeat,
+        },
+        "topics": results,
+        "overall": overall(results, args.cutoffs),
+    }
+
+    cols = [f"recall@{c}" for c in args.cutoffs] + ["mrr", "retrieval_p50_ms", "retrieval_p95_ms",
+                                                     "embedding_avg_ms", "avg_prompt_tokens"]
+    header = f"{'tema':<20}" + "".join(f"{c.replace('retrieval_', '').replace('avg_', ''):>16}" for c in cols)
+    print("\n" + header)
+    print("-" * len(header))
+    for topic, result in results.items():
+        print(f"{topic:<20}" + "".join(f"{str(result['summary'].get(c)):>16}" for c in cols))
+    print(f"{'total':<20}" + "".join(f"{str(report['overall'].get(c, '')):>16}" for c in cols))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nResultados guardados en {args.json}")
+    if args.compare:
+        print_comparison(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+# backend/benchmarks/vector_index_bench.py
+#
+# Compara la búsqueda vectorial de Chroma con el índice NumPy en memoria
+# (api/vector_index.py, ASSISTLEG_VECTOR_ENGINE=numpy) en cada vectorstore:
+#   - tiempo de carga del índice y memoria de la matriz,
+#   - latencia p50/p95 por consulta (similarity k y MMR k/fetch_k/lambda_mult
+#     de rag_loader) en Chroma, en NumPy exacto y en NumPy IVF,
+#   - paridad con Chroma: consultas con la misma lista (y orden) y
+#     solapamiento @k (recall del IVF).
+# Por defecto las consultas son embeddings de fragmentos al azar con ruido
+# (no hace falta cargar el modelo); con --embed se embeben preguntas reales.
+#
+# Uso (desde backend/):
+#     python benchmarks/vector_index_bench.py --queries 200
+#     python benchmarks/vector_index_bench.py --embed --ivf-nprobe 4 --json vector_index.json
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from api.vector_index import NumPyVectorIndex  # noqa: E402
+from api.vectorstore_versions import version_path  # noqa: E402
+
+QUESTIONS = [
+    "¿Cuáles son los derechos fundamentales?",
+    "¿Qué es la acción de tutela?",
+    "¿Cuál es la duración máxima de la jornada laboral?",
+    "¿Cuándo procede el despido con justa causa?",
+    "¿Cómo se liquidan las vacaciones?",
+    "¿Qué es el periodo de prueba?",
+    "¿Cuáles son las obligaciones del empleador?",
+    "¿Cuántas faltas de asistencia se permiten en un curso?",
+    "¿Cómo se cancela una asignatura?",
+    "¿Qué sanciones disciplinarias tiene un estudiante?",
+]
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def timed(fn, queries):
+    """(resultados, {p50_ms, p95_ms, mean_ms})."""
+    results, latencies = [], []
+    for vector in queries:
+        start = time.perf_counter()
+        results.append(fn(vector))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, {
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+    }
+
+
+def parity(reference, candidate, k):
+    same = sum(r == c for r, c in zip(reference, candidate))
+    overlap = sum(len(set(r) & set(c)) for r, c in zip(reference, candidate))
+    return {
+        "identical": round(same / len(reference), 3),
+        f"overlap@{k}": round(overlap / (len(reference) * k), 3),
+    }
+
+
+def make_queries(index, args, embeddings):
+    if embeddings is not None:
+        return [np.asarray(v, dtype=np.float32) for v in embeddings.embed_documents(QUESTIONS)]
+    rng = np.random.default_rng(args.seed)
+    positions = rng.choice(len(index), min(args.queries, len(index)), replace=len(index) < args.queries)
+    # Vector del fragmento (con su norma original) más ruido: ni idéntico ni lejano
+    vectors = index.matrix[positions] * index.norms[positions, None]
+    noise = rng.normal(size=vectors.shape).astype(np.float32)
+    noise *= (args.noise * np.linalg.norm(vectors, axis=1) / np.linalg.norm(noise, axis=1))[:, None]
+    return list(vectors + noise)
+
+
+def bench_topic(topic_dir, args, embeddings):
+    import chromadb
+    from langchain_community.vectorstores import Chroma
+
+    persist_dir = version_path(topic_dir)
+    client = chromadb.PersistentClient(path=str(persist_dir))
+    store = Chroma(client=client, persist_directory=str(persist_dir))
+    collection = store._collection
+    result = {"topic": topic_dir.name, "documents": collection.count()}
+    if not result["documents"]:
+        return result
+
+    start = time.perf_counter()
+    index = NumPyVectorIndex.from_collection(collection)
+    result["numpy_load_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    start = time.perf_counter()
+    ivf = NumPyVectorIndex.from_collection(collection, ann="ivf", ivf_min_docs=0,
+                                           ivf_lists=args.ivf_lists, nprobe=args.ivf_nprobe)
+    result["ivf_load_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    result["numpy"] = index.stats()
+    result["ivf"] = ivf.stats()
+
+    queries = make_queries(index, args, embeddings)
+    k, fetch_k, lambda_mult = args.k, args.fetch_k, args.lambda_mult
+    # Una consulta de calentamiento por camino (índice HNSW de Chroma, cachés de BLAS)
+    store.similarity_search_by_vector(queries[0].tolist(), k=k)
+    index.search(queries[0], k)
+
+    methods = {
+        "chroma_similarity": lambda v: [d.page_content for d in store.similarity_search_by_vector(v.tolist(), k=k)],
+        "numpy_similarity": lambda v: [index.texts[p] for p, _ in index.search(v, k)],
+        "ivf_similarity": lambda v: [ivf.texts[p] for p, _ in ivf.search(v, k)],
+        "chroma_mmr": lambda v: [d.page_content for d in store.max_marginal_relevance_search_by_vector(
+            v.tolist(), k=k, fetch_k=fetch_k, lambda_mult=lambda_mult)],
+        "numpy_mmr": lambda v: [index.texts[p] for p in index.mmr(v, k, fetch_k, lambda_mult)],
+        "ivf_mmr": lambda v: [ivf.texts[p] for p in ivf.mmr(v, k, fetch_k, lambda_mult)],
+    }
+    outputs, latency = {}, {}
+    for name, fn in methods.items():
+        outputs[name], latency[name] = timed(fn, queries)
+    result["queries"] = len(queries)
+    result["latency"] = latency
+    result["parity_vs_chroma"] = {
+        name: parity(outputs[f"chroma_{name.split('_')[1]}"], outputs[name], k)
+        for name in methods if not name.startswith("chroma_")
+    }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latencia y paridad: Chroma vs índice NumPy en memoria.")
+    parser.add_argument("--vectorstores", default=str(BACKEND_DIR / "vectorstores"),
+                        help="Directorio con los <tema>_vs")
+    parser.add_argument("--queries", type=int, default=200, help="Consultas sintéticas por tema")
+    parser.add_argument("--noise", type=float, default=0.3, help="Ruido relativo de las consultas sintéticas")
+    parser.add_argument("--embed", action="store_true", help="Embeber preguntas reales (carga el modelo)")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--fetch-k", type=int, default=20)
+    parser.add_argument("--lambda-mult", type=float, default=0.35)
+    parser.add_argument("--ivf-lists", type=int, default=0, help="Listas del IVF (0 = √n)")
+    parser.add_argument("--ivf-nprobe", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Guardar los resultados en este archivo")
+    args = parser.parse_args()
+
+    topic_dirs = [p for p in sorted(Path(args.vectorstores).glob("*_vs"))
+                  if version_path(p) is not None and (version_path(p) / "chroma.sqlite3").exists()]
+    if not topic_dirs:
+        sys.exit(f"No hay vectorstores en {args.vectorstores} (ejecuta manage.py ingest).")
+
+    embeddings = None
+    if args.embed:
+        from api.embeddings import build_embeddings
+        embeddings = build_embeddings()
+
+    results = []
+    for topic_dir in topic_dirs:
+        print(f"== {topic_dir.name}")
+        result = bench_topic(topic_dir, args, embeddings)
+        results.append(result)
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -25,7 +25,8 @@ export default function ChatUI({ topic, onBack }) {
   const topicNames = {
     constitucion_vs: "Constitución",
     codigo_trabajo_vs: "Código Sustantivo del Trabajo",
-    reglamentos_vs: "Reglamentos Universitarios"
+    reglamentos_vs: "Reglamentos Universitarios",
+    all: "Todos los temas"
   };
 
   // Scroll automático
@@ -69,17 +70,82 @@ export default function ChatUI({ topic, onBack }) {
 
     setIsTyping(true);
 
-    const response = await fetch("http://127.0.0.1:8000/api/ask/", {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ topic, question })
-    });
+    try {
+      // Respuesta en streaming (Server-Sent Events): los tokens se muestran
+      // a medida que llegan en lugar de esperar la respuesta completa
+      const response = await fetch("http://127.0.0.1:8000/api/ask/stream/", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ topic, question, session_id: currentChatId })
+      });
+
+      // Los errores (tema desconocido, JSON inválido...) llegan como JSON, no como SSE
+      const contentType = response.headers.get("content-type") || "";
+      if (!response.ok || !contentType.includes("text/event-stream")) {
+        const data = contentType.includes("application/json") ? await response.json() : {};
+        addAssistantMessage(data.error || `Error del servidor (${response.status}).`);
+        return;
+      }
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let started = false;
+
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split("\n\n");
+        buffer = events.pop();
+
+        for (const raw of events) {
+          const event = parseEvent(raw);
+          if (!event) continue;
+
+          if (event.type === "token") {
+            if (!started) {
+              started = true;
+              setIsTyping(false);
+              setMessages(prev => [...prev, { role: "assistant", text: "" }]);
+            }
+            appendToLastMessage(event.data.text);
+          } else if (event.type === "done" && !started) {
+            setIsTyping(false);
+            addAssistantMessage(event.data.answer);
+          }
+        }
+      }
+    } catch (err) {
+      // Sin conexión con el backend o conexión cortada a mitad de respuesta
+      addAssistantMessage("No se pudo conectar con el servidor. Intenta de nuevo en unos segundos.");
+    } finally {
+      setIsTyping(false);
+    }
+  }
 
-    const data = await response.json();
-    setIsTyping(false);
+  function addAssistantMessage(text) {
+    setMessages(prev => [...prev, { role: "assistant", text }]);
+  }
 
-    const botMsg = { role: "assistant", text: data.answer };
-    setMessages(prev => [...prev, botMsg]);
+  // Convierte un bloque SSE ("event: x\ndata: {...}") en { type, data }
+  function parseEvent(raw) {
+    let type = "message";
+    let data = "";
+    for (const line of raw.split("\n")) {
+      if (line.startsWith("event:")) type = line.slice(6).trim();
+      else if (line.startsWith("data:")) data += line.slice(5).trim();
+    }
+    if (!data) return null;
+    return { type, data: JSON.parse(data) };
+  }
+
+  function appendToLastMessage(text) {
+    setMessages(prev => {
+      const last = prev[prev.length - 1];
+      return [...prev.slice(0, -1), { ...last, text: last.text + text }];
+    });
   }
 
   function copyText(text) {
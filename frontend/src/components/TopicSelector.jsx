@@ -4,7 +4,8 @@ import AssistLeg from "./AssistLeg.png";
 const topics = [
   { id: "constitucion_vs", name: "Constitución" },
   { id: "codigo_trabajo_vs", name: "Código Sustantivo del Trabajo" },
-  { id: "reglamentos_vs", name: "Reglamentos Universitarios" }
+  { id: "reglamentos_vs", name: "Reglamentos Universitarios" },
+  { id: "all", name: "Todos los temas" }
 ];
 
 export default function TopicSelector({ onSelect }) {